@@ -10,11 +10,15 @@ Pulls market data from yfinance and FRED, then generates:
 Run this script before compiling handout.tex.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import requests
 import yfinance as yf
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
@@ -66,6 +70,8 @@ YIELD_SERIES = {
     "DGS20": "20Y",
     "DGS30": "30Y",
 }
+FRED_CSV_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv"
+FRED_MAX_WORKERS = 6  # FRED series downloaded at the same time
 
 
 # ---------------------------------------------------------------------------
@@ -80,13 +86,41 @@ def pull_equity_data():
     return prices
 
 
+def _fetch_fred_series(session, series_id, start, end):
+    """Download one FRED series as CSV (the file behind FRED's download button)."""
+    response = session.get(
+        FRED_CSV_URL, params={"id": series_id, "cosd": start, "coed": end}, timeout=30
+    )
+    response.raise_for_status()
+    # Name the columns here: the header of the date column has changed over time
+    table = pv.read_csv(
+        pa.py_buffer(response.content),
+        read_options=pv.ReadOptions(skip_rows=1, column_names=["DATE", series_id]),
+        convert_options=pv.ConvertOptions(
+            column_types={"DATE": pa.timestamp("ns"), series_id: pa.float64()},
+            null_values=["."],
+        ),
+    )
+    return table.to_pandas().set_index("DATE")[series_id]
+
+
+def fetch_fred(series_ids, start, end, max_workers=FRED_MAX_WORKERS):
+    """Download FRED series concurrently (at most `max_workers` at a time,
+    sharing one connection pool) and outer-join them on date."""
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+    with session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        series = list(pool.map(
+            lambda series_id: _fetch_fred_series(session, series_id, start, end), series_ids
+        ))
+    return pd.concat(series, axis=1, join="outer").sort_index()
+
+
 def pull_yield_data():
-    """Pull Treasury yield curve data from FRED via pandas_datareader."""
+    """Pull Treasury yield curve data from FRED."""
     try:
-        from pandas_datareader import data as pdr
-
         start = (TODAY - timedelta(days=400)).strftime("%Y-%m-%d")
-        df = pdr.DataReader(list(YIELD_SERIES.keys()), "fred", start, END)
+        df = fetch_fred(list(YIELD_SERIES.keys()), start, END)
         return df
     except Exception as e:
         print(f"  Warning: FRED fetch failed ({e}). Using fallback data.")
@@ -3,18 +3,34 @@ Streaming execution in Polars.
 
 Demonstrates how to process data in batches using the streaming engine
 and write results directly to disk with sink_parquet(), keeping peak
-memory usage low for large datasets.
+memory usage low for large datasets. Also shows how to run several report
+queries over the same file in one pass with pl.collect_all(), and how to
+keep sector statistics up to date incrementally as new partitions land.
+
+With --larger-than-ram, generates a dataset several times larger than a
+memory cap and runs standard vs streaming queries in subprocesses that
+are not allowed to exceed the cap.
 
 Usage:
     python 01_streaming.py
+    python 01_streaming.py --larger-than-ram [--mem-limit-mb 512] [--ratio 4]
 """
 
+import argparse
+import os
+import shutil
+import subprocess
+import sys
 import time
 from datetime import date, timedelta
 from pathlib import Path
 
 import numpy as np
 import polars as pl
+from polars.testing import assert_frame_equal
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import EXCHANGES, SECTORS, SIDES, TICKERS, QueryBatch, ticker_names  # noqa: E402
 
 
 # ---------------------------------------------------------------------------
@@ -24,8 +40,18 @@ import polars as pl
 OUTPUT_DIR = Path(__file__).parent / "output"
 PARQUET_PATH = OUTPUT_DIR / "trades.parquet"
 SINK_PATH = OUTPUT_DIR / "sector_stats.parquet"
+PARTITION_DIR = OUTPUT_DIR / "trades_by_month"
+PARTIALS_PATH = OUTPUT_DIR / "sector_partials.parquet"
 
 N_ROWS = 500_000
+N_TICKERS = 200
+
+# Larger-than-RAM benchmark (--larger-than-ram)
+BIG_DIR = OUTPUT_DIR / "larger_than_ram"
+BIG_RESULTS_PATH = OUTPUT_DIR / "larger_than_ram_results.csv"
+MEM_LIMIT_MB = 512       # hard cap for each benchmark subprocess
+DATA_TO_MEMORY = 4       # in-memory size of the dataset / memory cap
+CHUNK_ROWS = 2_000_000   # rows per generated parquet part
 
 
 # ---------------------------------------------------------------------------
@@ -36,30 +62,90 @@ def generate_trade_data(n_rows: int, seed: int = 42) -> pl.DataFrame:
     """Generate synthetic trade data (~3M rows)."""
     rng = np.random.default_rng(seed)
 
-    tickers = [f"TICK{i:03d}" for i in range(200)]
-    sectors = [
-        "Technology", "Healthcare", "Finance", "Energy", "Consumer",
-        "Industrial", "Materials", "Utilities", "RealEstate", "Telecom",
-    ]
-    exchanges = ["NYSE", "NASDAQ", "CBOE", "ARCA"]
-    sides = ["buy", "sell"]
-
     # Map tickers to sectors deterministically
-    ticker_sector = {t: sectors[i % len(sectors)] for i, t in enumerate(tickers)}
+    tickers = ticker_names(N_TICKERS)
+    ticker_sector = {t: SECTORS[i % len(SECTORS)] for i, t in enumerate(tickers)}
 
     chosen_tickers = rng.choice(tickers, n_rows)
 
-    return pl.DataFrame({
+    df = pl.DataFrame({
         "trade_id": list(range(n_rows)),
         "date": [date(2020, 1, 2) + timedelta(days=int(d))
                  for d in rng.integers(0, 1500, n_rows)],
         "ticker": chosen_tickers.tolist(),
         "sector": [ticker_sector[t] for t in chosen_tickers],
-        "exchange": rng.choice(exchanges, n_rows).tolist(),
-        "side": rng.choice(sides, n_rows).tolist(),
+        "exchange": rng.choice(EXCHANGES, n_rows).tolist(),
+        "side": rng.choice(SIDES, n_rows).tolist(),
         "price": rng.uniform(5, 500, n_rows).round(2).tolist(),
         "quantity": rng.lognormal(mean=6, sigma=1.5, size=n_rows).astype(int).tolist(),
     })
+    return normalize_schema(df)
+
+
+def normalize_schema(df: pl.DataFrame) -> pl.DataFrame:
+    """Cast low-cardinality string columns to Enums with the categories in
+    common.py."""
+    enums = {
+        "ticker": pl.Enum(TICKERS),
+        "sector": pl.Enum(SECTORS),
+        "exchange": pl.Enum(EXCHANGES),
+        "side": pl.Enum(SIDES),
+    }
+    return df.cast({col: dtype for col, dtype in enums.items() if col in df.columns})
+
+
+def generate_trade_chunk(n_rows: int, first_id: int, seed: int) -> pl.DataFrame:
+    """Vectorized version of generate_trade_data for large datasets.
+
+    Categorical columns are built by gathering from an Enum series, so no
+    Python strings are created per row.
+    """
+    rng = np.random.default_rng(seed)
+
+    def pick(categories, idx):
+        return pl.Series(categories, dtype=pl.Enum(categories)).gather(idx)
+
+    # The tickers are the first N_TICKERS of TICKERS, so their indices are
+    # also their codes in the TICKERS Enum
+    ticker_idx = rng.integers(0, len(ticker_names(N_TICKERS)), n_rows)
+    return pl.DataFrame({
+        "trade_id": np.arange(first_id, first_id + n_rows),
+        "date": pl.Series(np.datetime64("2020-01-02") + rng.integers(0, 1500, n_rows)).cast(pl.Date),
+        "ticker": pick(TICKERS, ticker_idx),
+        "sector": pick(SECTORS, ticker_idx % len(SECTORS)),
+        "exchange": pick(EXCHANGES, rng.integers(0, len(EXCHANGES), n_rows)),
+        "side": pick(SIDES, rng.integers(0, len(SIDES), n_rows)),
+        "price": rng.uniform(5, 500, n_rows).round(2),
+        "quantity": rng.lognormal(mean=6, sigma=1.5, size=n_rows).astype(np.int64),
+    })
+
+
+def write_larger_than_ram_data(mem_limit_mb: int, ratio: float) -> int:
+    """Write a parquet dataset whose in-memory size is `ratio` x the cap.
+
+    Parts are generated and written one at a time, so this never holds more
+    than CHUNK_ROWS rows. An existing dataset of the same size is reused.
+    Returns the number of rows.
+    """
+    bytes_per_row = generate_trade_chunk(10_000, 0, 0).estimated_size() / 10_000
+    n_rows = int(ratio * mem_limit_mb * 2**20 / bytes_per_row)
+
+    if BIG_DIR.exists():
+        existing = pl.scan_parquet(BIG_DIR / "*.parquet").select(pl.len()).collect().item()
+        if existing == n_rows:
+            print(f"  Using existing {BIG_DIR} ({existing:,} rows)")
+            return existing
+        for part in BIG_DIR.glob("*.parquet"):
+            part.unlink()
+
+    BIG_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"  Generating {n_rows:,} rows (~{n_rows * bytes_per_row / 2**20:,.0f} MB in memory) ...")
+    for i, first_id in enumerate(range(0, n_rows, CHUNK_ROWS)):
+        chunk = generate_trade_chunk(min(CHUNK_ROWS, n_rows - first_id), first_id, seed=i)
+        chunk.write_parquet(BIG_DIR / f"part-{i:04d}.parquet")
+    size_mb = sum(p.stat().st_size for p in BIG_DIR.glob("*.parquet")) / 2**20
+    print(f"  Written to {BIG_DIR} ({size_mb:,.0f} MB on disk)")
+    return n_rows
 
 
 # ---------------------------------------------------------------------------
@@ -77,10 +163,267 @@ def sub(label: str):
 
 
 # ---------------------------------------------------------------------------
-# Main
+# Incremental sector aggregates
+# ---------------------------------------------------------------------------
+
+def write_month_partitions(df: pl.DataFrame, months: list[str]):
+    """Write the trades of `months` to PARTITION_DIR/month=YYYY-MM/data.parquet."""
+    df = df.with_columns(pl.col("date").dt.strftime("%Y-%m").alias("month"))
+    parts = df.filter(pl.col("month").is_in(months)).partition_by("month", as_dict=True)
+    for (month,), part in parts.items():
+        path = PARTITION_DIR / f"month={month}" / "data.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part.drop("month").write_parquet(path)
+
+
+def sector_partials(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Mergeable per-sector partial aggregates of one partition.
+
+    Counts, sums, mins and maxes combine across partitions directly. The
+    price std is kept as (n, mean, M2), M2 being the sum of squared
+    deviations from the partition mean, which merge_partials combines
+    without the cancellation of a sum-of-squares formula.
+    """
+    return lf.group_by("sector").agg(
+        pl.len().alias("n"),
+        pl.col("price").mean().alias("price_mean"),
+        (pl.col("price").var(ddof=0) * pl.len()).alias("price_m2"),
+        pl.col("price").min().alias("price_min"),
+        pl.col("price").max().alias("price_max"),
+        pl.col("quantity").sum().alias("qty_sum"),
+    )
+
+
+def merge_partials(partials: pl.DataFrame) -> pl.DataFrame:
+    """Combine partials of any number of partitions into sector stats.
+
+    Means and M2s are merged with Chan et al.'s parallel formula: the M2
+    of the union is the sum of the partition M2s plus n_i * (mean_i -
+    mean)^2 for each partition.
+    """
+    n, price_mean = pl.col("n"), pl.col("price_mean")
+    mean = (n * price_mean).sum() / n.sum()
+    return (
+        partials.group_by("sector")
+        .agg(
+            pl.col("n", "qty_sum").sum(),
+            mean.alias("price_mean"),
+            (pl.col("price_m2") + n * (price_mean - mean) ** 2).sum().alias("price_m2"),
+            pl.col("price_min").min(),
+            pl.col("price_max").max(),
+        )
+        .select(
+            "sector",
+            price_mean.alias("avg_price"),
+            (pl.col("price_m2") / (n - 1)).sqrt().alias("std_price"),
+            pl.col("price_min").alias("min_price"),
+            pl.col("price_max").alias("max_price"),
+            pl.col("qty_sum").alias("total_qty"),
+            (pl.col("qty_sum") / n).alias("avg_qty"),
+            n.alias("num_trades"),
+        )
+        .sort("sector")
+    )
+
+
+def recompute_sector_stats() -> pl.DataFrame:
+    """Compute the sector stats from scratch over every partition.
+
+    Uses the ordinary aggregations, so it is an independent check of the
+    incrementally maintained result.
+    """
+    return (
+        pl.scan_parquet(PARTITION_DIR / "*" / "*.parquet")
+        .group_by("sector")
+        .agg(
+            pl.col("price").mean().alias("avg_price"),
+            pl.col("price").std().alias("std_price"),
+            pl.col("price").min().alias("min_price"),
+            pl.col("price").max().alias("max_price"),
+            pl.col("quantity").sum().alias("total_qty"),
+            pl.col("quantity").mean().alias("avg_qty"),
+            pl.len().alias("num_trades"),
+        )
+        .sort("sector")
+        .collect()
+    )
+
+
+def partition_partials(lf: pl.LazyFrame, partition: str, mtime_ns: int) -> pl.LazyFrame:
+    """sector_partials of one partition, tagged with its name and mtime."""
+    return sector_partials(lf).with_columns(
+        pl.lit(partition).alias("partition"), pl.lit(mtime_ns, dtype=pl.Int64).alias("mtime_ns"),
+    )
+
+
+def update_sector_stats() -> tuple[pl.DataFrame, list[str]]:
+    """Fold new or changed partitions into the stored partials.
+
+    PARTIALS_PATH keeps one row per (partition, sector) together with the
+    modification time of the partition file. Only partitions that are not
+    stored yet, or whose file changed since, are scanned. The merged stats
+    are written to SINK_PATH (empty if there are no partitions). Returns
+    the stats and the partitions scanned.
+    """
+    files = {path.parent.name: path for path in sorted(PARTITION_DIR.glob("*/*.parquet"))}
+    stamps = pl.DataFrame(
+        {"partition": list(files), "mtime_ns": [p.stat().st_mtime_ns for p in files.values()]},
+        schema={"partition": pl.String, "mtime_ns": pl.Int64},
+    )
+
+    stored = pl.read_parquet(PARTIALS_PATH) if PARTIALS_PATH.exists() else None
+    if stored is not None:
+        # Drop partials of partitions that were removed or rewritten
+        stored = stored.join(stamps, on=["partition", "mtime_ns"], how="semi")
+        stamps = stamps.join(stored, on="partition", how="anti")
+
+    batch = QueryBatch()
+    for name, mtime_ns in stamps.iter_rows():
+        batch.add(name, partition_partials(pl.scan_parquet(files[name]), name, mtime_ns))
+    parts = ([stored] if stored is not None else []) + list(batch.collect().values())
+    if not parts:
+        # No partitions and nothing stored: the partials of an empty frame
+        empty = generate_trade_chunk(0, first_id=0, seed=0).lazy()
+        parts = [partition_partials(empty, "", 0).collect()]
+    partials = pl.concat(parts)
+
+    for df, path in [(partials, PARTIALS_PATH), (merge_partials(partials), SINK_PATH)]:
+        # Write next to the target and rename, so readers never see a partial file
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        df.write_parquet(tmp_path)
+        os.replace(tmp_path, path)
+    return pl.read_parquet(SINK_PATH), stamps["partition"].to_list()
+
+
+# ---------------------------------------------------------------------------
+# Larger-than-RAM benchmark
 # ---------------------------------------------------------------------------
 
+# Each query reads the whole dataset. The group_by on a few keys keeps tiny
+# state; the per-day group_by (millions of groups) and the full sort need
+# state on the order of the input, so they only finish under the cap if the
+# engine can keep less than that in memory.
+BIG_QUERIES = {
+    "group_by_sector": lambda lf: (
+        lf.group_by("sector")
+        .agg(pl.col("price").mean().alias("avg_price"), pl.col("quantity").sum().alias("total_qty"))
+    ),
+    "group_by_ticker_day": lambda lf: (
+        lf.group_by("date", "ticker", "exchange", "side")
+        .agg(pl.col("quantity").sum().alias("total_qty"), pl.len().alias("num_trades"))
+    ),
+    "sort_all": lambda lf: lf.sort("ticker", "date", "price"),
+}
+ENGINES = ["in-memory", "streaming"]
+
+
+def run_worker(query_name: str, engine: str):
+    """Run one benchmark query (called in the memory-limited subprocess).
+
+    The standard engine collects the result and then writes it; the
+    streaming engine sinks it to disk in batches. Prints the elapsed time.
+    """
+    query = BIG_QUERIES[query_name](pl.scan_parquet(BIG_DIR / "*.parquet"))
+    out_path = OUTPUT_DIR / f"larger_than_ram_{query_name}_{engine}.parquet"
+
+    start = time.perf_counter()
+    if engine == "streaming":
+        query.sink_parquet(out_path)
+    else:
+        query.collect(engine=engine).write_parquet(out_path)
+    elapsed = time.perf_counter() - start
+
+    out_path.unlink()
+    print(elapsed)
+
+
+def run_limited(query_name: str, engine: str, mem_limit_mb: int) -> dict:
+    """Run a query in a subprocess whose heap is capped at `mem_limit_mb`.
+
+    RLIMIT_DATA caps the heap (malloc/anonymous mmap, not the parquet file
+    pages), so an allocation past the cap fails and the process dies rather
+    than swapping. Peak RSS comes from wait4(), which reports it even for a
+    child that was killed. macOS does not enforce RLIMIT_DATA.
+    """
+    import resource
+
+    limit = mem_limit_mb * 2**20
+
+    def set_limit():
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, __file__, "--worker", query_name, engine],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        preexec_fn=set_limit,
+    )
+    output = proc.stdout.read()
+    # Reap the child ourselves: wait4 returns its own resource usage
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    proc.stdout.close()
+
+    lines = output.strip().splitlines() or [f"exit code {proc.returncode}"]
+    completed = proc.returncode == 0
+    # Report the failed allocation rather than the backtrace that follows it
+    messages = [line for line in lines if "memory" in line.lower()] or lines
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak_rss_mb = usage.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+    return {
+        "query": query_name,
+        "engine": engine,
+        "completed": completed,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "seconds": round(float(lines[-1]) if completed else wall, 3),
+        "error": "" if completed else messages[0][:80],
+    }
+
+
+def larger_than_ram_benchmark(mem_limit_mb: int = MEM_LIMIT_MB, ratio: float = DATA_TO_MEMORY):
+    """Run every BIG_QUERIES query with each engine under a memory cap."""
+    section(f"Larger-than-RAM benchmark: {ratio:g}x data vs {mem_limit_mb} MB cap")
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    write_larger_than_ram_data(mem_limit_mb, ratio)
+
+    rows = []
+    for query_name in BIG_QUERIES:
+        for engine in ENGINES:
+            sub(f"{query_name} / {engine}")
+            row = run_limited(query_name, engine, mem_limit_mb)
+            status = "completed" if row["completed"] else f"FAILED ({row['error']})"
+            print(f"  {status}  peak RSS {row['peak_rss_mb']:,.0f} MB  {row['seconds']:.2f}s")
+            rows.append(row)
+
+    results = pl.DataFrame(rows)
+    results.write_csv(BIG_RESULTS_PATH)
+    sub(f"Summary (written to {BIG_RESULTS_PATH.name})")
+    print(results.select("query", "engine", "completed", "peak_rss_mb", "seconds"))
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--larger-than-ram", action="store_true",
+                        help="run the memory-capped standard vs streaming benchmark")
+    parser.add_argument("--mem-limit-mb", type=int, default=MEM_LIMIT_MB,
+                        help="memory cap for each benchmark subprocess")
+    parser.add_argument("--ratio", type=float, default=DATA_TO_MEMORY,
+                        help="in-memory data size as a multiple of the cap")
+    parser.add_argument("--worker", nargs=2, metavar=("QUERY", "ENGINE"),
+                        help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.worker:
+        run_worker(*args.worker)
+        sys.exit()
+    if args.larger_than_ram:
+        larger_than_ram_benchmark(args.mem_limit_mb, args.ratio)
+        sys.exit()
 
     # -- Generate data ---------------------------------------------------------
     section("Setup: Generating trade data")
@@ -177,9 +520,96 @@ if __name__ == "__main__":
     print(pl.read_parquet(SINK_PATH))
 
     # ======================================================================
-    # 4. When to use streaming
+    # 4. Batched report: several queries, one scan
+    # ======================================================================
+    section("4. Batched Report: pl.collect_all()")
+    print("  A daily report needs several independent summaries of the same")
+    print("  file. Collecting them one by one rescans the file each time.")
+
+    lf = pl.scan_parquet(PARQUET_PATH)
+    report = {
+        "by_sector": (
+            lf.group_by("sector")
+            .agg(pl.col("price").mean().alias("avg_price"), pl.len().alias("num_trades"))
+            .sort("sector")
+        ),
+        "by_exchange_side": (
+            lf.group_by("exchange", "side")
+            .agg(pl.col("quantity").sum().alias("total_qty"))
+            .sort("exchange", "side")
+        ),
+        "top_tickers": (
+            lf.group_by("ticker")
+            .agg(pl.col("quantity").sum().alias("total_qty"))
+            .sort("total_qty", descending=True)
+            .head(5)
+        ),
+    }
+
+    sub("Sequential: one .collect() per query")
+    start = time.perf_counter()
+    sequential = {name: q.collect() for name, q in report.items()}
+    sequential_time = time.perf_counter() - start
+    print(f"  Time: {sequential_time:.4f}s")
+
+    sub("Batched: QueryBatch → pl.collect_all()")
+    batch = QueryBatch()
+    for name, q in report.items():
+        batch.add(name, q)
+    start = time.perf_counter()
+    batched = batch.collect()
+    batched_time = time.perf_counter() - start
+    print(f"  Time: {batched_time:.4f}s  ({sequential_time / batched_time:.1f}x faster)")
+
+    for name in report:
+        # Float aggregates may differ in the last bits (parallel summation order)
+        assert_frame_equal(batched[name], sequential[name])
+    print(f"\n  Batched results match the sequential ones ({len(batched)} queries)")
+    print(batched["top_tickers"])
+
+    # ======================================================================
+    # 5. Incremental aggregates: only scan the partitions that are new
+    # ======================================================================
+    section("5. Incremental Sector Aggregates")
+    print("  New trades arrive as monthly partitions. Instead of recomputing")
+    print("  sector_stats from every file, keep mergeable partials per")
+    print("  partition (count, mean, M2, min/max, sum) and fold new")
+    print("  partitions in as they land.")
+
+    trades = pl.read_parquet(PARQUET_PATH)
+    months = sorted(trades["date"].dt.strftime("%Y-%m").unique())
+    shutil.rmtree(PARTITION_DIR, ignore_errors=True)
+    PARTIALS_PATH.unlink(missing_ok=True)
+
+    sub(f"Initial load: {len(months) - 3} monthly partitions")
+    write_month_partitions(trades, months[:-3])
+    stats, scanned = update_sector_stats()
+    print(f"  Scanned {len(scanned)} partitions")
+
+    for month in months[-3:]:
+        sub(f"New partition lands: month={month}")
+        write_month_partitions(trades, [month])
+
+        start = time.perf_counter()
+        stats, scanned = update_sector_stats()
+        incremental_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = recompute_sector_stats()
+        full_time = time.perf_counter() - start
+
+        # The merged mean and std differ from .mean()/.std() in the last bits only
+        assert_frame_equal(stats, full)
+        print(f"  Incremental: scanned {scanned}  {incremental_time:.4f}s")
+        print(f"  Full recompute over {len(months[:months.index(month) + 1])} partitions: {full_time:.4f}s")
+        print("  Results match the full recompute")
+
+    print(stats)
+
+    # ======================================================================
+    # 6. When to use streaming
     # ======================================================================
-    section("4. When to Use Streaming")
+    section("6. When to Use Streaming")
     print(
         "  Use streaming when:\n"
         "  - Your dataset is larger than available RAM\n"
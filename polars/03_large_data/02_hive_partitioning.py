@@ -10,6 +10,7 @@ Usage:
 """
 
 import shutil
+import sys
 import time
 from datetime import date, timedelta
 from pathlib import Path
@@ -17,6 +18,9 @@ from pathlib import Path
 import numpy as np
 import polars as pl
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import EXCHANGES, SECTORS, TICKERS, ticker_names  # noqa: E402
+
 
 # ---------------------------------------------------------------------------
 # Config
@@ -26,6 +30,7 @@ OUTPUT_DIR = Path(__file__).parent / "output"
 HIVE_DIR = OUTPUT_DIR / "trades_hive"
 
 N_ROWS = 500_000
+N_TICKERS = 200
 
 
 # ---------------------------------------------------------------------------
@@ -36,26 +41,32 @@ def generate_trade_data(n_rows: int, seed: int = 42) -> pl.DataFrame:
     """Generate synthetic trade data for Hive partitioning demo."""
     rng = np.random.default_rng(seed)
 
-    tickers = [f"TICK{i:03d}" for i in range(200)]
-    sectors = [
-        "Technology", "Healthcare", "Finance", "Energy", "Consumer",
-        "Industrial", "Materials", "Utilities", "RealEstate", "Telecom",
-    ]
-    exchanges = ["NYSE", "NASDAQ", "CBOE", "ARCA"]
-
-    ticker_sector = {t: sectors[i % len(sectors)] for i, t in enumerate(tickers)}
+    tickers = ticker_names(N_TICKERS)
+    ticker_sector = {t: SECTORS[i % len(SECTORS)] for i, t in enumerate(tickers)}
     chosen_tickers = rng.choice(tickers, n_rows)
 
-    return pl.DataFrame({
+    df = pl.DataFrame({
         "trade_id": list(range(n_rows)),
         "date": [date(2020, 1, 2) + timedelta(days=int(d))
                  for d in rng.integers(0, 1500, n_rows)],
         "ticker": chosen_tickers.tolist(),
         "sector": [ticker_sector[t] for t in chosen_tickers],
-        "exchange": rng.choice(exchanges, n_rows).tolist(),
+        "exchange": rng.choice(EXCHANGES, n_rows).tolist(),
         "price": rng.uniform(5, 500, n_rows).round(2).tolist(),
         "quantity": rng.lognormal(mean=6, sigma=1.5, size=n_rows).astype(int).tolist(),
     })
+    return normalize_schema(df)
+
+
+def normalize_schema(df: pl.DataFrame) -> pl.DataFrame:
+    """Cast low-cardinality string columns to Enums with the categories in
+    common.py."""
+    enums = {
+        "ticker": pl.Enum(TICKERS),
+        "sector": pl.Enum(SECTORS),
+        "exchange": pl.Enum(EXCHANGES),
+    }
+    return df.cast({col: dtype for col, dtype in enums.items() if col in df.columns})
 
 
 # ---------------------------------------------------------------------------
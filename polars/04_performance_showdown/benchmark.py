@@ -3,7 +3,9 @@ Performance showdown: pandas vs polars on realistic financial tasks.
 
 Generates a synthetic dataset (~1M rows of daily stock returns) and
 benchmarks five common operations: filter+aggregate, rolling window,
-multi-key join, a complex analytical pipeline, and memory usage.
+multi-key join, a complex analytical pipeline, and memory usage. A final
+section compares plain string columns against categorical encodings
+(pandas ``category`` / polars ``Enum``).
 
 Usage:
     python benchmark.py
@@ -12,11 +14,15 @@ Usage:
 import sys
 import time
 from datetime import date, timedelta
+from pathlib import Path
 
 import numpy as np
 import pandas as pd
 import polars as pl
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import EXCHANGES, SECTORS, TICKERS, ticker_names  # noqa: E402
+
 
 # ---------------------------------------------------------------------------
 # Config — adjust these to change dataset size
@@ -27,6 +33,9 @@ N_DAYS = 10_000  # ~1M rows
 SEED = 42
 N_RUNS = 3  # median of N_RUNS for each benchmark
 
+# Category dictionaries of the low-cardinality columns (see common.py)
+CATEGORIES = {"ticker": TICKERS, "sector": SECTORS, "exchange": EXCHANGES}
+
 
 # ---------------------------------------------------------------------------
 # Data generation
@@ -36,16 +45,11 @@ def generate_data(n_tickers: int, n_days: int, seed: int = 42):
     """Generate synthetic stock data in both pandas and polars."""
     rng = np.random.default_rng(seed)
 
-    tickers = [f"TICK{i:03d}" for i in range(n_tickers)]
-    sectors = [
-        "Technology", "Healthcare", "Finance", "Energy", "Consumer",
-        "Industrial", "Materials", "Utilities", "RealEstate", "Telecom", "Other",
-    ]
-    exchanges = ["NYSE", "NASDAQ", "CBOE", "ARCA"]
+    tickers = ticker_names(n_tickers)
 
     # Deterministic sector/exchange assignment per ticker
-    ticker_sector = {t: sectors[i % len(sectors)] for i, t in enumerate(tickers)}
-    ticker_exchange = {t: exchanges[i % len(exchanges)] for i, t in enumerate(tickers)}
+    ticker_sector = {t: SECTORS[i % len(SECTORS)] for i, t in enumerate(tickers)}
+    ticker_exchange = {t: EXCHANGES[i % len(EXCHANGES)] for i, t in enumerate(tickers)}
 
     n_rows = n_tickers * n_days
     print(f"  Generating {n_rows:,} rows ({n_tickers} tickers × {n_days} days) ...")
@@ -84,6 +88,27 @@ def generate_data(n_tickers: int, n_days: int, seed: int = 42):
     return pdf, plf, ref_pd, ref_pl
 
 
+# ---------------------------------------------------------------------------
+# Schema normalization
+# ---------------------------------------------------------------------------
+
+def normalize_schema(pdf, plf, categories: dict[str, list[str]] = CATEGORIES):
+    """Encode low-cardinality string columns as pandas category / polars Enum.
+
+    Columns missing from a frame are skipped, so the same dictionaries can
+    be applied to the main table and the reference table alike.
+    """
+    pdf = pdf.astype({
+        col: pd.CategoricalDtype(cats)
+        for col, cats in categories.items() if col in pdf.columns
+    })
+    plf = plf.cast({
+        col: pl.Enum(cats)
+        for col, cats in categories.items() if col in plf.columns
+    })
+    return pdf, plf
+
+
 # ---------------------------------------------------------------------------
 # Timing helper
 # ---------------------------------------------------------------------------
@@ -280,6 +305,40 @@ def task_memory(pdf, plf):
     return pd_mem, pl_mem
 
 
+def task_categorical(pdf, plf, ref_pd, ref_pl):
+    """String columns vs categorical encoding: memory, group-by and join."""
+    pdf_cat, plf_cat = normalize_schema(pdf, plf)
+    ref_pd_cat, ref_pl_cat = normalize_schema(ref_pd, ref_pl)
+
+    def pandas_group_by(df):
+        return df.groupby(["sector", "exchange"], observed=True)["volume"].sum()
+
+    def polars_group_by(df):
+        return df.group_by("sector", "exchange").agg(pl.col("volume").sum())
+
+    def pandas_join(df, ref):
+        return df.merge(ref, on="ticker", suffixes=("", "_ref"))
+
+    def polars_join(df, ref):
+        return df.join(ref, on="ticker", suffix="_ref")
+
+    pd_mem, pl_mem = task_memory(pdf, plf)
+    pd_mem_cat, pl_mem_cat = task_memory(pdf_cat, plf_cat)
+
+    return [
+        ("pandas memory (MB)", pd_mem, pd_mem_cat),
+        ("polars memory (MB)", pl_mem, pl_mem_cat),
+        ("pandas group_by (s)",
+         bench(lambda: pandas_group_by(pdf)), bench(lambda: pandas_group_by(pdf_cat))),
+        ("polars group_by (s)",
+         bench(lambda: polars_group_by(plf)), bench(lambda: polars_group_by(plf_cat))),
+        ("pandas join (s)",
+         bench(lambda: pandas_join(pdf, ref_pd)), bench(lambda: pandas_join(pdf_cat, ref_pd_cat))),
+        ("polars join (s)",
+         bench(lambda: polars_join(plf, ref_pl)), bench(lambda: polars_join(plf_cat, ref_pl_cat))),
+    ]
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
@@ -314,6 +373,9 @@ if __name__ == "__main__":
 
     pd_mem, pl_mem = task_memory(pdf, plf)
 
+    print("  Running: Categorical encoding ...")
+    categorical_results = task_categorical(pdf, plf, ref_pd, ref_pl)
+
     # -- Print results ---------------------------------------------------------
     print()
     print("=" * 75)
@@ -327,6 +389,15 @@ if __name__ == "__main__":
     print(f"  {'Memory (MB)':<25} {pd_mem:>12.1f} {pl_mem:>12.1f} {'---':>12} {pd_mem / pl_mem:>9.1f}x")
     print("=" * 75)
     print()
+    print("  Categorical encoding: ticker / sector / exchange as category / Enum")
+    print("-" * 75)
+    print(f"  {'Metric':<25} {'string':>12} {'encoded':>12} {'ratio':>12}")
+    print("-" * 75)
+    for name, before, after in categorical_results:
+        ratio = before / after if after > 0 else float("inf")
+        print(f"  {name:<25} {before:>12.4f} {after:>12.4f} {ratio:>11.1f}x")
+    print("=" * 75)
+    print()
     print("  Note: Results vary by system. Adjust N_TICKERS and N_DAYS at the")
     print("  top of the script to change the dataset size.")
     print(f"\n  Python {sys.version.split()[0]}  |  pandas {pd.__version__}  |  polars {pl.__version__}")
@@ -0,0 +1,64 @@
+"""
+Category dictionaries and helpers shared by the example scripts.
+
+The scripts import this module by putting the polars/ directory on
+sys.path, so each of them still runs on its own with `python <script>.py`.
+"""
+
+import polars as pl
+
+
+# ---------------------------------------------------------------------------
+# Stable global dictionaries
+# ---------------------------------------------------------------------------
+
+# Categories of the low-cardinality columns of the synthetic data. Frames
+# encoded with the same Enum (or pandas category) categories share
+# physical codes, so joins and group-bys on these columns compare integers
+# instead of strings, also across files and scripts.
+MAX_TICKERS = 1_000
+TICKERS = [f"TICK{i:03d}" for i in range(MAX_TICKERS)]
+SECTORS = [
+    "Technology", "Healthcare", "Finance", "Energy", "Consumer",
+    "Industrial", "Materials", "Utilities", "RealEstate", "Telecom",
+]
+EXCHANGES = ["NYSE", "NASDAQ", "CBOE", "ARCA"]
+SIDES = ["buy", "sell"]
+
+
+def ticker_names(n: int) -> list[str]:
+    """The first `n` tickers of TICKERS.
+
+    Raises if TICKERS has fewer than `n`, rather than letting the cast to
+    the TICKERS Enum fail on the names it is missing.
+    """
+    if n > len(TICKERS):
+        raise ValueError(f"{n:,} tickers requested, but TICKERS has {len(TICKERS):,}; raise MAX_TICKERS")
+    return TICKERS[:n]
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+class QueryBatch:
+    """Register several LazyFrames and collect them together.
+
+    pl.collect_all() optimizes the queries as one plan, so subplans they
+    have in common (e.g. the same scan_parquet source) run only once
+    instead of once per query.
+    """
+
+    def __init__(self):
+        self._queries: dict[str, pl.LazyFrame] = {}
+
+    def add(self, name: str, query: pl.LazyFrame) -> "QueryBatch":
+        if name in self._queries:
+            raise ValueError(f"Query {name!r} is already registered")
+        self._queries[name] = query
+        return self
+
+    def collect(self, **kwargs) -> dict[str, pl.DataFrame]:
+        """Run all registered queries at once; results are keyed by name."""
+        results = pl.collect_all(list(self._queries.values()), **kwargs)
+        return dict(zip(self._queries, results))
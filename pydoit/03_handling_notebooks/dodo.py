@@ -11,45 +11,139 @@ import sys
 
 sys.path.insert(1, "./src/")
 
+import hashlib
+import json
 import shutil
-from os import environ, getcwd, path
+from doit.tools import config_changed
+from os import cpu_count, environ, getcwd, path
 from pathlib import Path
-from settings import config
+from plotly.offline import get_plotlyjs_version
+from build_cache import cached
+from parquet_checker import ParquetChecker
+from settings import config, create_dirs
+from task_actions import ResourceActions
+from task_telemetry import TelemetryReporter
 
 BASE_DIR = config("BASE_DIR")
 DATA_DIR = config("DATA_DIR")
 OUTPUT_DIR = config("OUTPUT_DIR")
+## The plotly.js that ./src/chart_export.py writes once for all charts in
+## OUTPUT_DIR. Tasks that write charts cache it as one of their outputs.
+PLOTLYJS = Path(OUTPUT_DIR) / f"plotly-{get_plotlyjs_version()}.min.js"
+DOIT_NUM_PROCESS = config("DOIT_NUM_PROCESS", default=4, cast=int)
+## The data pulls run as Python actions, importing the pull modules in the doit
+## process instead of starting `ipython` for each script. Set
+## PULL_IN_SUBPROCESS=true to run each script in its own process instead, e.g.
+## to debug one of them in isolation.
+PULL_IN_SUBPROCESS = config("PULL_IN_SUBPROCESS", default=False, cast=bool)
+
+## Run independent tasks in parallel (see RESOURCE_LIMITS below), check
+## parquet file_deps by their footer instead of hashing them (see
+## ./src/parquet_checker.py), and record the wall time, CPU time and memory of
+## every task (see ./src/task_telemetry.py)
+DOIT_CONFIG = {
+    "reporter": TelemetryReporter,
+    "num_process": DOIT_NUM_PROCESS,
+    "par_type": "process",
+    "check_file_uptodate": ParquetChecker,
+}
 
 ## Helpers for handling Jupyter Notebook tasks
-# fmt: off
-## Helper functions for automatic execution of Jupyter notebooks
 environ["PYDEVD_DISABLE_FILE_VALIDATION"] = "1"
-def jupyter_execute_notebook(notebook):
-    return f"jupyter nbconvert --execute --to notebook --ClearMetadataPreprocessor.enabled=True --log-level WARN --inplace ./src/{notebook}.ipynb"
-def jupyter_to_html(notebook, output_dir=OUTPUT_DIR):
-    return f"jupyter nbconvert --to html --log-level WARN --output-dir={output_dir} ./src/{notebook}.ipynb"
-def jupyter_to_md(notebook, output_dir=OUTPUT_DIR):
-    """Requires jupytext"""
-    return f"jupytext --to markdown --log-level WARN --output-dir={output_dir} ./src/{notebook}.ipynb"
-def jupyter_to_python(notebook, build_dir):
-    """Convert a notebook to a python script"""
-    return f"jupyter nbconvert --log-level WARN --to python ./src/{notebook}.ipynb --output _{notebook}.py --output-dir {build_dir}"
-def jupyter_clear_output(notebook):
-    return f"jupyter nbconvert --log-level WARN --ClearOutputPreprocessor.enabled=True --ClearMetadataPreprocessor.enabled=True --inplace ./src/{notebook}.ipynb"
-# fmt: on
 
 
 def copy_file(origin_path, destination_path, mkdir=True):
-    """Create a Python action for copying a file."""
+    """Copy a file. Use it as the action ``(copy_file, [origin, destination])``."""
+    origin = Path(origin_path)
+    dest = Path(destination_path)
+    if mkdir:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(origin, dest)
+
+
+def remove_files(*paths):
+    """Remove those of `paths` that exist. Use it as a `clean` action."""
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+
+
+def run_notebook(notebook_path, output_dir=OUTPUT_DIR):
+    """Execute a notebook in a warm kernel and export it to HTML, all
+    in-process (see ./src/notebook_runner.py). Use it as the action
+    ``(run_notebook, [notebook_path])``."""
+    import notebook_runner
+
+    notebook_runner.run_notebook(notebook_path, output_dir)
+
+
+## Data pulls, run in the doit process (see PULL_IN_SUBPROCESS)
+def pull_fred_data():
+    """Update fred.parquet and fred.csv with FRED up to today, fetching only
+    recent observations if they exist (see update_fred in pull_fred.py)."""
+    import pull_fred
+
+    pull_fred.update_fred(DATA_DIR)
+
+
+def pull_ofr_data():
+    """Pull the OFR short-term funding series and write
+    ofr_public_repo_data.parquet."""
+    import pull_ofr_api_data
+
+    df = pull_ofr_api_data.pull_series_list(list(pull_ofr_api_data.series_descriptions))
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(DATA_DIR / "ofr_public_repo_data.parquet")
+
 
-    def _copy_file():
-        origin = Path(origin_path)
-        dest = Path(destination_path)
-        if mkdir:
-            dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(origin, dest)
+def pull_ken_french_portfolios():
+    """Pull the 5x5 OP/INV portfolios and write
+    25_Portfolios_OP_INV_5x5_daily.parquet."""
+    import pull_ken_french_data
 
-    return _copy_file
+    data = pull_ken_french_data.pull_ken_french_data()
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    data[0].to_parquet(DATA_DIR / "25_Portfolios_OP_INV_5x5_daily.parquet")
+
+
+def pull_actions(*pulls):
+    """The actions that run `pulls` (functions above), or the matching
+    `ipython ./src/<module>.py` commands if PULL_IN_SUBPROCESS is set."""
+    if not PULL_IN_SUBPROCESS:
+        return list(pulls)
+    scripts = {
+        pull_fred_data: "pull_fred",
+        pull_ofr_data: "pull_ofr_api_data",
+        pull_ken_french_portfolios: "pull_ken_french_data",
+    }
+    return ["ipython ./src/settings.py"] + [
+        f"ipython ./src/{scripts[pull]}.py" for pull in pulls
+    ]
+
+
+## Resource classes for parallel runs
+# `doit -n 4` runs up to 4 tasks at once (DOIT_CONFIG sets the default, and
+# `doit -n 1` runs serially). Tasks are tagged with the resources they use
+# through `with_resources`; at most RESOURCE_LIMITS[tag] tasks holding a tag
+# run at the same time, across all worker processes. Slots are lock files in
+# OUTPUT_DIR/.locks, so a slot is released even if its worker dies.
+#
+# Worker processes get the tasks pickled, so actions are command strings or
+# module-level functions (pass arguments as `(func, args, kwargs)`), never
+# closures: those can't be pickled under the "spawn" start method that macOS
+# and Windows use.
+RESOURCE_LIMITS = {
+    "network": 4,  # Data pulls mostly wait on the server
+    "cpu-heavy": max(1, (cpu_count() or 2) // 2),  # Notebook kernels
+    "wrds-connection": 1,  # WRDS limits concurrent connections per user
+}
+LOCK_DIR = Path(OUTPUT_DIR) / ".locks"
+
+
+def with_resources(task, *tags):
+    """Run the actions of `task` while holding a slot of each of `tags`
+    (see ./src/task_actions.py)."""
+    limits = {tag: RESOURCE_LIMITS[tag] for tag in tags}
+    return {**task, "actions": [ResourceActions(task["actions"], limits, LOCK_DIR)]}
 
 
 ##################################
@@ -60,7 +154,7 @@ def copy_file(origin_path, destination_path, mkdir=True):
 def task_config():
     """Create empty directories for data and output if they don't exist"""
     return {
-        "actions": ["ipython ./src/settings.py"],
+        "actions": ["ipython ./src/settings.py"] if PULL_IN_SUBPROCESS else [create_dirs],
         "targets": [DATA_DIR, OUTPUT_DIR],
         "file_dep": ["./src/settings.py"],
         "clean": [],
@@ -70,14 +164,11 @@ def task_config():
 def task_pull_public_repo_data():
     """Pull public data from FRED and OFR API"""
 
-    return {
-        "actions": [
-            "ipython ./src/settings.py",
-            "ipython ./src/pull_fred.py",
-            "ipython ./src/pull_ofr_api_data.py",
-        ],
+    return with_resources({
+        "actions": pull_actions(pull_fred_data, pull_ofr_data),
         "targets": [
             DATA_DIR / "fred.parquet",
+            DATA_DIR / "fred_raw.parquet",
             DATA_DIR / "ofr_public_repo_data.parquet",
         ],
         "file_dep": [
@@ -85,7 +176,14 @@ def task_pull_public_repo_data():
             "./src/pull_fred.py",
             "./src/pull_ofr_api_data.py",
         ],
-        "clean": [],  # Don't clean these files by default. The ideas
+        # The panel that ./src/pull_public_repo_data.py builds from these
+        # files on first use. It is not a target, as this task doesn't write
+        # it, but `doit clean` removes it.
+        "clean": [(remove_files, [
+            DATA_DIR / "public_repo_panel.arrow",
+            DATA_DIR / "public_repo_panel_raw_timing.arrow",
+        ])],
+        # Don't clean the pulled files themselves. The ideas
         # is that a data pull might be expensive, so we don't want to
         # redo it unless we really mean it. So, when you run
         # doit clean, all other tasks will have their targets
@@ -93,17 +191,14 @@ def task_pull_public_repo_data():
         # But this one wont.
         # Use doit forget --all to redo all tasks. Use doit clean
         # to clean and forget the cheaper tasks.
-    }
+    }, "network")
 
 
 def task_pull_ken_french_data():
     """Pull public data from FRED and OFR API"""
 
-    return {
-        "actions": [
-            "ipython ./src/settings.py",
-            "ipython ./src/pull_ken_french_data.py",
-        ],
+    return with_resources({
+        "actions": pull_actions(pull_ken_french_portfolios),
         "targets": [
             DATA_DIR / "25_Portfolios_OP_INV_5x5_daily.parquet",
         ],
@@ -119,7 +214,7 @@ def task_pull_ken_french_data():
         # But this one wont.
         # Use doit forget --all to redo all tasks. Use doit clean
         # to clean and forget the cheaper tasks.
-    }
+    }, "network")
 
 
 
@@ -142,7 +237,7 @@ def task_pull_ken_french_data():
 #         ]
 #     targets = [DATA_DIR / file for file in file_output]
 
-#     return {
+#     return with_resources({
 #         "actions": [
 #             "ipython ./src/pull_bloomberg.py",
 #             "ipython ./src/pull_CRSP_Compustat.py",
@@ -152,13 +247,13 @@ def task_pull_ken_french_data():
 #         "targets": targets,
 #         "file_dep": file_dep,
 #         "clean": [],  # Don't clean these files by default.
-#     }
+#     }, "network", "wrds-connection")
 
 
 def task_summary_stats():
     """Generate table of summary statistics"""
 
-    return {
+    return cached({
         "actions": [
             "ipython ./src/example_table.py",
             "ipython ./src/pandas_to_latex_demo.py",
@@ -170,15 +265,16 @@ def task_summary_stats():
         "file_dep": [
             "./src/example_table.py",
             "./src/pandas_to_latex_demo.py",
+            DATA_DIR / "fred.parquet",
         ],
         "clean": True,
-    }
+    })
 
 
 def task_example_plot():
     """Example plots"""
 
-    return {
+    return cached({
         "actions": [
             # "date 1>&2",
             # "time ipython ./src/example_plot.py",
@@ -190,15 +286,16 @@ def task_example_plot():
         "file_dep": [
             "./src/example_plot.py",
             "./src/pull_fred.py",
+            DATA_DIR / "fred.parquet",
         ],
         "clean": True,
-    }
+    })
 
 
 def task_chart_repo_rates():
     """Example charts for Chart Book"""
 
-    return {
+    return cached({
         "actions": [
             # "date 1>&2",
             # "time ipython ./src/chart_relative_repo_rates.py",
@@ -213,10 +310,14 @@ def task_chart_repo_rates():
         ],
         "file_dep": [
             "./src/pull_fred.py",
+            "./src/pull_public_repo_data.py",
             "./src/chart_relative_repo_rates.py",
+            "./src/chart_export.py",
+            DATA_DIR / "fred.parquet",
+            DATA_DIR / "ofr_public_repo_data.parquet",
         ],
         "clean": True,
-    }
+    }, outputs=[PLOTLYJS])
 
 
 notebook_tasks = {
@@ -227,7 +328,7 @@ notebook_tasks = {
         ],
     },
     "02_example_with_dependencies.ipynb": {
-        "file_dep": ["./src/pull_fred.py"],
+        "file_dep": ["./src/pull_fred.py", DATA_DIR / "fred.parquet"],
         "targets": [
             Path(OUTPUT_DIR) / "GDP_graph.png",
             Path("./docs") / "02_example_with_dependencies.html",
@@ -238,6 +339,8 @@ notebook_tasks = {
             "./src/pull_fred.py",
             "./src/pull_ofr_api_data.py",
             "./src/pull_public_repo_data.py",
+            DATA_DIR / "fred.parquet",
+            DATA_DIR / "ofr_public_repo_data.parquet",
         ],
         "targets": [
             OUTPUT_DIR / "repo_rate_spikes_and_relative_reserves_levels.png",
@@ -247,6 +350,7 @@ notebook_tasks = {
     },
     "04_ken_french_data.ipynb": {
         "file_dep": [],
+        "resources": ["network"],  # Downloads the data itself
         "targets": [
             Path("./docs") / "04_ken_french_data.html",
         ],
@@ -260,25 +364,68 @@ notebook_tasks = {
 }
 
 
+def notebook_source_hash(notebook_path):
+    """Hash of the cell types and sources of a notebook. Outputs, execution
+    counts and metadata do not change it. Reads the JSON directly, so that
+    computing it for every `doit` invocation stays cheap.
+    """
+    with open(notebook_path, encoding="utf-8") as f:
+        cells = json.load(f)["cells"]
+    source = [
+        (cell["cell_type"], "".join(cell["source"]) if isinstance(cell["source"], list) else cell["source"])
+        for cell in cells
+    ]
+    return hashlib.sha256(json.dumps(source).encode()).hexdigest()
+
+
+def notebooks_to_scripts(notebook_paths, build_dir):
+    """Clear the outputs and metadata of each notebook (rewriting it only if
+    that changed anything) and write its source to `build_dir/_<name>.py`.
+    Does what `jupyter nbconvert --ClearOutputPreprocessor.enabled=True
+    --inplace` and `jupyter nbconvert --to python` did, for all notebooks in
+    one process.
+    """
+    import nbformat
+    from nbconvert.preprocessors import ClearMetadataPreprocessor, ClearOutputPreprocessor
+
+    build_dir = Path(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    for notebook_path in notebook_paths:
+        nb = nbformat.read(notebook_path, as_version=4)
+        cleared = nbformat.from_dict(nb)
+        ClearOutputPreprocessor(enabled=True).preprocess(cleared, {})
+        ClearMetadataPreprocessor(enabled=True).preprocess(cleared, {})
+        if cleared != nb:
+            nbformat.write(cleared, notebook_path)
+
+        blocks = []
+        for cell in cleared.cells:
+            if cell.cell_type == "code":
+                blocks.append(f"# %%\n{cell.source}")
+            else:
+                commented = "\n".join(f"# {line}".rstrip() for line in cell.source.splitlines())
+                blocks.append(f"# %% [{cell.cell_type}]\n{commented}")
+        script = "\n\n".join(blocks) + "\n"
+        (build_dir / f"_{Path(notebook_path).stem}.py").write_text(script, encoding="utf-8")
+
+
 def task_convert_notebooks_to_scripts():
     """Convert notebooks to script form to detect changes to source code rather
     than to the notebook's metadata.
     """
-    build_dir = Path(OUTPUT_DIR)
+    notebook_paths = [Path("./src") / notebook for notebook in notebook_tasks.keys()]
 
-    for notebook in notebook_tasks.keys():
-        notebook_name = notebook.split(".")[0]
-        yield {
-            "name": notebook,
-            "actions": [
-                jupyter_clear_output(notebook_name),
-                jupyter_to_python(notebook_name, build_dir),
-            ],
-            "file_dep": [Path("./src") / notebook],
-            "targets": [OUTPUT_DIR / f"_{notebook_name}.py"],
-            "clean": True,
-            "verbosity": 0,
-        }
+    return {
+        "actions": [(notebooks_to_scripts, [notebook_paths, OUTPUT_DIR])],
+        "targets": [OUTPUT_DIR / f"_{path.stem}.py" for path in notebook_paths],
+        # Rerun only when the source of a notebook changes, not when just its
+        # outputs or metadata do (e.g. after opening it in Jupyter)
+        "uptodate": [
+            config_changed({str(path): notebook_source_hash(path) for path in notebook_paths})
+        ],
+        "clean": True,
+        "verbosity": 0,
+    }
 
 
 # fmt: off
@@ -288,25 +435,16 @@ def task_run_notebooks():
     """
     for notebook in notebook_tasks.keys():
         notebook_name = notebook.split(".")[0]
-        yield {
+        resources = notebook_tasks[notebook].get("resources", [])
+        yield cached(with_resources({
             "name": notebook,
             "actions": [
-                """python -c "import sys; from datetime import datetime; print(f'Start """ + notebook + """: {datetime.now()}', file=sys.stderr)" """,
-                jupyter_execute_notebook(notebook_name),
-                jupyter_to_html(notebook_name),
-                copy_file(
-                    Path("./src") / f"{notebook_name}.ipynb",
-                    OUTPUT_DIR / f"{notebook_name}.ipynb",
-                    mkdir=True,
-                ),
-                copy_file(
+                # Execute, write OUTPUT_DIR/<name>.ipynb and .html, clear ./src/<name>.ipynb
+                (run_notebook, [Path("./src") / notebook]),
+                (copy_file, [
                     OUTPUT_DIR / f"{notebook_name}.html",
                     Path("./docs") / f"{notebook_name}.html",
-                    mkdir=True,
-                ),
-                jupyter_clear_output(notebook_name),
-                # jupyter_to_python(notebook_name, build_dir),
-                """python -c "import sys; from datetime import datetime; print(f'End """ + notebook + """: {datetime.now()}', file=sys.stderr)" """,
+                ], {"mkdir": True}),
             ],
             "file_dep": [
                 OUTPUT_DIR / f"_{notebook_name}.py",
@@ -318,5 +456,5 @@ def task_run_notebooks():
                 *notebook_tasks[notebook]["targets"],
             ],
             "clean": True,
-        }
+        }, "cpu-heavy", *resources))
 # fmt: on
@@ -0,0 +1,219 @@
+"""An on-disk cache for the HTTP downloads of the data pulls.
+
+The public data pulls (FRED, the OFR API, the Fed yield curve, Ken French's
+data library) download full histories every time they run, even when the
+file upstream has not changed. `session()` returns a `requests.Session` that
+keeps every successful GET response in HTTP_CACHE_DIR and
+
+- if the server sent an `ETag` or `Last-Modified` header, asks it whether the
+  response changed (`If-None-Match`/`If-Modified-Since`). On a `304 Not
+  Modified` the response is served from disk, without downloading it again.
+- otherwise, serves the stored response for HTTP_CACHE_TTL seconds
+  (default 1 hour) after downloading it, and downloads it again after that.
+
+The body of a `stream=True` response is not read up front: it is written to
+the cache as it is read through `iter_content` (or `iter_lines`, `content`),
+and stored once it has been read to the end.
+
+Every request is recorded in HTTP_CACHE_DIR/http_cache.log as a hit (served
+from disk without a request), revalidated (served from disk after a 304),
+miss (downloaded, nothing stored) or refreshed (downloaded again, the stored
+copy had changed or expired). Delete the directory to clear the cache; set
+HTTP_CACHE=false to turn it off.
+
+Example
+-------
+```
+>>> import http_cache
+>>> response = http_cache.session().get(url, timeout=30)
+>>> web.DataReader("GDP", "fred", session=http_cache.session())
+```
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, stream_decode_response_unicode
+
+from settings import config
+
+HTTP_CACHE = config("HTTP_CACHE", default=True, cast=bool)
+HTTP_CACHE_DIR = Path(
+    config("HTTP_CACHE_DIR", default=Path.home() / ".cache" / "pydoit-http-cache", cast=Path)
+)
+HTTP_CACHE_TTL = config("HTTP_CACHE_TTL", default=3600, cast=float)
+
+## Response headers that are stored with the body
+_STORED_HEADERS = ["Content-Type", "Content-Encoding", "ETag", "Last-Modified", "Date"]
+
+log = logging.getLogger("http_cache")
+_log_lock = threading.Lock()
+_log_dirs = set()
+
+
+def _record(cache_dir, outcome, url, size):
+    """Log `outcome` for `url`, and append it to cache_dir/http_cache.log."""
+    with _log_lock:
+        if cache_dir not in _log_dirs:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            handler = logging.FileHandler(cache_dir / "http_cache.log")
+            handler.setFormatter(logging.Formatter("%(asctime)s\t%(message)s"))
+            handler.addFilter(lambda r, cache_dir=cache_dir: r.cache_dir == cache_dir)
+            log.addHandler(handler)
+            log.setLevel(logging.INFO)
+            _log_dirs.add(cache_dir)
+    log.info("%s\t%s\t%d", outcome, url, size, extra={"cache_dir": cache_dir})
+
+
+def _tmp_path(path):
+    """The file `path` is written to before it is renamed into place."""
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+class CachingAdapter(HTTPAdapter):
+    """A transport adapter that serves GET requests from an on-disk cache,
+    revalidating stored responses with the server (see module docstring).
+    Takes the arguments of `HTTPAdapter` (pool sizes, `max_retries`), plus
+    the cache directory and the TTL for responses without validators."""
+
+    def __init__(self, cache_dir=None, ttl=None, **kwargs):
+        self.cache_dir = Path(cache_dir or HTTP_CACHE_DIR)
+        self.ttl = HTTP_CACHE_TTL if ttl is None else ttl
+        super().__init__(**kwargs)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        directory = self.cache_dir / key[:2]
+        return directory / f"{key}.json", directory / f"{key}.body"
+
+    def _load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (FileNotFoundError, ValueError):
+            return None, None
+        if len(body) != meta["size"]:
+            return None, None
+        return meta, body
+
+    def _store(self, url, response, size=None):
+        """Store `response`. With `size`, its body was already written to
+        the temporary body file (see `_stream_to_cache`)."""
+        meta_path, body_path = self._paths(url)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        headers = {name: response.headers[name] for name in _STORED_HEADERS if name in response.headers}
+        if size is None:
+            size = len(response.content)
+            _tmp_path(body_path).write_bytes(response.content)
+        meta = {"url": url, "stored": time.time(), "size": size, "headers": headers}
+        _tmp_path(meta_path).write_text(json.dumps(meta, indent=1))
+        os.replace(_tmp_path(body_path), body_path)
+        os.replace(_tmp_path(meta_path), meta_path)
+
+    def _stream_to_cache(self, url, response, outcome):
+        """Write the body of a streamed `response` to the cache as it is
+        read through `iter_content`, and store it once it is read to the end."""
+        iter_content = response.iter_content
+
+        def store_chunks(chunks):
+            _, body_path = self._paths(url)
+            body_path.parent.mkdir(parents=True, exist_ok=True)
+            size, complete = 0, False
+            try:
+                with open(_tmp_path(body_path), "wb") as file:
+                    for chunk in chunks:
+                        file.write(chunk)
+                        size += len(chunk)
+                        yield chunk
+                self._store(url, response, size)
+                complete = True
+                del response.iter_content  # Reading it again reads the stored content
+            finally:
+                if not complete:
+                    _tmp_path(body_path).unlink(missing_ok=True)
+                _record(self.cache_dir, outcome if complete else "miss", url, size)
+
+        def iter_and_store(chunk_size=1, decode_unicode=False):
+            chunks = store_chunks(iter_content(chunk_size))
+            return stream_decode_response_unicode(chunks, response) if decode_unicode else chunks
+
+        response.iter_content = iter_and_store
+
+    def _touch(self, url, meta):
+        meta_path, _ = self._paths(url)
+        _tmp_path(meta_path).write_text(json.dumps({**meta, "stored": time.time()}, indent=1))
+        os.replace(_tmp_path(meta_path), meta_path)
+
+    def _from_cache(self, request, meta, body):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        # The body is stored decoded, so it must not be decoded again
+        response.headers.pop("Content-Encoding", None)
+        response.headers["Content-Length"] = str(len(body))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.from_cache = True
+        return response
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        url = request.url
+        meta, body = self._load(url)
+        if meta is not None:
+            headers = meta["headers"]
+            validators = "ETag" in headers or "Last-Modified" in headers
+            if not validators and time.time() - meta["stored"] < self.ttl:
+                _record(self.cache_dir, "hit", url, len(body))
+                return self._from_cache(request, meta, body)
+            if "ETag" in headers:
+                request.headers["If-None-Match"] = headers["ETag"]
+            if "Last-Modified" in headers:
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and meta is not None:
+            response.close()
+            self._touch(url, meta)
+            _record(self.cache_dir, "revalidated", url, len(body))
+            return self._from_cache(request, meta, body)
+        if response.status_code == 200:
+            outcome = "miss" if meta is None else "refreshed"
+            if kwargs.get("stream"):
+                self._stream_to_cache(url, response, outcome)
+            else:
+                # Read the body now, so it can be stored (requests would read
+                # it when it is first used anyway)
+                self._store(url, response)
+                _record(self.cache_dir, outcome, url, len(response.content))
+        response.from_cache = False
+        return response
+
+
+def session(cache_dir=None, ttl=None, **adapter_kwargs):
+    """A `requests.Session` whose GET responses are cached on disk (a plain
+    session if HTTP_CACHE is off). Keyword arguments go to the adapter,
+    e.g. `pool_maxsize` or `max_retries`."""
+    http = requests.Session()
+    if HTTP_CACHE:
+        adapter = CachingAdapter(cache_dir=cache_dir, ttl=ttl, **adapter_kwargs)
+    else:
+        adapter = HTTPAdapter(**adapter_kwargs)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
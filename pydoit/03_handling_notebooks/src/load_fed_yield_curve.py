@@ -3,41 +3,87 @@ This module contains functions to load the zero coupon yield curve from the Fede
 It saves the pulled raw data to a parquet file for future use.
 Functions to load the raw/clean data from the parquet file are also provided for future use.
 
+The CSV (about 100 columns, one row per business day since 1961) is streamed
+to DATA_DIR/feds200628.csv rather than held in memory, and parsed by
+pyarrow's multithreaded CSV reader. Only the requested columns are read,
+with fixed types, so nothing is inferred; pass `float32=True` to halve the
+memory of the yields.
 """
 
-import pandas as pd
-import requests
-from io import BytesIO
+import os
 from pathlib import Path
-import settings
 
-DATA_DIR = settings.DATA_DIR
-START_DATE = settings.START_DATE
-END_DATE = settings.END_DATE
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+
+import http_cache
+import svensson
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+START_DATE = config("START_DATE")
+END_DATE = config("END_DATE")
+
+FED_YIELD_CURVE_URL = "https://www.federalreserve.gov/data/yield-curve-tables/feds200628.csv"
+## Lines of notes above the header of the CSV
+FED_YIELD_CURVE_NOTES = 9
+## Zero coupon yields, continuously compounded, 1 to 30 years
+YIELD_COLUMNS = ['SVENY' + str(i).zfill(2) for i in range(1, 31)]
+## Parameters of the fitted Svensson curve (see svensson.py)
+SVENSSON_COLUMNS = svensson.PARAMETERS
+
 
+def download_fed_yield_curve(path, url=FED_YIELD_CURVE_URL, session=None, chunk_size=1 << 20):
+    """Stream the CSV to `path`, `chunk_size` bytes at a time. The file is
+    written next to `path` and then renamed, so an interrupted download
+    never replaces a complete one."""
+    if session is None:
+        with http_cache.session() as session:
+            return download_fed_yield_curve(path, url, session, chunk_size)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with session.get(url, timeout=60, stream=True) as response:
+        response.raise_for_status()
+        with open(tmp_path, "wb") as file:
+            for chunk in response.iter_content(chunk_size):
+                file.write(chunk)
+    os.replace(tmp_path, path)
+    return path
 
-def pull_fed_yield_curve():
+
+def read_fed_yield_curve(path, columns=YIELD_COLUMNS, float32=False):
+    """Read `columns` of the CSV at `path`, indexed by date. The other
+    columns are skipped while parsing."""
+    value_type = pa.float32() if float32 else pa.float64()
+    table = pv.read_csv(
+        path,
+        read_options=pv.ReadOptions(skip_rows=FED_YIELD_CURVE_NOTES, use_threads=True),
+        convert_options=pv.ConvertOptions(
+            include_columns=["Date", *columns],
+            column_types={"Date": pa.timestamp("ns"), **{col: value_type for col in columns}},
+            null_values=["NA", ""],
+        ),
+    )
+    return table.to_pandas().set_index("Date")
+
+
+def pull_fed_yield_curve(data_dir=DATA_DIR, columns=YIELD_COLUMNS, float32=False):
     """
     Download the latest yield curve from the Federal Reserve
-    
+
     This is the published data using Gurkaynak, Sack, and Wright (2007) model
     """
-    
-    url = "https://www.federalreserve.gov/data/yield-curve-tables/feds200628.csv"
-    response = requests.get(url)
-    pdf_stream = BytesIO(response.content)
-    df = pd.read_csv(pdf_stream, skiprows=9, index_col=0, parse_dates=True)
-    cols = ['SVENY' + str(i).zfill(2) for i in range(1, 31)]
-    return df[cols]
+    path = download_fed_yield_curve(Path(data_dir) / "feds200628.csv")
+    return read_fed_yield_curve(path, columns, float32)
 
 def load_fed_yield_curve(data_dir=DATA_DIR):
     path = data_dir  / "fed_yield_curve.parquet"
     _df = pd.read_parquet(path)
     return _df
-    
+
 if __name__ == "__main__":
     df = pull_fed_yield_curve()
     path = Path(DATA_DIR) / "fed_yield_curve.parquet"
     df.to_parquet(path)
-    
-    
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""
+A stand-in for `xbbg.blp`, for running `pull_bloomberg.py` without a
+Bloomberg terminal (set BBG_MOCK=True) and for its tests.
+
+The values are made up: a function of the ticker, field and date.
+"""
+
+import numpy as np
+import pandas as pd
+
+## First date each ticker has values for (the E-mini S&P 500 futures were
+## first listed in September 1997); tickers not listed here have values
+## on every date
+LISTED = {"ES1 Index": "1997-09-09"}
+
+
+class StandInBlp:
+    """A stand-in for `xbbg.blp`. `bdh` answers like xbbg: a DataFrame with
+    (ticker, field) columns and `datetime.date`s as index, with a row for
+    each business day any ticker has a value. Each ticker has values from
+    its first date in `listed` on; the value is a function of the ticker,
+    field and date. Records every call."""
+
+    def __init__(self, listed=None):
+        self.listed = {ticker: pd.Timestamp(first) for ticker, first in (listed or {}).items()}
+        self.calls = []
+
+    @staticmethod
+    def value(ticker, field, dates):
+        return sum(map(ord, ticker + field)) % 97 + (dates - pd.Timestamp("1990-01-01")).days / 1000
+
+    def bdh(self, tickers, flds, start_date, end_date, **kwargs):
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        flds = [flds] if isinstance(flds, str) else list(flds)
+        self.calls.append((tickers, flds, start_date, end_date, kwargs))
+        dates = pd.bdate_range(start_date, end_date)
+        columns = {}
+        for ticker in tickers:
+            for field in flds:
+                values = self.value(ticker, field, dates)
+                columns[ticker, field] = np.where(dates >= self.listed.get(ticker, dates[0]), values, np.nan)
+        df = pd.DataFrame(columns, index=dates).dropna(how="all")
+        df.index = df.index.date
+        return df
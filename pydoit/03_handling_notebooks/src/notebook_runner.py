@@ -0,0 +1,454 @@
+"""Execute notebooks in a pool of warm Jupyter kernels.
+
+`jupyter nbconvert --execute` starts a new kernel for every notebook, and the
+kernel then spends a good part of the run importing pandas, polars, plotly,
+etc. This module keeps a small pool of kernels that are started once per
+process, with the common imports already loaded, and reuses them:
+
+- Before each notebook, the kernel's namespace and execution counter are
+  reset and matplotlib's rcParams are restored, so a notebook cannot see
+  variables or plot settings of the one that ran before it. Imported
+  modules stay loaded, which is where the time is saved.
+- Modules that stay loaded keep their state. For the project's own modules
+  (anything not installed in the environment, e.g. ``./src/settings.py`` or
+  ``./src/pull_public_repo_data.py`` with its cached panel) that could make
+  one notebook depend on another, so if a notebook imported any, the kernel
+  is restarted (and warmed again) instead of reset. Other global state of
+  installed packages, such as pandas options or the default plotly
+  template, carries over: set it in the notebooks that need it. Set
+  NOTEBOOK_KERNELS=0 to start a fresh kernel for every notebook instead.
+- A kernel that fails or dies while running a notebook is restarted (and
+  warmed again) before it is handed out again.
+- The executed notebook and its HTML export are written from this process,
+  without a separate `jupyter nbconvert --to html` run.
+- Optionally, cells are cached (see `execute_notebook_cached`): when only a
+  late cell changed, the cells before it are restored from the cache instead
+  of being executed again.
+
+`run_notebook` is meant to be called from a doit Python action. With the
+multiprocess runner, each worker process keeps its own pool. The pool's
+kernels are registered with `task_telemetry.share_process`, so the telemetry
+of an action only includes what they use while it runs.
+"""
+
+import ast
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import nbformat
+from jupyter_client.manager import KernelManager
+from nbclient import NotebookClient
+from nbconvert import HTMLExporter
+from nbconvert.preprocessors import ClearMetadataPreprocessor, ClearOutputPreprocessor
+
+from settings import config
+from task_telemetry import share_process
+
+OUTPUT_DIR = Path(config("OUTPUT_DIR"))
+CELL_CACHE_DIR = OUTPUT_DIR / ".cell_cache"
+## Number of warm kernels per process (0 for a fresh kernel per notebook)
+NOTEBOOK_KERNELS = config("NOTEBOOK_KERNELS", default=1, cast=int)
+
+## Modules imported into every kernel when it starts
+WARM_IMPORTS = [
+    "numpy",
+    "pandas",
+    "polars",
+    "plotly.express",
+    "matplotlib.pyplot",
+    "seaborn",
+]
+
+## Kept on the shell, which survives `reset`: the modules loaded after warming
+## up, and the rcParams to restore
+_WARMUP_CODE = f"""
+import importlib, sys
+for _module in {WARM_IMPORTS!r}:
+    try:
+        importlib.import_module(_module)
+    except ImportError:
+        pass
+get_ipython()._pool_modules = set(sys.modules)
+if "matplotlib" in sys.modules:
+    get_ipython()._pool_rc = dict(sys.modules["matplotlib"].rcParams.copy())
+    del get_ipython()._pool_rc["backend"]
+"""
+
+## The modules imported since warming up that are not installed in the
+## environment (the standard library and site-packages)
+_PROJECT_MODULES_CODE = """
+def _project_modules():
+    import os, sys, sysconfig
+    paths = sysconfig.get_paths()
+    installed = tuple(
+        os.path.realpath(paths[key]) for key in ("stdlib", "platstdlib", "purelib", "platlib")
+    )
+    found = []
+    for name, module in list(sys.modules.items()):
+        file = getattr(module, "__file__", None)
+        if name in get_ipython()._pool_modules or not file:
+            continue
+        if not os.path.realpath(file).startswith(installed):
+            found.append(name)
+    return sorted(found)
+_pool_project_modules = _project_modules()
+del _project_modules
+"""
+
+_RESET_CODE = """
+import os, sys
+if "matplotlib.pyplot" in sys.modules:
+    sys.modules["matplotlib.pyplot"].close("all")
+if hasattr(get_ipython(), "_pool_rc"):
+    sys.modules["matplotlib"].rcParams.update(get_ipython()._pool_rc)
+os.chdir({cwd!r})
+get_ipython().reset(new_session=True)
+"""
+
+
+## Save the kernel's namespace: each variable is pickled with cloudpickle into
+## `objects/<sha256 of the pickle>` (so a variable that did not change between
+## cells is stored once), and `path` maps variable names to those files
+## (modules by name). If any variable can't be pickled, `path` is not written,
+## as restoring only part of the namespace could change what later cells do.
+_SAVE_NAMESPACE_CODE = """
+def _save_namespace(path, objects_dir):
+    import hashlib, json, os, types
+    import cloudpickle
+    modules, pickles = {{}}, {{}}
+    for name, value in list(globals().items()):
+        if name.startswith("_") or name in ("In", "Out", "get_ipython", "exit", "quit"):
+            continue
+        if isinstance(value, types.ModuleType):
+            modules[name] = value.__name__
+            continue
+        try:
+            pickles[name] = cloudpickle.dumps(value)
+        except Exception:
+            return
+    namespace = {{}}
+    os.makedirs(objects_dir, exist_ok=True)
+    for name, data in pickles.items():
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = os.path.join(objects_dir, digest)
+        if not os.path.exists(object_path):
+            with open(object_path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(object_path + ".tmp", object_path)
+        namespace[name] = digest
+    with open(path + ".tmp", "w") as f:
+        json.dump({{"modules": modules, "namespace": namespace}}, f)
+    os.replace(path + ".tmp", path)
+_save_namespace({path!r}, {objects_dir!r})
+del _save_namespace
+"""
+
+_LOAD_NAMESPACE_CODE = """
+def _load_namespace(path, objects_dir):
+    import importlib, json, os
+    import cloudpickle
+    with open(path) as f:
+        snapshot = json.load(f)
+    for name, module in snapshot["modules"].items():
+        globals()[name] = importlib.import_module(module)
+    for name, digest in snapshot["namespace"].items():
+        with open(os.path.join(objects_dir, digest), "rb") as f:
+            globals()[name] = cloudpickle.load(f)
+_load_namespace({path!r}, {objects_dir!r})
+del _load_namespace
+"""
+
+
+class KernelPool:
+    """A fixed number of started, warmed kernels that can be borrowed.
+
+    A borrowed kernel has a fresh namespace and the rcParams it had after
+    warming up, and none of the project's modules loaded (see the module
+    docstring for what else carries over between notebooks). With
+    ``size=0`` every notebook gets a new kernel, which is shut down after it.
+    """
+
+    def __init__(self, size=NOTEBOOK_KERNELS, kernel_name="python3", cwd="."):
+        self.kernel_name = kernel_name
+        self.size = size
+        self._idle = queue.Queue()
+        for _ in range(size):
+            km = self._start(cwd)
+            share_process(km.provisioner.pid)
+            self._idle.put(km)
+
+    def _start(self, cwd):
+        km = KernelManager(kernel_name=self.kernel_name)
+        km.start_kernel(cwd=str(cwd))
+        self._run_code(km, _WARMUP_CODE)
+        return km
+
+    @staticmethod
+    def _run_code(km, code, timeout=120, user_expressions=None):
+        """Run `code` in the kernel. Returns the values of `user_expressions`
+        ({name: expression}) as `repr` strings."""
+        kc = km.client()
+        kc.start_channels()
+        try:
+            kc.wait_for_ready(timeout=timeout)
+            reply = kc.execute_interactive(
+                code, store_history=False, timeout=timeout, user_expressions=user_expressions or {}
+            )
+        finally:
+            kc.stop_channels()
+        if reply["content"]["status"] != "ok":
+            raise RuntimeError(f"Kernel setup failed: {reply['content'].get('evalue')}")
+        return {
+            name: value["data"]["text/plain"]
+            for name, value in reply["content"].get("user_expressions", {}).items()
+        }
+
+    def _project_modules(self, km):
+        """The project's modules that notebooks imported into the kernel."""
+        values = self._run_code(
+            km, _PROJECT_MODULES_CODE, user_expressions={"modules": "_pool_project_modules"}
+        )
+        return ast.literal_eval(values["modules"])
+
+    def _restart(self, km):
+        km.restart_kernel(now=True)
+        share_process(km.provisioner.pid)
+        self._run_code(km, _WARMUP_CODE)
+
+    @contextmanager
+    def kernel(self, cwd):
+        """Borrow a kernel with a fresh namespace and `cwd` as working directory."""
+        if self.size == 0:
+            km = self._start(cwd)
+            try:
+                yield km
+            finally:
+                km.shutdown_kernel(now=True)
+            return
+        km = self._idle.get()
+        try:
+            if not km.is_alive() or self._project_modules(km):
+                self._restart(km)
+            self._run_code(km, _RESET_CODE.format(cwd=str(Path(cwd).resolve())))
+            yield km
+        except BaseException:
+            # The kernel may be in any state (e.g. half-run cell, dead kernel)
+            self._restart(km)
+            raise
+        finally:
+            self._idle.put(km)
+
+    def shutdown(self):
+        while not self._idle.empty():
+            self._idle.get().shutdown_kernel(now=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's kernel pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = KernelPool()
+            atexit.register(_pool.shutdown)
+    return _pool
+
+
+def execute_notebook(nb, cwd, timeout=None, pool=None):
+    """Execute `nb` (a NotebookNode) in place in a warm kernel."""
+    pool = pool or get_pool()
+    with pool.kernel(cwd) as km:
+        client = NotebookClient(
+            nb,
+            km=km,
+            timeout=timeout,
+            kernel_name=pool.kernel_name,
+            resources={"metadata": {"path": str(cwd)}},
+        )
+        try:
+            client.execute()
+        finally:
+            if client.kc is not None:
+                client.kc.stop_channels()
+    return nb
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cell_keys(nb, inputs=()):
+    """A key for each code cell of `nb` (None for other cells).
+
+    The key of a cell covers its source, the source of all code cells above
+    it and the contents of the files in `inputs`, so it changes whenever
+    anything that could change the cell's outputs or namespace does.
+    """
+    h = hashlib.sha256()
+    for path in sorted(inputs, key=str):
+        h.update(f"{Path(path).as_posix()}:{_file_digest(path)}\n".encode())
+    keys = []
+    for cell in nb.cells:
+        if cell.cell_type != "code":
+            keys.append(None)
+            continue
+        h.update(f"{len(cell.source)}:{cell.source}".encode())
+        keys.append(h.copy().hexdigest())
+    return keys
+
+
+def execute_notebook_cached(nb, cwd, inputs=(), cache_dir=CELL_CACHE_DIR, timeout=None, pool=None):
+    """Execute `nb` in place like `execute_notebook`, reusing cached cells.
+
+    After each code cell runs, its outputs and a snapshot of the kernel's
+    namespace (variables pickled with cloudpickle) are stored in `cache_dir`
+    under the cell's key (see `cell_keys`). On the next run, the longest prefix of
+    code cells whose keys are all cached is restored: their outputs are
+    copied into `nb`, the namespace after the last of them is loaded into
+    the kernel, and only the cells after it are executed.
+
+    Cells that only write files (e.g. a chart) are not run again when they
+    are restored, so don't use this when their files may be gone.
+    """
+    cache_dir = Path(cache_dir).resolve()
+    objects_dir = cache_dir / "objects"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    keys = cell_keys(nb, inputs)
+    code_cells = [index for index, key in enumerate(keys) if key is not None]
+
+    restored = []
+    for index in code_cells:
+        if not (cache_dir / f"{keys[index]}.json").exists():
+            break
+        restored.append(index)
+    # Resume after the last restored cell that has a namespace snapshot
+    while restored and not (cache_dir / f"{keys[restored[-1]]}.namespace.json").exists():
+        restored.pop()
+
+    pool = pool or get_pool()
+    with pool.kernel(cwd) as km:
+        for index in restored:
+            cached = json.loads((cache_dir / f"{keys[index]}.json").read_text())
+            nb.cells[index].outputs = nbformat.from_dict(cached["outputs"])
+            nb.cells[index].execution_count = cached["execution_count"]
+
+        client = NotebookClient(
+            nb,
+            km=km,
+            timeout=timeout,
+            kernel_name=pool.kernel_name,
+            resources={"metadata": {"path": str(cwd)}},
+        )
+        client.reset_execution_trackers()
+
+        def run_hidden(code):
+            # Through the notebook's client: a second client on the kernel
+            # between cells makes nbclient miss the next cell's messages
+            reply = client.wait_for_reply(client.kc.execute(code, silent=True, store_history=False))
+            if reply["content"]["status"] != "ok":
+                raise RuntimeError(f"Cell cache failed: {reply['content'].get('evalue')}")
+
+        try:
+            with client.setup_kernel():
+                info_msg = client.wait_for_reply(client.kc.kernel_info())
+                nb.metadata["language_info"] = info_msg["content"]["language_info"]
+                if restored:
+                    snapshot = cache_dir / f"{keys[restored[-1]]}.namespace.json"
+                    run_hidden(_LOAD_NAMESPACE_CODE.format(path=str(snapshot), objects_dir=str(objects_dir)))
+                for count, index in enumerate(code_cells, start=1):
+                    if count <= len(restored):
+                        continue
+                    cell = nb.cells[index]
+                    client.execute_cell(cell, index, execution_count=count)
+                    entry = {"execution_count": cell.execution_count, "outputs": cell.outputs}
+                    tmp_path = cache_dir / f"{keys[index]}.json.tmp"
+                    tmp_path.write_text(json.dumps(entry))
+                    os.replace(tmp_path, cache_dir / f"{keys[index]}.json")
+                    snapshot = cache_dir / f"{keys[index]}.namespace.json"
+                    run_hidden(_SAVE_NAMESPACE_CODE.format(path=str(snapshot), objects_dir=str(objects_dir)))
+        finally:
+            if client.kc is not None:
+                client.kc.stop_channels()
+
+    # Drop the entries of old versions of the cells, and the variables that
+    # only they used
+    current = {key for key in keys if key is not None}
+    used = set()
+    for path in cache_dir.glob("*.json"):
+        if path.name.split(".")[0] not in current:
+            path.unlink()
+        elif path.name.endswith(".namespace.json"):
+            used.update(json.loads(path.read_text())["namespace"].values())
+    for path in objects_dir.glob("*"):
+        if path.name not in used:
+            path.unlink()
+    return nb
+
+
+_html_exporter = None
+
+
+def export_html(nb, name):
+    """Render `nb` like `jupyter nbconvert --to html` (the exporter is reused)."""
+    global _html_exporter
+    if _html_exporter is None:
+        _html_exporter = HTMLExporter()
+    html, _ = _html_exporter.from_notebook_node(nb, resources={"metadata": {"name": name}})
+    return html
+
+
+def read_notebook(notebook_path):
+    """Read a `.ipynb` file, or a jupytext script (e.g. `*_ipynb.py`)."""
+    notebook_path = Path(notebook_path)
+    if notebook_path.suffix == ".ipynb":
+        return nbformat.read(notebook_path, as_version=4)
+    import jupytext
+
+    return jupytext.read(notebook_path)
+
+
+def run_notebook(
+    notebook_path, output_dir=OUTPUT_DIR, clear_source=True, pool=None, cell_cache_inputs=None
+):
+    """Execute a notebook and write `<name>.ipynb` and `<name>.html` to `output_dir`.
+
+    This does what the `jupyter nbconvert --execute --inplace`, `--to html`
+    and `--ClearOutputPreprocessor` commands did, in this process. With
+    ``clear_source=True``, the outputs and metadata of a source `.ipynb` are
+    cleared afterwards, as before. If `cell_cache_inputs` (the files the
+    notebook reads) is given, unchanged cells are restored from
+    CELL_CACHE_DIR / <name> (see `execute_notebook_cached`).
+    """
+    notebook_path = Path(notebook_path)
+    name = notebook_path.stem
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    nb = read_notebook(notebook_path)
+    if cell_cache_inputs is None:
+        execute_notebook(nb, cwd=notebook_path.parent, pool=pool)
+    else:
+        execute_notebook_cached(
+            nb, notebook_path.parent, cell_cache_inputs, CELL_CACHE_DIR / name, pool=pool
+        )
+    nb, _ = ClearMetadataPreprocessor(enabled=True).preprocess(nb, {})
+    nbformat.write(nb, output_dir / f"{name}.ipynb")
+
+    (output_dir / f"{name}.html").write_text(export_html(nb, name), encoding="utf-8")
+
+    if clear_source and notebook_path.suffix == ".ipynb":
+        nb, _ = ClearOutputPreprocessor(enabled=True).preprocess(nb, {})
+        nbformat.write(nb, notebook_path)
@@ -32,6 +32,7 @@ import pandas as pd
 import wrds
 from pandas.tseries.offsets import MonthEnd
 
+import hot_tier
 from settings import config
 
 OUTPUT_DIR = Path(config("OUTPUT_DIR"))
@@ -109,6 +110,28 @@ description_crsp = {
     "mthprc": "Monthly Price - The price of the security at the end of the month.",
 }
 
+## Stable dictionaries for the low-cardinality CRSP columns. Giving every
+## pull the same category order keeps the integer codes identical across
+## files, so joins and group-bys on these columns stay cheap. Codes that are
+## not listed here are appended (sorted) rather than dropped.
+crsp_categories = {
+    "primaryexch": ["N", "A", "Q", "R", "B", "I", "X"],
+    "sharetype": ["NS", "AD", "SB", "UG"],
+    "securitytype": ["EQTY", "FUND"],
+}
+
+
+def normalize_crsp_schema(crsp, categories=crsp_categories):
+    """Convert the low-cardinality CRSP string columns to pandas categoricals."""
+    crsp = crsp.copy()
+    for col, known in categories.items():
+        if col not in crsp.columns:
+            continue
+        unseen = sorted(set(crsp[col].dropna().unique()) - set(known))
+        crsp[col] = crsp[col].astype(pd.CategoricalDtype([*known, *unseen]))
+    return crsp
+
+
 def get_crsp_columns(wrds_username=WRDS_USERNAME):
     """Get all column names from CRSP monthly stock file (CIZ format)."""
     sql_query = """
@@ -180,6 +203,7 @@ def pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME):
     # Line up date to be end of month
     crsp_m["jdate"] = crsp_m["mthcaldt"] + MonthEnd(0)
 
+    crsp_m = normalize_crsp_schema(crsp_m)
     return crsp_m
 
 
@@ -223,13 +247,15 @@ def pull_Fama_French_factors(wrds_username=WRDS_USERNAME):
 
 def load_compustat(data_dir=DATA_DIR):
     path = Path(data_dir) / "Compustat.parquet"
-    comp = pd.read_parquet(path)
+    comp = hot_tier.read_parquet(path)
     return comp
 
 
 def load_CRSP_stock_ciz(data_dir=DATA_DIR):
     path = Path(data_dir) / "CRSP_stock_ciz.parquet"
-    crsp = pd.read_parquet(path)
+    crsp = hot_tier.read_parquet(path)
+    # Files pulled before the schema normalization still hold plain strings
+    crsp = normalize_crsp_schema(crsp)
     return crsp
 
 
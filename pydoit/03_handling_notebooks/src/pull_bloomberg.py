@@ -1,36 +1,206 @@
 """
-This module loads the S&P 500 index, Dividend yields, and all active futures during 
-the given period from Bloomberg. 
+This module loads the S&P 500 index, Dividend yields, and all active futures during
+the given period from Bloomberg.
 
 You must have a Bloomberg terminal open on this computer to run. You must
-first install xbbg
+first install xbbg. Set BBG_MOCK=True to run it with the stand-in in
+`mock_blp.py` instead; its results are cached apart from real ones.
+
+Every history is asked for as a (ticker, field, start, end) tuple, and
+`bdh_batch`
+- splits off the part of each range from today on (see `split_open`): those
+  values, such as today's intraday px_last, can still change, so they are
+  downloaded on every call and never cached,
+- serves the closed parts it has downloaded before from BBG_CACHE_DIR (one
+  parquet file per tuple and `bdh` options),
+- gathers the others into one multi-ticker, multi-field `blp.bdh` call per
+  distinct set of fields, over the union of their date ranges, so that no
+  ticker-field pair is downloaded that was not asked for, and
+- stores each closed part's slice of the result. An empty or missing result
+  is returned with a warning, but not stored, so it is asked for again.
+The continuous futures series is spliced from its roll segments (SP1 Index
+until August 1997, ES1 Index after, see FUTURES_ROLLS) by `splice_rolls`.
 """
 
+import hashlib
+import json
+import os
+import warnings
+from collections import defaultdict
+
+import numpy as np
 import pandas as pd
-import settings
+from settings import config
 from pathlib import Path
 
-DATA_DIR = settings.DATA_DIR
-START_DATE = settings.START_DATE
-END_DATE = settings.END_DATE
+DATA_DIR = Path(config("DATA_DIR"))
+START_DATE = config("START_DATE")
+END_DATE = config("END_DATE")
+BBG_CACHE_DIR = Path(config("BBG_CACHE_DIR", default=DATA_DIR / "bloomberg_cache", cast=Path))
+BBG_MOCK = config("BBG_MOCK", default=False, cast=bool)
+
+## Segments of the continuous S&P 500 futures series: (ticker, first date,
+## last date), None for the start or end of the pull
+FUTURES_ROLLS = [
+    ("SP1 Index", None, "1997-08-31"),
+    ("ES1 Index", "1997-09-30", None),
+]
+
+
+def _request(ticker, field, start, end):
+    return (ticker, field, pd.Timestamp(start).strftime("%Y-%m-%d"), pd.Timestamp(end).strftime("%Y-%m-%d"))
+
+
+def _today():
+    return pd.Timestamp.today().normalize()
+
+
+def split_open(request, today):
+    """Split `request` at `today` (both "%Y-%m-%d") into the part before it,
+    whose history is closed, and the part from it on, whose values can still
+    change. Returns (closed, open), either None if that part is empty."""
+    ticker, field, start, end = request
+    if end < today:
+        return request, None
+    if start >= today:
+        return None, request
+    last_closed = (pd.Timestamp(today) - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+    return (ticker, field, start, last_closed), (ticker, field, today, end)
+
+
+def _cache_path(cache_dir, request, options):
+    key = json.dumps([*request, sorted(options.items())], default=str)
+    return Path(cache_dir) / f"{hashlib.sha256(key.encode()).hexdigest()}.parquet"
+
+
+def _store(path, series):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    series.rename("value").to_frame().to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def plan_calls(requests):
+    """Group (ticker, field, start, end) requests into `bdh` calls: one per
+    distinct set of fields, for the tickers that ask for exactly those
+    fields, from the earliest start to the latest end of their requests.
+    Returns (tickers, fields, start, end, requests) for each call."""
+    fields = defaultdict(set)
+    for ticker, field, _, _ in requests:
+        fields[ticker].add(field)
+    calls = defaultdict(list)
+    for request in requests:
+        calls[tuple(sorted(fields[request[0]]))].append(request)
+    return [
+        (
+            list(dict.fromkeys(ticker for ticker, _, _, _ in grouped)),
+            list(call_fields),
+            min(start for _, _, start, _ in grouped),
+            max(end for _, _, _, end in grouped),
+            grouped,
+        )
+        for call_fields, grouped in calls.items()
+    ]
+
+
+def bdh_batch(requests, blp=None, cache_dir=BBG_CACHE_DIR, **options):
+    """The history of each (ticker, field, start, end) in `requests`, as a
+    list of Series in the same order, from the cache or from as few `bdh`
+    calls as possible (see module docstring). `options` are passed to
+    `bdh` (e.g. `Per="M"`) and are part of the cache key."""
+    requests = [_request(*request) for request in requests]
+    today = _today().strftime("%Y-%m-%d")
+    parts = {request: split_open(request, today) for request in dict.fromkeys(requests)}
+    closed = [part for part, _ in parts.values() if part is not None]
+    tails = [part for _, part in parts.values() if part is not None]
+    results = {}
+    for request in dict.fromkeys(closed):
+        path = _cache_path(cache_dir, request, options)
+        if path.exists():
+            series = pd.read_parquet(path)["value"]
+            series.index = series.index.as_unit("ns")
+            results[request] = series
+
+    missing = [request for request in dict.fromkeys([*closed, *tails]) if request not in results]
+    if missing and blp is None:
+        from xbbg import blp
+    for tickers, fields, start, end, grouped in plan_calls(missing):
+        df = blp.bdh(tickers, fields, start, end, **options)
+        df.index = pd.to_datetime(df.index).as_unit("ns")
+        for request in grouped:
+            ticker, field, first, last = request
+            if (ticker, field) in df.columns:
+                series = df[(ticker, field)].loc[first:last].dropna().astype(float)
+            else:
+                series = pd.Series(dtype=float, index=pd.DatetimeIndex([], dtype="datetime64[ns]"))
+            series.index.name = "date"
+            if not series.empty and last < today:
+                _store(_cache_path(cache_dir, request, options), series)
+            results[request] = series
+
+    histories = {}
+    for request, request_parts in parts.items():
+        pieces = [results[part] for part in request_parts if part is not None]
+        found = [piece for piece in pieces if not piece.empty]
+        series = pd.concat(found) if found else pieces[0]
+        if series.empty:
+            ticker, field, first, last = request
+            warnings.warn(f"bdh returned no data for {ticker} {field} from {first} to {last}")
+        histories[request] = series
+    return [histories[request].rename(request[:2]) for request in requests]
+
+
+def splice_rolls(segments):
+    """One series from roll segments [(series, first date, last date), ...]
+    (None for an open end): on each date, the value of the last segment
+    that covers it. All segments are aligned on their dates and combined
+    with one `np.select`."""
+    frame = pd.concat([series for series, _, _ in segments], axis=1, ignore_index=True)
+    dates = frame.index
+    covered = [
+        (dates >= pd.Timestamp(first) if first is not None else np.ones(len(dates), bool))
+        & (dates <= pd.Timestamp(last) if last is not None else np.ones(len(dates), bool))
+        for _, first, last in segments
+    ]
+    values = np.select(covered[::-1], [frame[i].to_numpy() for i in reversed(range(len(segments)))], np.nan)
+    return pd.Series(values, index=dates).dropna()
+
+
+def pull_bbg_data(end_date=END_DATE, blp=None, cache_dir=BBG_CACHE_DIR):
+    rolls = [
+        (ticker, START_DATE if first is None else first, end_date if last is None else last)
+        for ticker, first, last in FUTURES_ROLLS
+    ]
+    dividend_yield, index, *futures = bdh_batch(
+        [
+            ("SPX Index", "EQY_DVD_YLD_12m", START_DATE, end_date),
+            ("SPX Index", "px_last", START_DATE, end_date),
+            *[(ticker, "px_last", first, last) for ticker, first, last in rolls],
+        ],
+        blp=blp,
+        cache_dir=cache_dir,
+    )
 
-def pull_bbg_data(end_date=END_DATE):
-    
     bbg_df = pd.DataFrame()
-    bbg_df['dividend yield'] = blp.bdh("SPX Index","EQY_DVD_YLD_12m", START_DATE, end_date)[("SPX Index","EQY_DVD_YLD_12m")]
-    
-    bbg_df['index'] = blp.bdh("SPX Index","px_last", START_DATE, end_date)[("SPX Index","px_last")]
-    
-    bbg_df['futures'] = pd.concat([blp.bdh("SP1 Index","px_last", START_DATE, "1997-08-31")[("SP1 Index","px_last")],
-                                    blp.bdh("ES1 Index","px_last", "1997-09-30", end_date)[("ES1 Index","px_last")]])
-    
+    bbg_df['dividend yield'] = dividend_yield
+
+    bbg_df['index'] = index
+
+    bbg_df['futures'] = splice_rolls(
+        [(series, first, last) for series, (_, first, last) in zip(futures, rolls)]
+    )
+
     bbg_df.index.name = 'Date'
 
     return bbg_df
 
 
 if __name__ == "__main__":
-    from xbbg import blp
-    df = pull_bbg_data(end_date=END_DATE)
+    if BBG_MOCK:
+        from mock_blp import LISTED, StandInBlp
+
+        df = pull_bbg_data(end_date=END_DATE, blp=StandInBlp(LISTED), cache_dir=BBG_CACHE_DIR / "mock")
+    else:
+        df = pull_bbg_data(end_date=END_DATE)
     path = Path(DATA_DIR) / "bloomberg.parquet"
-    df.to_parquet(path)
\ No newline at end of file
+    df.to_parquet(path)
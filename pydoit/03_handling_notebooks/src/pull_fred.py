@@ -1,13 +1,43 @@
-import pandas_datareader.data as web
+"""Pull series from FRED (Federal Reserve Economic Data) and derive the
+columns used by the repo charts (in $ billions, forward filled, with
+Gen_IORB and the ON/RRP and standing repo facility limits).
+
+`update_fred` pulls incrementally. It keeps the series as pulled in
+`fred_raw.parquet`, and on each run fetches each series only from
+FRED_REVISION_DAYS before its last observation, since recent observations
+are often revised. Fetched rows replace the stored ones on the dates they
+cover, and the derived columns are recomputed only from the first date on
+which an observation changed. Every file is written to a temporary file first and then
+moved into place, so an interrupted pull never leaves a partial file.
+
+The series are downloaded concurrently, FRED_MAX_WORKERS at a time, through
+one session (with the HTTP cache, see http_cache.py), and each CSV is parsed
+with pyarrow.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv
+from urllib3.util.retry import Retry
 
 from pathlib import Path
 from settings import config
 
+import hot_tier
+import http_cache
+
 DATA_DIR = Path(config("DATA_DIR"))
 START_DATE = config("START_DATE")
 END_DATE = config("END_DATE")
+## Days before the last observation of each series that are fetched again
+FRED_REVISION_DAYS = config("FRED_REVISION_DAYS", default=120, cast=int)
+FRED_CSV_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv"
+## Series downloaded at the same time
+FRED_MAX_WORKERS = config("FRED_MAX_WORKERS", default=6, cast=int)
 
 
 series_to_pull = {
@@ -79,20 +109,84 @@ manual_ONRRP_cntypty_limits = {  # in $ Billions
 }
 
 
-def pull_fred(start_date=START_DATE, end_date=END_DATE, ffill=True):
-    """
-    Lookup series code, e.g., like this:
-    https://fred.stlouisfed.org/series/RPONTSYD
-    """
-    df = web.DataReader(list(series_to_pull.keys()), "fred", start_date, end_date)
+def fetch_series(series_id, start_date, end_date, session):
+    """One FRED series between `start_date` and `end_date`, from the CSV
+    that the download button on the FRED website serves."""
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    response = session.get(
+        FRED_CSV_URL,
+        params={"id": series_id, "cosd": f"{start_date:%Y-%m-%d}", "coed": f"{end_date:%Y-%m-%d}"},
+        timeout=60,
+    )
+    response.raise_for_status()
+    # The header of the date column has changed over time, so the header row
+    # is skipped and the columns are named here
+    table = pyarrow.csv.read_csv(
+        pa.py_buffer(response.content),
+        read_options=pyarrow.csv.ReadOptions(skip_rows=1, column_names=["DATE", series_id]),
+        convert_options=pyarrow.csv.ConvertOptions(
+            column_types={"DATE": pa.timestamp("ns"), series_id: pa.float64()},
+            null_values=["."],
+        ),
+    )
+    series = pd.Series(
+        table.column(series_id).to_numpy(zero_copy_only=False),
+        index=pd.DatetimeIndex(table.column("DATE").to_numpy(), name="DATE"),
+        name=series_id,
+    )
+    return series.loc[start_date:end_date]
+
+
+def fetch_fred(start_dates, end_date, max_workers=FRED_MAX_WORKERS):
+    """The series in `start_dates` (a dict of series to the date to fetch
+    it from) up to `end_date`, in one DataFrame, downloading `max_workers`
+    series at a time."""
+    retry = Retry(
+        total=4, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504], allowed_methods=["GET"]
+    )
+    with (
+        http_cache.session(pool_connections=1, pool_maxsize=max_workers, max_retries=retry) as session,
+        ThreadPoolExecutor(max_workers=max_workers) as pool,
+    ):
+        series = list(pool.map(
+            lambda item: fetch_series(item[0], item[1], end_date, session), start_dates.items()
+        ))
+    df = pd.concat(series, axis=1, join="outer").sort_index()
+    return df.reindex(columns=list(start_dates))
 
+
+def derive_columns(df, ffill=True, previous=None):
+    """The repo chart columns, from the series as pulled from FRED.
+
+    `previous` is an earlier result of this function for the dates before
+    `df` starts; forward fills then carry on from its last row, so deriving
+    only the new rows gives the same result as deriving all of them.
+    """
+    df = df.copy()
     millions_to_billions = ["TREAST", "GFDEBTN", "WALCL", "WSDONTL"]
     for s in millions_to_billions:
         df[s] = df[s] / 1_000
 
+    # When IORB is missing, use excess reserve rate
+    df["Gen_IORB"] = df["IORB"].fillna(df["IOER"])
+    # df['Gen_DISCOUNT'] = df['DPCREDIT'].fillna(df['DISCOUNT'])
+
+    after = pd.Timestamp.min if previous is None else previous.index[-1]
+    df["ONRRP_CTPY_LIMIT"] = np.nan
+    for key in manual_ONRRP_cntypty_limits.keys():
+        date = pd.to_datetime(key)
+        if date > after:
+            df.loc[date, "ONRRP_CTPY_LIMIT"] = manual_ONRRP_cntypty_limits[key]
+    df["ONRP_AGG_LIMIT"] = np.nan
+    if pd.Timestamp("2021-Jul-28") > after:
+        df.loc["2021-Jul-28", "ONRP_AGG_LIMIT"] = 500
+    # The limits are set on dates that may not be in the index yet
+    df = df.sort_index()
+
     # forward_fill = ['DISCOUNT', 'OBFR', 'DPCREDIT', 'TREAST', 'TOTRESNS']
+    forward_fill = ["ONRRP_CTPY_LIMIT", "ONRP_AGG_LIMIT"]
     if ffill:
-        forward_fill = [
+        forward_fill += [
             "OBFR",
             "DPCREDIT",
             "TREAST",
@@ -103,27 +197,17 @@ def pull_fred(start_date=START_DATE, end_date=END_DATE, ffill=True):
             "RRPONTSYAWARD",
             "WSDONTL",
         ]
-        for s in forward_fill:
-            df[s] = df[s].ffill()
+    if previous is not None:
+        # Carry the last values of `previous` into the first rows of `df`
+        seed = previous.iloc[[-1]].reindex(columns=df.columns)
+        df[forward_fill] = pd.concat([seed[forward_fill], df[forward_fill]]).ffill().iloc[1:]
+    else:
+        df[forward_fill] = df[forward_fill].ffill()
 
     # fill_zeros = ['RRPONTSYD', 'RPONTSYD']
     # for s in fill_zeros:
     #     df[s] = df[s].fillna(0)
 
-    # When IORB is missing, use excess reserve rate
-    df["Gen_IORB"] = df["IORB"].fillna(df["IOER"])
-    # df['Gen_DISCOUNT'] = df['DPCREDIT'].fillna(df['DISCOUNT'])
-
-    df["ONRRP_CTPY_LIMIT"] = np.nan
-    for key in manual_ONRRP_cntypty_limits.keys():
-        date = pd.to_datetime(key)
-        df.loc[date, "ONRRP_CTPY_LIMIT"] = manual_ONRRP_cntypty_limits[key]
-    df["ONRRP_CTPY_LIMIT"] = df["ONRRP_CTPY_LIMIT"].ffill()
-
-    df["ONRP_AGG_LIMIT"] = np.nan
-    df.loc["2021-Jul-28", "ONRP_AGG_LIMIT"] = 500
-    df["ONRP_AGG_LIMIT"] = df["ONRP_AGG_LIMIT"].ffill()
-
     df_focused = df.drop(columns=["IORR", "IOER", "IORB"])
     # df_focused.isna().sum()
     # df_focused['WTREGEN'].plot()
@@ -131,12 +215,96 @@ def pull_fred(start_date=START_DATE, end_date=END_DATE, ffill=True):
     return df_focused
 
 
+def pull_fred(start_date=START_DATE, end_date=END_DATE, ffill=True):
+    """
+    Lookup series code, e.g., like this:
+    https://fred.stlouisfed.org/series/RPONTSYD
+    """
+    df = fetch_fred({series_id: start_date for series_id in series_to_pull}, end_date)
+    return derive_columns(df, ffill=ffill)
+
+
+def merge_revisions(stored, fetched, start_dates):
+    """`stored` with the rows of each series from its date in `start_dates`
+    on replaced by `fetched` (last write wins, including observations that
+    are missing in `fetched`)."""
+    columns = list(dict.fromkeys([*stored.columns, *fetched.columns]))
+    stored = stored.reindex(columns=columns)
+    index = stored.index.values[:, None]
+    starts = np.array(
+        [np.datetime64(pd.Timestamp(start_dates.get(c, pd.Timestamp.max))) for c in columns]
+    )
+    kept = stored.mask(index >= starts[None, :])
+    merged = fetched.reindex(columns=columns).combine_first(kept)
+    return merged.reindex(columns=columns).dropna(how="all")
+
+
+def _write_atomic(df, path, writer):
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    writer(df, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def update_fred(data_dir=DATA_DIR, end_date=None, revision_days=FRED_REVISION_DAYS):
+    """Update fred_raw.parquet, fred.parquet and fred.csv in `data_dir`
+    with the observations up to `end_date` (default: today).
+
+    Each series is fetched from `revision_days` before its last stored
+    observation (from START_DATE if it has none, e.g. if fred_raw.parquet
+    does not exist yet). Returns the derived DataFrame.
+    """
+    data_dir = Path(data_dir)
+    end_date = pd.Timestamp(end_date or pd.Timestamp.today().normalize())
+    raw_path, derived_path = data_dir / "fred_raw.parquet", data_dir / "fred.parquet"
+    if raw_path.exists() and derived_path.exists():
+        stored = pd.read_parquet(raw_path)
+        previous = pd.read_parquet(derived_path)
+    else:
+        stored = pd.DataFrame(index=pd.DatetimeIndex([], name="DATE"), dtype=float)
+        previous = None
+
+    start_dates = {}
+    for series_id in series_to_pull:
+        last = stored[series_id].last_valid_index() if series_id in stored else None
+        if last is None:
+            start_dates[series_id] = pd.Timestamp(START_DATE)
+        else:
+            start_dates[series_id] = max(last - timedelta(days=revision_days), pd.Timestamp(START_DATE))
+
+    fetched = fetch_fred(start_dates, end_date)
+    raw = merge_revisions(stored, fetched, start_dates).reindex(columns=list(series_to_pull))
+
+    # Derive only the rows from the first date where an observation changed
+    index = raw.index.union(stored.index)
+    new, old = raw.reindex(index), stored.reindex(index=index, columns=raw.columns)
+    changed = (new != old) & ~(new.isna() & old.isna())
+    changed_dates = index[changed.any(axis=1)]
+    if previous is None:
+        df = derive_columns(raw)
+    elif len(changed_dates) == 0:
+        df = previous
+    elif (previous.index < changed_dates[0]).any():
+        previous = previous.loc[previous.index < changed_dates[0]]
+        tail = derive_columns(raw.loc[raw.index >= changed_dates[0]], previous=previous)
+        df = pd.concat([previous, tail])
+    else:
+        df = derive_columns(raw)
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(raw, raw_path, pd.DataFrame.to_parquet)
+    _write_atomic(df, derived_path, pd.DataFrame.to_parquet)
+    _write_atomic(df, data_dir / "fred.csv", pd.DataFrame.to_csv)
+    return df
+
+
 def load_fred(data_dir=DATA_DIR):
     """
     Must first run this module as main to pull and save data.
+    Reads through the memory-mapped Arrow hot tier (see hot_tier.py).
     """
     file_path = Path(data_dir) / "fred.parquet"
-    df = pd.read_parquet(file_path)
+    df = hot_tier.read_parquet(file_path)
     # df = pd.read_csv(file_path, parse_dates=["DATE"])
     # df = df.set_index("DATE")
     return df
@@ -147,11 +315,4 @@ def demo():
 
 
 if __name__ == "__main__":
-
-    today = pd.Timestamp.today().strftime("%Y-%m-%d")
-    end_date = today
-    df = pull_fred(START_DATE, end_date)
-    filedir = Path(DATA_DIR) 
-    filedir.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(filedir / "fred.parquet")
-    df.to_csv(filedir / "fred.csv")
+    update_fred(DATA_DIR)
@@ -3,6 +3,7 @@
 import warnings
 import pandas_datareader.data as web
 
+import http_cache
 from settings import config
 
 DATA_DIR = config("DATA_DIR")
@@ -19,7 +20,11 @@ def pull_ken_french_data(start_date=START_DATE, end_date=END_DATE):
             message="The argument 'date_parser' is deprecated",
         )
         data = web.DataReader(
-            "25_Portfolios_OP_INV_5x5_daily", "famafrench", start=start_date, end=end_date
+            "25_Portfolios_OP_INV_5x5_daily",
+            "famafrench",
+            start=start_date,
+            end=end_date,
+            session=http_cache.session(),
         )
     return data
 
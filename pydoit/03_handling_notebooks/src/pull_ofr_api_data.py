@@ -2,27 +2,105 @@
 Pull from the short-term funding API
 Info here:
 https://www.financialresearch.gov/short-term-funding-monitor/api/
+
+The series are requested OFR_BATCH_SIZE at a time from the multi-series
+endpoint (`/series/multifull?mnemonics=A,B,...`), and any series a batch
+request rejects or leaves out is requested on its own from
+`/series/timeseries?mnemonic=A`. Requests run concurrently, by at most
+OFR_MAX_WORKERS threads sharing one `requests.Session`, so connections to the
+API are reused. Each request has a timeout and is retried with exponential
+backoff on connection errors, timeouts and 5xx responses. Responses are kept
+in the HTTP cache (see http_cache.py).
 """
 import pandas as pd
 import numpy as np
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+
+from urllib3.util.retry import Retry
+
+import http_cache
 from settings import config
 
-def pull_series_from_ofr_api(mnemonic=None):
+OFR_API_URL = "https://data.financialresearch.gov/v1"
+OFR_MAX_WORKERS = config("OFR_MAX_WORKERS", default=4, cast=int)
+## Series per multi-series request; 1 requests every series on its own
+OFR_BATCH_SIZE = config("OFR_BATCH_SIZE", default=50, cast=int)
+## (connect, read) timeout of each request, in seconds
+OFR_TIMEOUT = (5, 30)
+
+
+def make_session(pool_size=OFR_MAX_WORKERS, retries=4, backoff_factor=0.5):
+    """A session that keeps up to `pool_size` connections open and retries
+    failed requests `retries` times, waiting `backoff_factor * 2**n` seconds
+    before the n-th retry."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    return http_cache.session(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+
+def _get_timeseries(session, mnemonic, base_url=OFR_API_URL, timeout=OFR_TIMEOUT):
+    """The [date, value] pairs of one series."""
+    response = session.get(
+        f"{base_url}/series/timeseries", params={"mnemonic": mnemonic}, timeout=timeout
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _get_multifull(session, mnemonics, base_url=OFR_API_URL, timeout=OFR_TIMEOUT):
+    """The [date, value] pairs of each of `mnemonics` that the multi-series
+    endpoint returns. A batch the endpoint rejects (4xx) returns nothing."""
+    response = session.get(
+        f"{base_url}/series/multifull", params={"mnemonics": ",".join(mnemonics)}, timeout=timeout
+    )
+    if 400 <= response.status_code < 500:
+        return {}
+    response.raise_for_status()
+    points = {}
+    for mnemonic, series in response.json().items():
+        try:
+            points[mnemonic] = series["timeseries"]["aggregation"]
+        except (KeyError, TypeError):
+            continue
+    return {mnemonic: points[mnemonic] for mnemonic in mnemonics if mnemonic in points}
+
+
+def series_frame(points, series_list):
+    """A DataFrame with a column for each series in `series_list` (in that
+    order) and sorted dates, from `{mnemonic: [[date, value], ...]}`. All
+    series are parsed together, as one long table that is then pivoted."""
+    lengths = [len(points[mnemonic]) for mnemonic in series_list]
+    pairs = np.array(
+        [pair for mnemonic in series_list for pair in points[mnemonic]], dtype=object
+    ).reshape(-1, 2)
+    long = pd.DataFrame({
+        "Date": pd.to_datetime(pairs[:, 0]),
+        "mnemonic": np.repeat(series_list, lengths),
+        "value": pd.Series(pairs[:, 1], dtype=object).astype(float),
+    })
+    df = long.pivot(index="Date", columns="mnemonic", values="value")
+    df = df.reindex(columns=series_list).sort_index()
+    df.columns.name = None
+    return df
+
+
+def pull_series_from_ofr_api(mnemonic=None, session=None, base_url=OFR_API_URL, timeout=OFR_TIMEOUT):
     """
     An example:
     https://data.financialresearch.gov/v1/series/timeseries?mnemonic=REPO-TRI_AR_TOT-F
     """
-    df = pd.read_json(
-        f'https://data.financialresearch.gov/v1/series/timeseries?mnemonic={mnemonic}',
-                )
-    
-    df.columns=['Date', mnemonic]
-    df['Date'] = pd.to_datetime(df['Date'])
-    df = df.set_index('Date')
-    return df
+    if session is None:
+        with make_session(pool_size=1) as session:
+            return pull_series_from_ofr_api(mnemonic, session, base_url, timeout)
+    points = _get_timeseries(session, mnemonic, base_url, timeout)
+    return series_frame({mnemonic: points}, [mnemonic])
 
 series_descriptions = {
     'REPO-TRI_AR_OO-P': 'Tri-Party Average Rate: Overnight/Open (Preliminary)',
@@ -31,7 +109,7 @@ series_descriptions = {
     'REPO-DVP_AR_OO-P': 'DVP Service Average Rate: Overnight/Open (Preliminary)',
     # 'REPO-DVP_OV_OO-P': 'DVP Service Outstanding Volume: Overnight/Open (Preliminary)',
     'REPO-DVP_TV_OO-P': 'DVP Service Transaction Volume: Overnight/Open (Preliminary)',
-    'REPO-DVP_TV_TOT-P': 'DVP Service Transaction Volume: Total (Preliminary)',  
+    'REPO-DVP_TV_TOT-P': 'DVP Service Transaction Volume: Total (Preliminary)',
     'REPO-DVP_OV_TOT-P': 'DVP Service Outstanding Volume: Total (Preliminary)',
     'REPO-GCF_AR_OO-P': 'GCF Repo Service Average Rate: Overnight/Open (Preliminary)',
     'REPO-GCF_TV_OO-P': 'GCF Repo Service Transaction Volume: Overnight/Open (Preliminary)',
@@ -41,17 +119,41 @@ series_descriptions = {
     'FNYR-TGCR-A':'Tri-Party General Collateral Rate',
 }
 
-def pull_series_list(series_list = list(series_descriptions.keys())):
-    df_list = []
-    for s in series_list:
-        df = pull_series_from_ofr_api(mnemonic=s)
-        df_list.append(df)
-    df = pd.concat(df_list, axis=1)
-    return df
+def pull_series_list(
+    series_list = list(series_descriptions.keys()),
+    max_workers=OFR_MAX_WORKERS,
+    session=None,
+    base_url=OFR_API_URL,
+    timeout=OFR_TIMEOUT,
+    batch_size=OFR_BATCH_SIZE,
+):
+    """Pull the series in `series_list`, `batch_size` series per request
+    and `max_workers` requests at a time. Series that a batch request
+    rejects or leaves out are pulled one at a time. The columns are in the
+    order of `series_list` and the dates are sorted, no matter in which
+    order the downloads finish."""
+    if session is None:
+        with make_session(pool_size=max_workers) as session:
+            return pull_series_list(series_list, max_workers, session, base_url, timeout, batch_size)
+    points = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        if batch_size > 1:
+            batches = [
+                series_list[i : i + batch_size] for i in range(0, len(series_list), batch_size)
+            ]
+            for found in pool.map(
+                lambda batch: _get_multifull(session, batch, base_url, timeout), batches
+            ):
+                points.update(found)
+        missing = [mnemonic for mnemonic in series_list if mnemonic not in points]
+        points.update(zip(missing, pool.map(
+            lambda mnemonic: _get_timeseries(session, mnemonic, base_url, timeout), missing
+        )))
+    return series_frame(points, series_list)
 
 if __name__ == "__main__":
     df = pull_series_list(series_list = list(series_descriptions.keys()))
-    
+
     DATA_DIR = config("DATA_DIR")
     filedir = Path(DATA_DIR)
     filedir.mkdir(parents=True, exist_ok=True)
@@ -1,33 +1,145 @@
+"""The public repo panel: the FRED and OFR pulls side by side, with the
+derived columns that the charts and notebooks share (DERIVED_COLUMNS).
+
+`load_all` builds the panel once and keeps it
+- in memory, for the rest of the session, and
+- on disk, as an uncompressed Arrow IPC file (``public_repo_panel.arrow``
+  in DATA_DIR) that is memory mapped on load,
+both stamped with the size and modification time of ``fred.parquet`` and
+``ofr_public_repo_data.parquet``, and with the names and source of
+DERIVED_COLUMNS. When either file changes (e.g. after a new pull) or a
+derived column is added or changed, the panel is rebuilt on the next call. Pass `columns` to convert only
+the columns you use to pandas. Set PANEL_CACHE=false to rebuild the panel on
+every call.
+"""
+import hashlib
+import inspect
+import os
+import threading
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 
+import hot_tier
 import pull_fred
 import pull_ofr_api_data
 
-import os
 from pathlib import Path
 from settings import config
 OUTPUT_DIR = config("OUTPUT_DIR")
 DATA_DIR = config("DATA_DIR")
+PANEL_CACHE = config("PANEL_CACHE", default=True, cast=bool)
+
+SOURCES = ["fred.parquet", "ofr_public_repo_data.parquet"]
 
-def load_all(data_dir = DATA_DIR, normalize_timing=True):
+## Columns computed from the pulled series, in this order
+DERIVED_COLUMNS = {
+    "target_midpoint": lambda df: (df["DFEDTARU"] + df["DFEDTARL"]) / 2,
+    "SOFR_less_IORB": lambda df: df["SOFR"] - df["Gen_IORB"],
+    # Fed repo minus reverse repo volume
+    "net_fed_repo": lambda df: (df["RPONTSYD"] - df["RRPONTSYD"]) / 1000,
+    "Fed Balance Sheet over GDP": lambda df: df["WALCL"] / df["GDP"].ffill(),
+    # Total reserves among depository institutions vs currency in circulation
+    "Total Reserves over Currency": lambda df: df["TOTRESNS"] / df["CURRCIR"],
+    "Total Reserves over GDP": lambda df: df["TOTRESNS"] / df["GDP"],
+}
+
+_STAMP_KEY = b"public_repo_panel_stamp"
+_panels = {}
+_panels_lock = threading.Lock()
+
+
+def merge_all(data_dir=DATA_DIR, normalize_timing=True):
+    """The panel, built from the parquet files (no caching)."""
     data_dir = Path(data_dir)
     # df_bloomberg = pd.read_parquet(data_dir / 'bloomberg_repo_rates.parquet')
-    df_fred = pd.read_parquet(data_dir / 'fred.parquet')
-    df_ofr_api = pd.read_parquet(data_dir / 'ofr_public_repo_data.parquet')
+    df_fred = hot_tier.read_parquet(data_dir / 'fred.parquet')
+    df_ofr_api = hot_tier.read_parquet(data_dir / 'ofr_public_repo_data.parquet')
     # df_bloomberg.index.name = 'DATE'
     df_ofr_api.index.name = 'DATE'
-    
+
     df = pd.concat([df_fred, df_ofr_api], axis=1)
     if normalize_timing:
         # Normalize end-of-day vs start-of-day difference
         df.loc['2016-12-14', ['DFEDTARU', 'DFEDTARL']] = df.loc['2016-12-13', ['DFEDTARU', 'DFEDTARL']]
         df.loc['2015-12-16', ['DFEDTARU', 'DFEDTARL']] = df.loc['2015-12-15', ['DFEDTARU', 'DFEDTARL']]
-    return df
+    return df.assign(**{name: derive(df) for name, derive in DERIVED_COLUMNS.items()})
+
+
+def panel_path(data_dir=DATA_DIR, normalize_timing=True):
+    """Path of the stored panel."""
+    name = "public_repo_panel.arrow" if normalize_timing else "public_repo_panel_raw_timing.arrow"
+    return Path(data_dir) / name
+
+
+def _stamp(data_dir, normalize_timing):
+    stats = [(Path(data_dir) / source).stat() for source in SOURCES]
+    code = hashlib.sha256(repr(normalize_timing).encode())
+    for name, derive in DERIVED_COLUMNS.items():
+        code.update(name.encode())
+        code.update(inspect.getsource(derive).encode())
+    sources = ";".join(f"{stat.st_size}:{stat.st_mtime_ns}" for stat in stats)
+    return f"{sources};{code.hexdigest()}".encode()
+
+
+def _build(data_dir, normalize_timing, stamp):
+    table = pa.Table.from_pandas(merge_all(data_dir, normalize_timing))
+    table = table.replace_schema_metadata({**table.schema.metadata, _STAMP_KEY: stamp})
+    path = panel_path(data_dir, normalize_timing)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    try:
+        os.replace(tmp_path, path)
+    except PermissionError:
+        # Windows doesn't replace a file that is memory mapped, here by a
+        # DataFrame still holding the old panel or by another process. Use
+        # the new panel without storing it; it is stored on a later call.
+        os.remove(tmp_path)
+    return table
+
+
+def load_table(data_dir=DATA_DIR, normalize_timing=True):
+    """The panel as a pyarrow Table, from memory, from disk, or built from
+    the parquet files, whichever is the first that is up to date."""
+    data_dir = Path(data_dir).resolve()
+    stamp = _stamp(data_dir, normalize_timing)
+    key = (data_dir, normalize_timing)
+    with _panels_lock:
+        table = _panels.get(key)
+        if table is not None and table.schema.metadata[_STAMP_KEY] == stamp:
+            return table
+        # Release the memory map of the stored panel before replacing it
+        _panels.pop(key, None)
+        path = panel_path(data_dir, normalize_timing)
+        table = None
+        if path.exists():
+            table = feather.read_table(path, memory_map=True)
+            if (table.schema.metadata or {}).get(_STAMP_KEY) != stamp:
+                table = None
+        if table is None:
+            table = _build(data_dir, normalize_timing, stamp)
+        _panels[key] = table
+        return table
+
+
+def load_all(data_dir = DATA_DIR, normalize_timing=True, columns=None):
+    """The panel, indexed by DATE, with the columns in `columns` (all of
+    them if None). Each call returns a new DataFrame, so callers can add or
+    change columns without affecting the cached panel."""
+    if not PANEL_CACHE:
+        df = merge_all(data_dir, normalize_timing)
+        return df if columns is None else df[list(columns)]
+    table = load_table(data_dir, normalize_timing)
+    if columns is not None:
+        index = [name for name in table.schema.pandas_metadata["index_columns"] if isinstance(name, str)]
+        table = table.select([*index, *columns])
+    return table.to_pandas()
 
 _descriptions_1 = pull_fred.series_descriptions
 _descriptions = pull_ofr_api_data.series_descriptions
 series_descriptions = {
-    **_descriptions_1, 
+    **_descriptions_1,
     **_descriptions,
     }
 
@@ -35,4 +147,4 @@ if __name__ == "__main__":
     df = load_all()
     df[['DFEDTARU', 'DFEDTARL']].rename(columns=series_descriptions).plot()
     # df['BGCR'].plot()
-    # df.loc['2019', :]
\ No newline at end of file
+    # df.loc['2019', :]
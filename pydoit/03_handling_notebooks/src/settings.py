@@ -18,13 +18,29 @@ over to the other configuration, for example.
 
 """
 
+from datetime import date, datetime
 from pathlib import Path
 
 ## Helper for determining OS
 from platform import system
 
 from decouple import config as _config
-from pandas import to_datetime
+
+
+def to_datetime(value):
+    """Parse a date such as "2024-01-01" into a `datetime`.
+
+    The standard library is enough for the ISO dates used in `.env` files,
+    and unlike `pandas.to_datetime` it does not make every `import settings`
+    (and so every task that imports it) pay for importing pandas.
+    `datetime` is also what `pd.Timestamp` subclasses, so the result can be
+    used anywhere a timestamp is expected.
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value).strip())
 
 
 def get_os():
@@ -63,6 +79,10 @@ def if_relative_make_abs(path):
 
 d = {}
 
+## Values looked up through decouple by `config`, so that each is only
+## looked up and cast once
+_resolved = {}
+
 d["OS_TYPE"] = get_os()
 
 # Absolute path to root directory of the project
@@ -113,7 +133,13 @@ def config(*args, **kwargs):
     else:
         # If the variable is not defined in the settings.py file,
         # then fall back to using decouple normally.
-        var = _config(*args, **kwargs)
+        try:
+            cache_key = (args, tuple(sorted(kwargs.items())))
+            var = _resolved[cache_key]
+        except TypeError:
+            var = _config(*args, **kwargs)
+        except KeyError:
+            var = _resolved[cache_key] = _config(*args, **kwargs)
     return var
 
 
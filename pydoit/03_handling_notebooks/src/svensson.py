@@ -0,0 +1,130 @@
+"""Evaluate the Svensson (1994) yield curve from the parameters the Fed
+publishes with the Gurkaynak, Sack, and Wright (2007) curve.
+
+`feds200628.csv` has, for each day, the parameters `BETA0`..`BETA3`, `TAU1`
+and `TAU2` (see `load_fed_yield_curve.SVENSSON_COLUMNS`). From them, the
+zero coupon yield at a maturity of m years is
+
+    y(m) = BETA0
+           + BETA1 * (1 - exp(-m/TAU1)) / (m/TAU1)
+           + BETA2 * [(1 - exp(-m/TAU1)) / (m/TAU1) - exp(-m/TAU1)]
+           + BETA3 * [(1 - exp(-m/TAU2)) / (m/TAU2) - exp(-m/TAU2)]
+
+in percent, continuously compounded (as `SVENYxx`). Before 1980 the curve
+is Nelson-Siegel: BETA3 and TAU2 are missing and that term is dropped.
+
+Every function takes the parameters for n dates (a DataFrame with those
+columns, or a dict of arrays) and maturities in years, either one grid of
+shape (k,) shared by all dates or exact maturities of shape (n, k), and
+evaluates all of them at once, broadcasting the parameters over the
+maturities. There is no loop over dates: zero yields for the whole
+history on a monthly grid to 30 years (17,000 x 360) take about half a
+second, par yields about a second.
+
+Example
+-------
+```
+>>> params = load_fed_yield_curve.read_fed_yield_curve(path, SVENSSON_COLUMNS)
+>>> zeros = svensson.curve(params, np.arange(1, 361) / 12)
+>>> discount = svensson.discount_factors(params, cash_flow_years)
+```
+"""
+
+import numpy as np
+import pandas as pd
+
+PARAMETERS = ["BETA0", "BETA1", "BETA2", "BETA3", "TAU1", "TAU2"]
+
+
+def _parameters(params):
+    """The parameters as arrays of shape (n, 1), so that they broadcast over
+    a grid of maturities."""
+    beta0, beta1, beta2, beta3, tau1, tau2 = (
+        np.asarray(params[name], dtype=float).reshape(-1, 1) for name in PARAMETERS
+    )
+    # Nelson-Siegel days: no second hump
+    no_hump = np.isnan(beta3) | (beta3 == 0)
+    beta3 = np.where(no_hump, 0.0, beta3)
+    tau2 = np.where(no_hump, 1.0, tau2)
+    return beta0, beta1, beta2, beta3, tau1, tau2
+
+
+def _loadings(maturities, tau):
+    """(1 - exp(-x)) / x and exp(-x) for x = maturities / tau, with the
+    first equal to 1 at a maturity of 0."""
+    x = maturities / tau
+    decay = np.exp(-x)
+    level = np.divide(-np.expm1(-x), x, out=np.ones(np.broadcast(x, decay).shape), where=x != 0)
+    return level, decay
+
+
+def zero_yields(params, maturities):
+    """Zero coupon yields, in percent, continuously compounded."""
+    beta0, beta1, beta2, beta3, tau1, tau2 = _parameters(params)
+    maturities = np.asarray(maturities, dtype=float)
+    level1, decay1 = _loadings(maturities, tau1)
+    level2, decay2 = _loadings(maturities, tau2)
+    return beta0 + beta1 * level1 + beta2 * (level1 - decay1) + beta3 * (level2 - decay2)
+
+
+def forward_rates(params, maturities):
+    """Instantaneous forward rates, in percent, continuously compounded."""
+    beta0, beta1, beta2, beta3, tau1, tau2 = _parameters(params)
+    maturities = np.asarray(maturities, dtype=float)
+    x1 = maturities / tau1
+    x2 = maturities / tau2
+    return beta0 + (beta1 + beta2 * x1) * np.exp(-x1) + beta3 * x2 * np.exp(-x2)
+
+
+def discount_factors(params, maturities):
+    """Prices of zero coupon bonds paying 1, `maturities` years out."""
+    maturities = np.asarray(maturities, dtype=float)
+    return np.exp(-zero_yields(params, maturities) / 100 * maturities)
+
+
+def par_yields(params, maturities):
+    """Coupon-equivalent par yields, in percent: the coupon, paid
+    semiannually, that prices a bond maturing in `maturities` years at par
+    (net of accrued interest). Maturities must be one grid of shape (k,),
+    >= 0; at a maturity of 0 the par yield is its limit as the maturity
+    goes to 0.
+
+    The discount factors are evaluated once for each distinct coupon date
+    of the grid, and summed into annuities with one matrix product."""
+    maturities = np.asarray(maturities, dtype=float)
+    if maturities.ndim != 1:
+        raise ValueError("par_yields takes one grid of maturities, of shape (k,)")
+    if (maturities < 0).any():
+        raise ValueError("par_yields takes maturities >= 0")
+    # Coupon dates, every half year back from each maturity
+    coupons = maturities[:, None] - np.arange(max(1, int(np.ceil(2 * maturities.max())))) / 2
+    paid = coupons > 1e-9
+    dates, position = np.unique(np.round(coupons[paid], 9), return_inverse=True)
+    schedule = np.zeros((len(dates), len(maturities)))
+    schedule[position, np.nonzero(paid)[0]] = 1.0
+    annuity = discount_factors(params, dates) @ schedule
+    # Fraction of the current coupon period that has accrued
+    first_coupon = np.where(paid, coupons, np.inf).min(axis=1)
+    accrued = 1 - 2 * first_coupon
+    principal = discount_factors(params, maturities)
+    par = 200 * (1 - principal) / (annuity - accrued)
+    # No coupon is left at a maturity of 0. As m -> 0, 1 - principal ~ y m
+    # and annuity - accrued ~ (2 - y) m, with y the zero yield at 0
+    short = zero_yields(params, maturities)
+    return np.where(paid.any(axis=1), par, 200 * short / (200 - short))
+
+
+_KINDS = {
+    "zero": zero_yields,
+    "par": par_yields,
+    "forward": forward_rates,
+    "discount": discount_factors,
+}
+
+
+def curve(params, maturities, kind="zero"):
+    """A DataFrame of `kind` ("zero", "par", "forward" or "discount") with a
+    row for each date of `params` and a column for each maturity of the
+    grid `maturities`."""
+    values = _KINDS[kind](params, maturities)
+    return pd.DataFrame(values, index=params.index, columns=pd.Index(maturities, name="maturity"))
@@ -0,0 +1,146 @@
+"""doit actions that run other doit actions.
+
+`ActionGroup` runs a list of actions, given like the ``"actions"`` of a task
+(command strings, callables, ``(func, args, kwargs)`` tuples or doit action
+objects), as a single action: one after the other, stopping at the first
+that fails, as doit does for the actions of a task. Subclasses wrap the
+group in what it needs:
+
+- `ResourceActions` holds resource slots while the actions run (see
+  ``with_resources`` in dodo.py),
+- `build_cache.CachedActions` restores the targets from the build cache
+  instead of running the actions, and
+- `task_telemetry.MeasuredAction` records the time and memory an action uses.
+
+The actions in a group are created by doit itself
+(`doit.action.create_action`), so they capture output, follow `--verbosity`
+and report failures like the actions of any other task. A group is
+picklable as long as its actions are (command strings and module-level
+functions, not closures), so tasks that use one also run with
+``doit -P process`` under the "spawn" start method, the default on macOS and
+Windows.
+"""
+
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from doit.action import BaseAction, create_action
+from doit.exceptions import BaseFail
+
+
+class ActionGroup(BaseAction):
+    """Run `actions` one after the other, as a single doit action."""
+
+    def __init__(self, actions):
+        self.specs = list(actions)
+        self.task = None  # Set by doit when the task is created
+        self.out = None
+        self.err = None
+        self.result = None
+        self.values = {}
+        self._actions = None
+
+    def __getstate__(self):
+        # The actions are created again in the process that runs them
+        state = self.__dict__.copy()
+        state["_actions"] = None
+        return state
+
+    @property
+    def actions(self):
+        """The doit action objects of `specs`, created on first use."""
+        if self._actions is None:
+            self._actions = [create_action(spec, self.task, "actions") for spec in self.specs]
+        return self._actions
+
+    def run_actions(self, out=None, err=None):
+        """Execute the actions until one fails. Returns the failure (a
+        TaskFailed or TaskError) or None, like the `execute` of an action."""
+        self.result = None
+        self.values = {}
+        outs, errs = [], []
+        try:
+            for action in self.actions:
+                failure = action.execute(out, err)
+                outs.append(action.out or "")
+                errs.append(action.err or "")
+                if isinstance(failure, BaseFail):
+                    return failure
+                self.result = action.result
+                self.values.update(action.values)
+        finally:
+            self.out = "".join(outs)
+            self.err = "".join(errs)
+        return None
+
+    def execute(self, out=None, err=None):
+        return self.run_actions(out, err)
+
+    def __str__(self):
+        return "; ".join(str(action) for action in self.actions)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.specs!r}>"
+
+
+##############################
+## Resource slots
+##############################
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _try_lock(lock_file):
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+else:
+    import fcntl
+
+    def _try_lock(lock_file):
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+
+@contextmanager
+def resource_slot(tag, limit, lock_dir):
+    """Wait for one of the `limit` slots of `tag` in `lock_dir` to be free
+    and hold it until the block exits."""
+    lock_dir = Path(lock_dir)
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    while True:
+        for slot in range(limit):
+            lock_file = open(lock_dir / f"{tag}-{slot}.lock", "a")
+            if _try_lock(lock_file):
+                try:
+                    yield
+                finally:
+                    lock_file.close()  # Closing the file releases the lock
+                return
+            lock_file.close()
+        time.sleep(0.5)
+
+
+class ResourceActions(ActionGroup):
+    """Run `actions` while holding a slot of each resource in `limits`
+    ({tag: number of slots}). Slots are lock files in `lock_dir`, so they are
+    shared by all worker processes and released even if a worker dies."""
+
+    def __init__(self, actions, limits, lock_dir):
+        super().__init__(actions)
+        self.limits = dict(limits)
+        self.lock_dir = Path(lock_dir)
+
+    def execute(self, out=None, err=None):
+        with ExitStack() as stack:
+            # Acquire in a fixed order, so two tasks can't deadlock
+            for tag in sorted(self.limits):
+                stack.enter_context(resource_slot(tag, self.limits[tag], self.lock_dir))
+            return self.run_actions(out, err)
@@ -0,0 +1,519 @@
+"""Record how long each doit task takes, and how much CPU and memory it uses.
+
+`TelemetryReporter` is a doit reporter (use it with
+``DOIT_CONFIG = {"reporter": TelemetryReporter}``) that writes one row per
+task and one row per action of every `doit` run to TELEMETRY_DB, a sqlite
+file next to doit's own dependency database:
+
+- `runs`: when each `doit` run started and finished.
+- `tasks`: the status of every task in the run (run, up-to-date, ignored or
+  failed), its wall time and the tasks it depends on (its `task_dep` and the
+  tasks whose targets are in its `file_dep`).
+- `actions`: for every action that ran, its wall time, CPU time (of the
+  worker process and of its child processes), peak RSS of its child
+  processes and exit status (0 on success, the return code of a failed
+  command, 1 for other failures). The actions of groups, such as the
+  resource-tagged and cached tasks in dodo.py (see ./src/task_actions.py),
+  get a row each.
+
+Actions are measured in the process that runs them, so this works with
+`doit -n 4 -P process` too. The peak RSS of child processes is sampled from
+`/proc` while an action runs, which also covers long-running children such
+as notebook kernels; elsewhere it falls back to the largest child process
+that exited, as reported by `getrusage`. Where neither is available (the
+`resource` module is POSIX-only) the peak RSS is not recorded. Children that
+serve several actions, like the kernels of ./src/notebook_runner.py's pool,
+are registered with `share_process`: an action is charged only for the CPU
+they use and the memory they grow by while it runs.
+
+Run this module on its own to see the slowest tasks of the last run, its
+critical path and how the slowest tasks' wall time changed across runs:
+
+    python ./src/task_telemetry.py --runs 5
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from doit.action import CmdAction
+from doit.exceptions import BaseFail
+from doit.reporter import ConsoleReporter
+
+from task_actions import ActionGroup
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TELEMETRY_DB = Path(".doit-telemetry.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id INTEGER,
+    task TEXT,
+    status TEXT,
+    started REAL,
+    wall REAL,
+    deps TEXT
+);
+CREATE TABLE IF NOT EXISTS actions (
+    run_id INTEGER,
+    task TEXT,
+    position INTEGER,
+    action TEXT,
+    started REAL,
+    wall REAL,
+    cpu REAL,
+    child_cpu REAL,
+    peak_child_rss_mb REAL,
+    exit_status INTEGER
+);
+"""
+
+
+def connect(db_path=TELEMETRY_DB):
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+def _insert(db_path, table, row):
+    with connect(db_path) as con:
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" * len(row))
+        con.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", list(row.values()))
+
+
+##############################
+## Measuring a single action
+##############################
+
+_HAS_PROC = Path("/proc/self/stat").exists()
+if _HAS_PROC:
+    _CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _process_table():
+    """{pid: (parent pid, CPU seconds, RSS bytes)} of all processes in /proc."""
+    table = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue  # The process exited
+        # Fields after the command name, which is in parentheses
+        fields = stat[stat.rindex(")") + 2 :].split()
+        cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+        table[int(entry.name)] = (int(fields[1]), cpu, int(fields[21]) * _PAGE_SIZE)
+    return table
+
+
+def _descendants(table, pid):
+    children = {}
+    for child, (parent, _, _) in table.items():
+        children.setdefault(parent, []).append(child)
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+## Child processes that outlive the action that started them
+_SHARED_PIDS = set()
+
+
+def share_process(pid):
+    """Register `pid`, a child process of this one that serves several
+    actions (e.g. a pooled notebook kernel). Its CPU time and RSS from before
+    an action are not charged to that action."""
+    _SHARED_PIDS.add(pid)
+
+
+class ChildSampler(threading.Thread):
+    """Sample the child processes of this process until `stop()` is called.
+
+    Keeps the peak of their combined RSS, and the CPU time used during the
+    sampling by children that are still running at the end (children that
+    exited and were waited for are counted by `os.times()` instead). Shared
+    children (see `share_process`) only count with the RSS and CPU time they
+    added since they were first sampled.
+    """
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss = 0
+        self.live_cpu = 0.0
+        self._start_cpu = {}
+        self._start_rss = {}
+        self._last_cpu = {}
+        self._stopped = threading.Event()
+        if _HAS_PROC:
+            self._sample(baseline=True)
+
+    def _sample(self, baseline=False):
+        table = _process_table()
+        pids = _descendants(table, os.getpid())
+        rss = 0
+        for pid in pids:
+            if pid in _SHARED_PIDS:
+                rss += max(0, table[pid][2] - self._start_rss.setdefault(pid, table[pid][2]))
+            else:
+                rss += table[pid][2]
+        self.peak_rss = max(self.peak_rss, rss)
+        self._last_cpu = {pid: table[pid][1] for pid in pids}
+        for pid, cpu in self._last_cpu.items():
+            # Children started during the action used no CPU before it
+            self._start_cpu.setdefault(pid, cpu if baseline or pid in _SHARED_PIDS else 0.0)
+
+    def run(self):
+        while _HAS_PROC and not self._stopped.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        if _HAS_PROC:
+            self._sample()
+        self.live_cpu = sum(
+            cpu - self._start_cpu[pid] for pid, cpu in self._last_cpu.items()
+        )
+
+
+def _max_child_rss():
+    """Largest RSS (bytes) of any child process that exited so far, 0 if
+    `getrusage` is not available."""
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def exit_status(result):
+    """0 for a successful action, else the return code of a failed `Command`
+    or 1."""
+    if not isinstance(result, BaseFail):
+        return 0
+    return getattr(result, "returncode", None) or 1
+
+
+class Command(CmdAction):
+    """A doit command action whose failure keeps the command's return code,
+    as `returncode` (doit only puts it in the message)."""
+
+    def _print_process_output(self, process, input_, capture, realtime):
+        self._process = process
+        super()._print_process_output(process, input_, capture, realtime)
+
+    def execute(self, out=None, err=None):
+        self._process = None
+        failure = super().execute(out, err)
+        # Only known if the output was captured, which it is unless the
+        # task sets "io": {"capture": False}
+        if isinstance(failure, BaseFail) and self._process is not None:
+            failure.returncode = self._process.returncode
+        self._process = None
+        return failure
+
+
+class MeasuredAction(ActionGroup):
+    """A doit action (anything a task's ``"actions"`` can hold) that calls
+    ``record(started, wall, cpu, child_cpu, peak_child_rss, result)`` after
+    it runs. `peak_child_rss` is None where it cannot be measured."""
+
+    def __init__(self, action, record):
+        if isinstance(action, (str, list)):
+            action = Command(action, shell=isinstance(action, str))
+        super().__init__([action])
+        self.record = record
+
+    def execute(self, out=None, err=None):
+        sampler = ChildSampler()
+        sampler.start()
+        max_child_rss = _max_child_rss()
+        times = os.times()
+        started, start = time.time(), time.perf_counter()
+        result = None
+        try:
+            result = self.run_actions(out, err)
+            return result
+        finally:
+            wall = time.perf_counter() - start
+            end_times = os.times()
+            sampler.stop()
+            cpu = (end_times.user - times.user) + (end_times.system - times.system)
+            child_cpu = (
+                (end_times.children_user - times.children_user)
+                + (end_times.children_system - times.children_system)
+                + sampler.live_cpu
+            )
+            # ru_maxrss only grows, so it only tells about this action if it did
+            exited_rss = _max_child_rss()
+            peak_child_rss = max(
+                sampler.peak_rss, exited_rss if exited_rss > max_child_rss else 0
+            ) if _HAS_PROC or resource is not None else None
+            self.record(started, wall, cpu, child_cpu, peak_child_rss, result)
+
+
+class ActionRecorder:
+    """The `record` of a `MeasuredAction`: inserts a row into the `actions`
+    table. A class rather than a closure, so that worker processes can
+    unpickle it."""
+
+    def __init__(self, db_path, run_id, task, position, action):
+        self.db_path = db_path
+        self.run_id = run_id
+        self.task = task
+        self.position = position
+        self.action = action
+
+    def __call__(self, started, wall, cpu, child_cpu, peak_child_rss, result):
+        _insert(
+            self.db_path,
+            "actions",
+            {
+                "run_id": self.run_id,
+                "task": self.task,
+                "position": self.position,
+                "action": self.action,
+                "started": started,
+                "wall": wall,
+                "cpu": cpu,
+                "child_cpu": child_cpu,
+                "peak_child_rss_mb": peak_child_rss / 1e6 if peak_child_rss is not None else None,
+                "exit_status": exit_status(result),
+            },
+        )
+
+
+##############################
+## Reporter
+##############################
+
+
+def task_deps(tasks):
+    """{task name: names of the tasks it depends on}"""
+    target_owner = {}
+    for task in tasks.values():
+        for target in task.targets:
+            target_owner[str(target)] = task.name
+    return {
+        task.name: sorted(
+            set(task.task_dep)
+            | {target_owner[dep] for dep in task.file_dep if dep in target_owner}
+        )
+        for task in tasks.values()
+    }
+
+
+class TelemetryReporter(ConsoleReporter):
+    """Console reporter that also records task and action telemetry."""
+
+    db_path = TELEMETRY_DB
+
+    def __init__(self, outstream, options):
+        super().__init__(outstream, options)
+        self.run_id = None
+        self._deps = {}
+        self._started = {}
+
+    def _insert(self, table, row):
+        _insert(self.db_path, table, row)
+
+    def _record_task(self, task, status):
+        started = self._started.pop(task.name, None)
+        self._insert(
+            "tasks",
+            {
+                "run_id": self.run_id,
+                "task": task.name,
+                "status": status,
+                "started": started,
+                "wall": time.time() - started if started is not None else None,
+                "deps": json.dumps(self._deps.get(task.name, [])),
+            },
+        )
+
+    def _measured(self, task, specs, actions, positions):
+        """`specs` (and the specs of groups among them, in place) with each
+        action wrapped in a MeasuredAction."""
+        wrapped = []
+        for spec, action in zip(specs, actions):
+            if isinstance(action, ActionGroup):
+                action.specs = self._measured(task, action.specs, action.actions, positions)
+                action._actions = None
+                wrapped.append(action)
+            else:
+                recorder = ActionRecorder(self.db_path, self.run_id, task.name, next(positions), str(action))
+                wrapped.append(MeasuredAction(spec, recorder))
+        return wrapped
+
+    def _measure_actions(self, task):
+        # Replace the actions doit creates the task's action objects from, as
+        # the action objects themselves aren't sent to worker processes
+        task._actions = self._measured(task, task._actions, task.actions, itertools.count())
+        task._action_instances = None
+
+    def initialize(self, tasks, selected_tasks):
+        super().initialize(tasks, selected_tasks)
+        with connect(self.db_path) as con:
+            self.run_id = con.execute(
+                "INSERT INTO runs (started) VALUES (?)", [time.time()]
+            ).lastrowid
+        self._deps = task_deps(tasks)
+        # Before the tasks are sent to worker processes
+        for task in tasks.values():
+            self._measure_actions(task)
+
+    def execute_task(self, task):
+        super().execute_task(task)
+        self._started[task.name] = time.time()
+
+    def add_success(self, task):
+        super().add_success(task)
+        self._record_task(task, "run")
+
+    def add_failure(self, task, fail):
+        super().add_failure(task, fail)
+        self._record_task(task, "failed")
+
+    def skip_uptodate(self, task):
+        super().skip_uptodate(task)
+        self._record_task(task, "up-to-date")
+
+    def skip_ignore(self, task):
+        super().skip_ignore(task)
+        self._record_task(task, "ignored")
+
+    def complete_run(self):
+        if self.run_id is not None:
+            with connect(self.db_path) as con:
+                con.execute(
+                    "UPDATE runs SET finished = ? WHERE run_id = ?", [time.time(), self.run_id]
+                )
+        super().complete_run()
+
+
+##############################
+## Report
+##############################
+
+
+def critical_path(walls, deps):
+    """Longest chain of dependent tasks, weighted by wall time.
+
+    `walls` is {task: wall seconds} of the tasks in a run (0 for tasks that
+    did not run), `deps` is {task: [tasks it depends on]}.
+    Returns (total seconds, [tasks in the order they ran]).
+    """
+    finish = {}
+
+    def finish_time(task):
+        if task not in finish:
+            finish[task] = (0.0, [])  # Guards against cycles
+            before = [finish_time(dep) for dep in deps.get(task, []) if dep in walls]
+            total, path = max(before, default=(0.0, []), key=lambda item: item[0])
+            finish[task] = (total + walls[task], [*path, task])
+        return finish[task]
+
+    total, path = max(
+        (finish_time(task) for task in walls), default=(0.0, []), key=lambda item: item[0]
+    )
+    return total, [task for task in path if walls[task] > 0]
+
+
+def report(db_path=TELEMETRY_DB, runs=5, top=10):
+    """Print the slowest tasks and critical path of the last run, and the
+    wall time of those tasks over the last `runs` runs."""
+    with connect(db_path) as con:
+        run_ids = [
+            row[0]
+            for row in con.execute(
+                "SELECT run_id FROM runs WHERE run_id IN (SELECT run_id FROM tasks) "
+                "ORDER BY run_id DESC LIMIT ?",
+                [runs],
+            )
+        ][::-1]
+        if not run_ids:
+            print(f"No runs recorded in {db_path}")
+            return
+        last_run = run_ids[-1]
+
+        slowest = con.execute(
+            """
+            SELECT t.task, t.status, t.wall, SUM(a.cpu), SUM(a.child_cpu),
+                   MAX(a.peak_child_rss_mb), MAX(a.exit_status)
+            FROM tasks t LEFT JOIN actions a ON a.run_id = t.run_id AND a.task = t.task
+            WHERE t.run_id = ? AND t.wall IS NOT NULL
+            GROUP BY t.task ORDER BY t.wall DESC LIMIT ?
+            """,
+            [last_run, top],
+        ).fetchall()
+        task_rows = con.execute(
+            "SELECT task, COALESCE(wall, 0), deps FROM tasks WHERE run_id = ?", [last_run]
+        ).fetchall()
+        trends = {
+            (task, run_id): wall
+            for task, run_id, wall in con.execute(
+                f"SELECT task, run_id, wall FROM tasks WHERE wall IS NOT NULL "
+                f"AND run_id IN ({', '.join('?' * len(run_ids))})",
+                run_ids,
+            )
+        }
+
+    print(f"Slowest tasks of run {last_run}")
+    print(f"{'task':<45} {'status':>7} {'wall (s)':>9} {'cpu (s)':>8} "
+          f"{'child cpu (s)':>14} {'child RSS (MB)':>15} {'exit':>5}")
+    for task, status, wall, cpu, child_cpu, rss, exit_code in slowest:
+        rss = f"{rss:>15.1f}" if rss is not None else f"{'-':>15}"
+        print(f"{task:<45} {status:>7} {wall:>9.2f} {cpu or 0:>8.2f} "
+              f"{child_cpu or 0:>14.2f} {rss} {exit_code or 0:>5}")
+
+    walls = {task: wall for task, wall, _ in task_rows}
+    deps = {task: json.loads(task_deps) for task, _, task_deps in task_rows}
+    total, path = critical_path(walls, deps)
+    print(f"\nCritical path of run {last_run}: {total:.2f}s")
+    for task in path:
+        print(f"  {walls[task]:>8.2f}s  {task}")
+
+    print(f"\nWall time (s) of these tasks in the last {len(run_ids)} runs")
+    print(f"{'task':<45} " + " ".join(f"{'run ' + str(run_id):>9}" for run_id in run_ids))
+    for task, *_ in slowest:
+        cells = [trends.get((task, run_id)) for run_id in run_ids]
+        print(f"{task:<45} " + " ".join(
+            f"{cell:>9.2f}" if cell is not None else f"{'-':>9}" for cell in cells
+        ))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default=TELEMETRY_DB, type=Path)
+    parser.add_argument("--runs", default=5, type=int, help="runs to show trends for")
+    parser.add_argument("--top", default=10, type=int, help="number of slowest tasks")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report(args.db, runs=args.runs, top=args.top)
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+import chart_relative_repo_rates
+
+
+@pytest.fixture
+def panel():
+    """A few days of the public repo panel, with SOFR starting on day 3."""
+    n = 5
+    columns = {
+        name: np.linspace(1.0, 2.0, n) + i / 10
+        for i, name in enumerate(
+            [
+                "DFEDTARU", "DFEDTARL", "REPO-TRI_AR_OO-P", "EFFR", "Gen_IORB",
+                "RRPONTSYAWARD", "FNYR-BGCR-A", "FNYR-TGCR-A",
+                "Total Reserves over Currency", "Total Reserves over GDP",
+                "Fed Balance Sheet over GDP",
+            ]
+        )
+    }
+    return pl.DataFrame(columns).with_columns(
+        SOFR=pl.Series([None, None, 1.5, 1.6, 1.7], dtype=pl.Float64),
+        target_midpoint=(pl.col("DFEDTARU") + pl.col("DFEDTARL")) / 2,
+        DATE=pl.datetime_range(datetime(2018, 4, 1), datetime(2018, 4, 5), eager=True),
+    )
+
+
+def test_derived_series_and_relative_rates(panel):
+    levels, relative_fed = chart_relative_repo_rates.derive(panel)
+
+    assert levels.columns[0] == "date" and relative_fed.columns[0] == "date"
+    assert "Tri_Party_Overnight_Average_Rate" in levels.columns
+    assert levels["SOFR_extended_with_Triparty"].to_list()[:3] == [
+        *panel["REPO-TRI_AR_OO-P"].to_list()[:2],
+        1.5,
+    ]
+    np.testing.assert_allclose(
+        levels["Tri_Party_Rate_Less_Fed_Funds_Midpoint"],
+        (panel["REPO-TRI_AR_OO-P"] - panel["target_midpoint"]) * 100,
+    )
+
+    assert relative_fed.columns == [
+        "date",
+        *map(chart_relative_repo_rates.column_name, chart_relative_repo_rates.RELATIVE_TO_MIDPOINT),
+        *map(chart_relative_repo_rates.column_name, chart_relative_repo_rates.ALONG_WITH_RELATIVE),
+    ]
+    assert (relative_fed["target_midpoint"] == 0).all()
+    np.testing.assert_allclose(
+        relative_fed["SOFR_extended_with_Triparty"],
+        levels["SOFR_extended_with_Triparty"] - panel["target_midpoint"],
+    )
+    np.testing.assert_allclose(relative_fed["Fed_Balance_Sheet_over_GDP"], panel["Fed Balance Sheet over GDP"])
+
+
+def test_charts_get_only_the_columns_they_ask_for(panel):
+    _, relative_fed = chart_relative_repo_rates.derive(panel)
+    df = chart_relative_repo_rates.series(
+        relative_fed, ["Interest on Reserves", "EFFR"], "2018-04-02", "2018-04-04"
+    )
+    assert list(df.columns) == ["Interest on Reserves", "EFFR"]
+    assert len(df) == 3
+    np.testing.assert_allclose(df["EFFR"], relative_fed["EFFR"][1:4])
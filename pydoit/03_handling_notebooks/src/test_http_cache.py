@@ -0,0 +1,130 @@
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_cache
+
+
+class Upstream:
+    """A local server with one file per path. Files in `etags` are served
+    with an ETag, files in `last_modified` with a Last-Modified header, and
+    the rest without validators. Counts full responses and 304s."""
+
+    def __init__(self, files, etags=(), last_modified=()):
+        self.files = dict(files)
+        self.etags = set(etags)
+        self.last_modified = set(last_modified)
+        self.versions = Counter()
+        self.sent = Counter()
+
+    def respond(self, handler):
+        path = handler.path
+        body = self.files[path]
+        etag = f'"{path}-{self.versions[path]}"'
+        modified = f"Mon, 0{1 + self.versions[path]} Jan 2024 00:00:00 GMT"
+        if (path in self.etags and handler.headers.get("If-None-Match") == etag) or (
+            path in self.last_modified and handler.headers.get("If-Modified-Since") == modified
+        ):
+            self.sent["304", path] += 1
+            handler.send_response(304)
+            handler.end_headers()
+            return
+        self.sent["200", path] += 1
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/csv; charset=utf-8")
+        handler.send_header("Content-Length", str(len(body)))
+        if path in self.etags:
+            handler.send_header("ETag", etag)
+        if path in self.last_modified:
+            handler.send_header("Last-Modified", modified)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def update(self, path, body):
+        self.files[path] = body
+        self.versions[path] += 1
+
+
+@pytest.fixture
+def upstream():
+    api = Upstream(
+        {"/etag.csv": b"a,b\n1,2\n", "/modified.csv": b"c\n3\n", "/plain.csv": b"d\n4\n"},
+        etags={"/etag.csv"},
+        last_modified={"/modified.csv"},
+    )
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            api.respond(self)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api.url = f"http://127.0.0.1:{server.server_port}"
+    yield api
+    server.shutdown()
+    server.server_close()
+
+
+def _log(cache_dir):
+    return [line.split("\t")[1:3] for line in (cache_dir / "http_cache.log").read_text().splitlines()]
+
+
+@pytest.mark.parametrize("path", ["/etag.csv", "/modified.csv"])
+def test_unchanged_responses_are_revalidated_and_served_from_disk(upstream, tmp_path, path):
+    http = http_cache.session(cache_dir=tmp_path)
+    url = upstream.url + path
+
+    first = http.get(url)
+    second = http.get(url)
+
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.text == first.text
+    assert second.from_cache and not first.from_cache
+    assert upstream.sent == {("200", path): 1, ("304", path): 1}
+    assert _log(tmp_path) == [["miss", url], ["revalidated", url]]
+
+    upstream.update(path, b"x\n5\n")
+    third = http_cache.session(cache_dir=tmp_path).get(url)
+    assert third.content == b"x\n5\n" and not third.from_cache
+    assert _log(tmp_path)[-1] == ["refreshed", url]
+
+
+def test_responses_without_validators_are_kept_for_the_ttl(upstream, tmp_path):
+    url = upstream.url + "/plain.csv"
+
+    http_cache.session(cache_dir=tmp_path, ttl=60).get(url)
+    hit = http_cache.session(cache_dir=tmp_path, ttl=60).get(url)
+    assert hit.from_cache and hit.content == b"d\n4\n"
+    assert upstream.sent == {("200", "/plain.csv"): 1}
+
+    upstream.update("/plain.csv", b"d\n6\n")
+    expired = http_cache.session(cache_dir=tmp_path, ttl=0).get(url)
+    assert expired.content == b"d\n6\n"
+    assert upstream.sent == {("200", "/plain.csv"): 2}
+    assert _log(tmp_path) == [["miss", url], ["hit", url], ["refreshed", url]]
+
+
+def test_streamed_responses_are_stored_once_read_to_the_end(upstream, tmp_path):
+    url = upstream.url + "/etag.csv"
+    http = http_cache.session(cache_dir=tmp_path)
+
+    with http.get(url, stream=True) as partial:
+        next(partial.iter_content(1))
+    assert _log(tmp_path) == [["miss", url]]
+    assert not list(tmp_path.glob("*/*"))
+
+    with http.get(url, stream=True) as first:
+        assert b"".join(first.iter_content(3)) == b"a,b\n1,2\n"
+    with http.get(url, stream=True) as second:
+        assert second.from_cache
+        assert list(second.iter_lines()) == [b"a,b", b"1,2"]
+    assert upstream.sent == {("200", "/etag.csv"): 2, ("304", "/etag.csv"): 1}
+    assert _log(tmp_path) == [["miss", url], ["miss", url], ["revalidated", url]]
@@ -0,0 +1,72 @@
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import http_cache
+import load_fed_yield_curve
+
+
+COLUMNS = (
+    ["BETA0", "BETA1", "BETA2", "BETA3"]
+    + [f"SVENF{i:02d}" for i in range(1, 31)]
+    + [f"SVENPY{i:02d}" for i in range(1, 31)]
+    + load_fed_yield_curve.YIELD_COLUMNS
+    + ["TAU1", "TAU2"]
+)
+
+
+@pytest.fixture
+def gsw_csv(tmp_path):
+    """A file laid out like feds200628.csv: 9 lines of notes, then the
+    table, with "NA" for the maturities not yet published."""
+    dates = pd.bdate_range("1961-06-14", periods=50, name="Date")
+    values = np.arange(len(dates) * len(COLUMNS), dtype=float).reshape(len(dates), -1) / 100
+    df = pd.DataFrame(values, index=dates, columns=COLUMNS)
+    df.iloc[:10, df.columns.get_loc("SVENY30")] = np.nan
+    path = tmp_path / "feds200628.csv"
+    with open(path, "w") as file:
+        file.write("".join(f"Note {i}, with a comma\n" for i in range(9)))
+        df.to_csv(file, na_rep="NA", date_format="%Y-%m-%d")
+    return path, df
+
+
+def test_reads_only_the_yields_like_read_csv(gsw_csv):
+    path, df = gsw_csv
+
+    yields = load_fed_yield_curve.read_fed_yield_curve(path)
+    expected = pd.read_csv(path, skiprows=9, index_col=0, parse_dates=True)[
+        load_fed_yield_curve.YIELD_COLUMNS
+    ]
+    pd.testing.assert_frame_equal(yields, expected, check_freq=False, check_index_type=False)
+    assert yields["SVENY30"].isna().sum() == 10
+
+    narrow = load_fed_yield_curve.read_fed_yield_curve(path, ["SVENY10", "TAU1"], float32=True)
+    assert list(narrow.columns) == ["SVENY10", "TAU1"]
+    assert (narrow.dtypes == np.float32).all()
+    np.testing.assert_allclose(narrow["TAU1"], df["TAU1"], rtol=1e-6)
+
+
+def test_download_streams_the_file_to_disk(gsw_csv, tmp_path, monkeypatch):
+    path, _ = gsw_csv
+    monkeypatch.setattr(http_cache, "HTTP_CACHE", False)
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=str(path.parent)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        target = tmp_path / "data" / "feds200628.csv"
+        load_fed_yield_curve.download_fed_yield_curve(
+            target, url=f"http://127.0.0.1:{server.server_port}/{path.name}", chunk_size=1024
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert target.read_bytes() == path.read_bytes()
+    assert list(target.parent.iterdir()) == [target]
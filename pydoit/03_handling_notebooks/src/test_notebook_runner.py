@@ -0,0 +1,110 @@
+import nbformat
+import pytest
+
+import notebook_runner
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = notebook_runner.KernelPool(size=1)
+    yield pool
+    pool.shutdown()
+
+
+def _write_notebook(path, *sources):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_code_cell(source) for source in sources]
+    nbformat.write(nb, path)
+
+
+def test_run_notebook_writes_outputs_and_clears_source(tmp_path, pool):
+    notebook = tmp_path / "example.ipynb"
+    _write_notebook(notebook, "x = 1 + 1\nx")
+
+    notebook_runner.run_notebook(notebook, tmp_path / "output", pool=pool)
+
+    executed = nbformat.read(tmp_path / "output" / "example.ipynb", as_version=4)
+    assert executed.cells[0].outputs[0]["data"]["text/plain"] == "2"
+    assert (tmp_path / "output" / "example.html").exists()
+    assert nbformat.read(notebook, as_version=4).cells[0].outputs == []
+
+
+def test_namespace_is_reset_between_notebooks(tmp_path, pool):
+    first = tmp_path / "first.ipynb"
+    second = tmp_path / "second.ipynb"
+    _write_notebook(first, "leftover = 1")
+    _write_notebook(second, "'leftover' in globals()", "import os\nos.getcwd()")
+
+    notebook_runner.run_notebook(first, tmp_path, clear_source=False, pool=pool)
+    notebook_runner.run_notebook(second, tmp_path, clear_source=False, pool=pool)
+
+    cells = nbformat.read(second, as_version=4).cells
+    assert cells[0].outputs[0]["data"]["text/plain"] == "False"
+    assert cells[1].outputs[0]["data"]["text/plain"] == repr(str(tmp_path.resolve()))
+    # Execution counts start over, as in a fresh kernel
+    assert [cell.execution_count for cell in cells] == [1, 2]
+
+
+def test_project_modules_and_plot_settings_do_not_leak_between_notebooks(tmp_path, pool):
+    (tmp_path / "project_module.py").write_text("state = []\n")
+    notebooks = {
+        "imports.ipynb": ["import project_module\nproject_module.state.append(1)"],
+        "checks_modules.ipynb": ["import sys\n'project_module' in sys.modules"],
+        "styles.ipynb": ["import matplotlib\nmatplotlib.rcParams['lines.linewidth'] = 7"],
+        "checks_style.ipynb": ["import matplotlib\nmatplotlib.rcParams['lines.linewidth']"],
+    }
+    for name, sources in notebooks.items():
+        _write_notebook(tmp_path / name, *sources)
+        notebook_runner.run_notebook(tmp_path / name, tmp_path / "output", pool=pool)
+
+    def output(name):
+        return nbformat.read(tmp_path / "output" / name, as_version=4).cells[0].outputs[0]["data"]["text/plain"]
+
+    assert output("checks_modules.ipynb") == "False"
+    assert output("checks_style.ipynb") != "7.0"
+
+
+def test_kernel_is_usable_after_a_failing_notebook(tmp_path, pool):
+    failing = tmp_path / "failing.ipynb"
+    _write_notebook(failing, "raise ValueError('boom')")
+    with pytest.raises(Exception, match="boom"):
+        notebook_runner.run_notebook(failing, tmp_path / "output", pool=pool)
+
+    ok = tmp_path / "ok.ipynb"
+    _write_notebook(ok, "1")
+    notebook_runner.run_notebook(ok, tmp_path / "output", pool=pool)
+
+
+def test_unchanged_cells_are_restored_from_the_cell_cache(tmp_path, pool):
+    data = tmp_path / "data.csv"
+    data.write_text("1,2,3")
+    notebook = tmp_path / "cached.ipynb"
+    cache_dir = tmp_path / "cell_cache"
+    executed = tmp_path / "executed.txt"
+
+    def cell(name, source):
+        """A cell that records in `executed` that it ran."""
+        # Without binding the file to a name, which would keep the namespace
+        # from being snapshotted
+        return f"open({str(executed)!r}, 'a').write({name!r} + '\\n')\n{source}"
+
+    prep = cell("prep", "runs = 1\nvalues = open('data.csv').read().split(',')\nlen(values)")
+
+    def run(*sources):
+        executed.write_text("")
+        _write_notebook(notebook, prep, *sources)
+        nb = notebook_runner.read_notebook(notebook)
+        notebook_runner.execute_notebook_cached(nb, tmp_path, [data], cache_dir, pool=pool)
+        return [cell.outputs[0]["data"]["text/plain"] for cell in nb.cells]
+
+    assert run(cell("runs", "runs"), cell("sum", "sum(map(int, values))")) == ["3", "1", "6"]
+    assert executed.read_text().split() == ["prep", "runs", "sum"]
+
+    # Only the last cell changed: the cells before it are restored, not run again
+    assert run(cell("runs", "runs"), cell("max", "max(map(int, values)) + runs")) == ["3", "1", "4"]
+    assert executed.read_text().split() == ["max"]
+
+    # The input file changed: everything runs again
+    data.write_text("1,2,3,4")
+    assert run(cell("runs", "runs"), cell("max", "max(map(int, values)) + runs")) == ["4", "1", "5"]
+    assert executed.read_text().split() == ["prep", "runs", "max"]
@@ -0,0 +1,111 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pull_bloomberg
+from mock_blp import LISTED, StandInBlp
+
+
+@pytest.fixture
+def blp():
+    return StandInBlp(LISTED)
+
+
+def test_pull_batches_the_requests_and_splices_the_futures(blp, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_bloomberg, "START_DATE", pd.Timestamp("1997-06-02"))
+    df = pull_bloomberg.pull_bbg_data(end_date="1997-12-31", blp=blp, cache_dir=tmp_path)
+
+    # One call for the two SPX fields, one for both futures
+    assert sorted((tickers, flds) for tickers, flds, *_ in blp.calls) == [
+        (["SP1 Index", "ES1 Index"], ["px_last"]),
+        (["SPX Index"], ["EQY_DVD_YLD_12m", "px_last"]),
+    ]
+
+    # What the four separate calls gave
+    def one(ticker, field, start, end):
+        return StandInBlp(blp.listed).bdh(ticker, field, start, end)[(ticker, field)]
+
+    expected = pd.DataFrame()
+    expected["dividend yield"] = one("SPX Index", "EQY_DVD_YLD_12m", "1997-06-02", "1997-12-31")
+    expected["index"] = one("SPX Index", "px_last", "1997-06-02", "1997-12-31")
+    expected["futures"] = pd.concat([
+        one("SP1 Index", "px_last", "1997-06-02", "1997-08-31"),
+        one("ES1 Index", "px_last", "1997-09-30", "1997-12-31"),
+    ])
+    expected.index = pd.to_datetime(expected.index)
+    expected.index.name = "Date"
+    pd.testing.assert_frame_equal(df, expected, check_freq=False, check_index_type=False)
+    assert df.loc["1997-09-02":"1997-09-29", "futures"].isna().all()
+
+    # The second pull is served from the cache
+    again = pull_bloomberg.pull_bbg_data(end_date="1997-12-31", blp=blp, cache_dir=tmp_path)
+    assert len(blp.calls) == 2
+    pd.testing.assert_frame_equal(again, df, check_freq=False, check_index_type=False)
+
+
+def test_only_uncached_requests_are_downloaded(blp, tmp_path):
+    first = pull_bloomberg.bdh_batch([("SPX Index", "px_last", "2020-01-01", "2020-03-31")], blp, tmp_path)
+    both = pull_bloomberg.bdh_batch(
+        [
+            ("SPX Index", "px_last", "2020-01-01", "2020-03-31"),
+            ("SPX Index", "PE_RATIO", datetime.date(2020, 1, 1), "2020-03-31"),
+        ],
+        blp,
+        tmp_path,
+    )
+    assert [flds for _, flds, *_ in blp.calls] == [["px_last"], ["PE_RATIO"]]
+    pd.testing.assert_series_equal(both[0], first[0])
+    assert both[1].name == ("SPX Index", "PE_RATIO")
+
+    pull_bloomberg.bdh_batch([("SPX Index", "px_last", "2020-01-01", "2020-03-31")], blp, tmp_path, Per="W")
+    assert blp.calls[-1][-1] == {"Per": "W"}
+
+
+def test_splice_takes_each_date_from_the_segment_that_covers_it():
+    dates = pd.date_range("2020-01-01", periods=10)
+    near = pd.Series(np.arange(10.0), index=dates)
+    far = pd.Series(np.arange(100.0, 110.0), index=dates)
+
+    spliced = pull_bloomberg.splice_rolls([(near, None, "2020-01-04"), (far, "2020-01-07", None)])
+    assert list(spliced) == [0.0, 1.0, 2.0, 3.0, 106.0, 107.0, 108.0, 109.0]
+
+    overlapping = pull_bloomberg.splice_rolls([(near, None, "2020-01-06"), (far, "2020-01-05", None)])
+    assert list(overlapping) == [0.0, 1.0, 2.0, 3.0, *np.arange(104.0, 110.0)]
+
+
+def test_empty_results_are_not_cached(blp, tmp_path):
+    requests = [
+        ("ES1 Index", "px_last", "1997-01-01", "1997-03-31"),  # Before it was listed
+        ("SPX Index", "px_last", "1997-01-01", "1997-03-31"),
+    ]
+    with pytest.warns(UserWarning, match="ES1 Index px_last"):
+        empty, index = pull_bloomberg.bdh_batch(requests, blp, tmp_path)
+    assert empty.empty and not index.empty
+    assert len(list(tmp_path.glob("*.parquet"))) == 1
+
+    with pytest.warns(UserWarning, match="ES1 Index px_last"):
+        pull_bloomberg.bdh_batch(requests, blp, tmp_path)
+    assert [tickers for tickers, *_ in blp.calls] == [["ES1 Index", "SPX Index"], ["ES1 Index"]]
+
+
+def test_history_from_today_on_is_downloaded_again(blp, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_bloomberg, "_today", lambda: pd.Timestamp("2020-03-16"))
+    request = [("SPX Index", "px_last", "2020-01-01", "2020-03-31")]
+    first = pull_bloomberg.bdh_batch(request, blp, tmp_path)
+
+    # Only the history before today is cached; the rest is asked for again
+    again = pull_bloomberg.bdh_batch(request, blp, tmp_path)
+    assert [(start, end) for *_, start, end, _ in blp.calls] == [
+        ("2020-01-01", "2020-03-31"),
+        ("2020-03-16", "2020-03-31"),
+    ]
+    pd.testing.assert_series_equal(again[0], first[0])
+    assert len(list(tmp_path.glob("*.parquet"))) == 1
+
+    # A day later, today's values are closed history too
+    monkeypatch.setattr(pull_bloomberg, "_today", lambda: pd.Timestamp("2020-04-01"))
+    pull_bloomberg.bdh_batch(request, blp, tmp_path)
+    pull_bloomberg.bdh_batch(request, blp, tmp_path)
+    assert len(blp.calls) == 3
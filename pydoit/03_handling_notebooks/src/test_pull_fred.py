@@ -1,6 +1,13 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
 import pandas as pd
 import pytest
 from settings import config
+import http_cache
 import pull_fred
 DATA_DIR = config("DATA_DIR")
 
@@ -28,3 +35,117 @@ def test_pull_fred_data_validity():
     # Test if the average annualized growth rate is close to 3.08%
     ave_annualized_growth = 4 * 100 * df.loc['1913-01-01': '2023-09-01', 'GDPC1'].dropna().pct_change().mean()
     assert abs(ave_annualized_growth - 3.08) < 0.1
+
+
+def _upstream():
+    """Synthetic FRED data: daily, weekly (Wednesday) and quarterly series."""
+    dates = pd.bdate_range("2012-01-02", "2024-06-28", name="DATE")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(len(dates), len(pull_fred.series_to_pull))), index=dates,
+                      columns=list(pull_fred.series_to_pull))
+    for s in ["WALCL", "TREAST", "TOTRESNS", "WTREGEN", "CURRCIR", "WSDONTL"]:
+        df.loc[df.index.dayofweek != 2, s] = np.nan
+    for s in ["GDP", "GDPC1", "GFDEBTN"]:
+        df.loc[~(df.index.is_quarter_start), s] = np.nan
+    df.loc[:"2021-07-27", "IORB"] = np.nan
+    df.loc["2021-07-29":, "IOER"] = np.nan
+    return df
+
+
+def test_update_fred_fetches_only_the_revision_window(tmp_path, monkeypatch):
+    upstream = _upstream()
+    fetched = {}
+
+    def fetch_series(series_id, start_date, end_date, session):
+        fetched[series_id] = pd.Timestamp(start_date)
+        return upstream.loc[start_date:end_date, series_id]
+
+    monkeypatch.setattr(pull_fred, "fetch_series", fetch_series)
+
+    first = pull_fred.update_fred(tmp_path, end_date="2024-03-29")
+    expected = pull_fred.derive_columns(upstream.loc[:"2024-03-29"])
+    pd.testing.assert_frame_equal(first, expected, check_freq=False)
+    assert first.index.is_monotonic_increasing
+
+    # Revise a weekly value inside the window and publish three more months
+    upstream.loc["2024-03-06", "WALCL"] += 1000
+    derive_columns = pull_fred.derive_columns
+    derived_rows = []
+    monkeypatch.setattr(
+        pull_fred, "derive_columns", lambda df, **kw: derived_rows.append(len(df)) or derive_columns(df, **kw)
+    )
+    second = pull_fred.update_fred(tmp_path, end_date="2024-06-28", revision_days=60)
+    monkeypatch.setattr(pull_fred, "derive_columns", derive_columns)
+
+    # Only the rows from the revised observation on
+    assert derived_rows == [len(upstream.loc["2024-03-06":])]
+
+    assert fetched["WALCL"] == pd.Timestamp("2024-03-27") - pd.Timedelta(days=60)
+    assert fetched["GDP"] == pd.Timestamp("2024-01-01") - pd.Timedelta(days=60)
+    pd.testing.assert_frame_equal(second, pull_fred.derive_columns(upstream), check_freq=False)
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(tmp_path / "fred.parquet"), second, check_freq=False
+    )
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+class StandInFRED(BaseHTTPRequestHandler):
+    """Serves fredgraph.csv for any series id, after `delay` seconds, with
+    monthly values from 2020 and a missing (".") value in March 2020.
+    Records the most requests it was serving at the same time."""
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.2
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(cls.delay)
+        query = parse_qs(urlparse(self.path).query)
+        series_id = query["id"][0]
+        dates = pd.date_range(query["cosd"][0], query["coed"][0], freq="MS")
+        lines = ["observation_date," + series_id] + [
+            f"{d:%Y-%m-%d},{'.' if d.month == 3 else len(series_id) + i}" for i, d in enumerate(dates)
+        ]
+        body = ("\n".join(lines) + "\n").encode()
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_fetch_fred_downloads_concurrently_up_to_the_cap(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInFRED)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(pull_fred, "FRED_CSV_URL", f"http://127.0.0.1:{server.server_port}/fredgraph.csv")
+    monkeypatch.setattr(http_cache, "HTTP_CACHE", False)
+    series_ids = list(pull_fred.series_to_pull)[:12]
+    start_dates = {series_id: "2020-01-01" for series_id in series_ids}
+    start_dates["GDP"] = "2020-06-01"
+
+    start = time.perf_counter()
+    df = pull_fred.fetch_fred(start_dates, "2020-12-01", max_workers=4)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+
+    # 12 series, 4 at a time: 3 rounds of 0.2s instead of 12
+    assert StandInFRED.max_in_flight == 4
+    assert elapsed < 12 * StandInFRED.delay / 2
+    assert list(df.columns) == series_ids
+    assert df.index.dtype == "datetime64[ns]" and df.index.name == "DATE"
+    assert list(df.index) == list(pd.date_range("2020-01-01", "2020-12-01", freq="MS"))
+    assert df["GDP"].first_valid_index() == pd.Timestamp("2020-06-01")
+    assert df.loc["2020-03-01"].isna().all()
+    assert df.loc["2020-02-01", "EFFR"] == len("EFFR") + 1
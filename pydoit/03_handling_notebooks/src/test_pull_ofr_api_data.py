@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+import requests
+
+import http_cache
+import pull_ofr_api_data
+
+
+MNEMONICS = list(pull_ofr_api_data.series_descriptions)
+
+## Responses as the API returns them: [date, value] pairs with the most recent
+## date first, and null for missing values
+RECORDED = {
+    mnemonic: [
+        [f"2024-01-0{day}", None if (mnemonic, day) == ("FNYR-TGCR-A", 2) else sum(map(ord, mnemonic)) % 100 + day]
+        for day in (3, 2, 1)
+    ]
+    for mnemonic in MNEMONICS
+}
+
+
+class StandInOFR:
+    """A local stand-in for the OFR API, serving RECORDED from
+    `/series/timeseries` and `/series/multifull`. Each response waits `delay`
+    seconds; the first `failures[mnemonic]` requests for a mnemonic get a
+    503, and the first `slow[mnemonic]` requests wait `slow_delay` seconds.
+    Batches with a mnemonic in `rejected` get a 400, and mnemonics in
+    `omitted` are left out of batch responses."""
+
+    def __init__(self, delay=0.0, failures=None, slow=None, slow_delay=2.0, rejected=(), omitted=()):
+        self.delay = delay
+        self.failures = Counter(failures or {})
+        self.slow = Counter(slow or {})
+        self.slow_delay = slow_delay
+        self.rejected = set(rejected)
+        self.omitted = set(omitted)
+        self.requests = Counter()
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def _send(self, handler, status, payload=None):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def respond(self, handler):
+        url = urlparse(handler.path)
+        query = parse_qs(url.query)
+        time.sleep(self.delay)
+        if url.path.endswith("/series/multifull"):
+            mnemonics = query["mnemonics"][0].split(",")
+            with self.lock:
+                self.batches.append(mnemonics)
+            if self.rejected & set(mnemonics):
+                return self._send(handler, 400, {"error": "unknown mnemonic"})
+            return self._send(handler, 200, {
+                mnemonic: {"metadata": {}, "timeseries": {"aggregation": RECORDED[mnemonic]}}
+                for mnemonic in mnemonics
+                if mnemonic not in self.omitted
+            })
+
+        mnemonic = query["mnemonic"][0]
+        with self.lock:
+            self.requests[mnemonic] += 1
+            fail = self.requests[mnemonic] <= self.failures[mnemonic]
+            slow = self.requests[mnemonic] <= self.slow[mnemonic]
+        if slow:
+            time.sleep(self.slow_delay)
+        if fail:
+            return self._send(handler, 503)
+        self._send(handler, 200, RECORDED[mnemonic])
+
+
+@pytest.fixture(autouse=True)
+def no_http_cache(monkeypatch):
+    monkeypatch.setattr(http_cache, "HTTP_CACHE", False)
+
+
+@pytest.fixture
+def ofr_server():
+    servers = []
+
+    def start(api):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                api.respond(self)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/v1"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_series_are_pulled_concurrently_in_a_fixed_column_order(ofr_server):
+    base_url = ofr_server(StandInOFR(delay=0.3))
+    session = pull_ofr_api_data.make_session(pool_size=4)
+
+    start = time.perf_counter()
+    df = pull_ofr_api_data.pull_series_list(
+        MNEMONICS, max_workers=4, session=session, base_url=base_url, batch_size=1
+    )
+    elapsed = time.perf_counter() - start
+
+    # 12 series, 4 at a time: 3 rounds of 0.3s instead of 12
+    assert elapsed < 12 * 0.3 / 2
+    assert list(df.columns) == MNEMONICS
+    assert list(df.index) == list(pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"]))
+    assert (df.dtypes == float).all()
+    expected = sum(map(ord, "FNYR-BGCR-A")) % 100 + 1
+    assert df.loc["2024-01-01", "FNYR-BGCR-A"] == expected
+
+
+def test_5xx_errors_and_timeouts_are_retried(ofr_server):
+    api = StandInOFR(failures={"FNYR-BGCR-A": 2}, slow={"FNYR-TGCR-A": 1}, slow_delay=1.0)
+    base_url = ofr_server(api)
+    session = pull_ofr_api_data.make_session(pool_size=2, retries=3, backoff_factor=0.01)
+
+    df = pull_ofr_api_data.pull_series_list(
+        ["FNYR-BGCR-A", "FNYR-TGCR-A"],
+        max_workers=2,
+        session=session,
+        base_url=base_url,
+        timeout=(1, 0.3),
+        batch_size=1,
+    )
+
+    assert list(df.columns) == ["FNYR-BGCR-A", "FNYR-TGCR-A"]
+    assert df["FNYR-BGCR-A"].notna().all()
+    assert api.requests == {"FNYR-BGCR-A": 3, "FNYR-TGCR-A": 2}
+
+
+def test_gives_up_after_the_retries(ofr_server):
+    api = StandInOFR(failures={"FNYR-BGCR-A": 10})
+    base_url = ofr_server(api)
+    session = pull_ofr_api_data.make_session(pool_size=1, retries=2, backoff_factor=0.01)
+
+    with pytest.raises(requests.exceptions.RetryError):
+        pull_ofr_api_data.pull_series_list(["FNYR-BGCR-A"], session=session, base_url=base_url, batch_size=1)
+    assert api.requests["FNYR-BGCR-A"] == 3
+
+
+def test_batched_pull_matches_the_per_series_pull_in_one_request(ofr_server):
+    api = StandInOFR()
+    base_url = ofr_server(api)
+
+    per_series = pull_ofr_api_data.pull_series_list(MNEMONICS, base_url=base_url, batch_size=1)
+    assert sum(api.requests.values()) == len(MNEMONICS)
+
+    api.requests.clear()
+    batched = pull_ofr_api_data.pull_series_list(MNEMONICS, base_url=base_url)
+    assert api.batches == [MNEMONICS]
+    assert sum(api.requests.values()) == 0
+
+    pd.testing.assert_frame_equal(batched, per_series)
+    assert pd.isna(batched.loc["2024-01-02", "FNYR-TGCR-A"])
+
+
+def test_series_the_batch_endpoint_rejects_are_pulled_one_at_a_time(ofr_server):
+    api = StandInOFR(rejected={"REPO-TRI_AR_OO-P"}, omitted={"FNYR-TGCR-A"})
+    base_url = ofr_server(api)
+
+    df = pull_ofr_api_data.pull_series_list(MNEMONICS, base_url=base_url, batch_size=5)
+
+    # Batches are requested concurrently, so in any order
+    assert sorted(api.batches) == sorted([MNEMONICS[:5], MNEMONICS[5:10], MNEMONICS[10:]])
+    # The rejected batch, and the series left out of the last one
+    assert set(api.requests) == set(MNEMONICS[:5]) | {"FNYR-TGCR-A"}
+    assert list(df.columns) == MNEMONICS
+    assert df["REPO-TRI_AR_OO-P"].notna().all()
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pull_public_repo_data
+
+
+FRED_COLUMNS = [
+    "DFEDTARU", "DFEDTARL", "SOFR", "Gen_IORB", "RPONTSYD", "RRPONTSYD",
+    "WALCL", "GDP", "TOTRESNS", "CURRCIR",
+]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """fred.parquet and ofr_public_repo_data.parquet for 2015-2017."""
+    dates = pd.date_range("2015-01-01", "2017-12-31", name="DATE")
+    rng = np.random.default_rng(0)
+    fred = pd.DataFrame(rng.uniform(1, 2, (len(dates), len(FRED_COLUMNS))), index=dates, columns=FRED_COLUMNS)
+    ofr = pd.DataFrame({"REPO-TRI_AR_OO-P": rng.uniform(1, 2, len(dates))}, index=dates.rename("Date"))
+    fred.to_parquet(tmp_path / "fred.parquet")
+    ofr.to_parquet(tmp_path / "ofr_public_repo_data.parquet")
+    return tmp_path
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """The times the panel is built from the parquet files."""
+    builds = []
+    merge_all = pull_public_repo_data.merge_all
+    monkeypatch.setattr(pull_public_repo_data, "merge_all", lambda *args: builds.append(args) or merge_all(*args))
+    monkeypatch.setattr(pull_public_repo_data, "_panels", {})
+    return builds
+
+
+def test_panel_is_built_once_and_rebuilt_when_a_pull_changes(data_dir, builds):
+    df = pull_public_repo_data.load_all(data_dir)
+    assert len(builds) == 1
+    assert df.index.name == "DATE"
+    assert list(df.columns[-len(pull_public_repo_data.DERIVED_COLUMNS):]) == list(pull_public_repo_data.DERIVED_COLUMNS)
+    np.testing.assert_allclose(df["target_midpoint"], (df["DFEDTARU"] + df["DFEDTARL"]) / 2)
+    assert df.loc["2016-12-14", "DFEDTARU"] == df.loc["2016-12-13", "DFEDTARU"]
+
+    # Changing the returned frame leaves the cached panel alone
+    df["SOFR"] = 0.0
+    again = pull_public_repo_data.load_all(data_dir)
+    assert (again["SOFR"] > 0).all()
+    assert len(builds) == 1
+
+    # A new session reads the stored panel
+    pull_public_repo_data._panels.clear()
+    pd.testing.assert_frame_equal(pull_public_repo_data.load_all(data_dir), again)
+    assert len(builds) == 1
+
+    # A new pull
+    fred = pd.read_parquet(data_dir / "fred.parquet")
+    fred["SOFR"] = 5.0
+    fred.to_parquet(data_dir / "fred.parquet")
+    stat = (data_dir / "fred.parquet").stat()
+    os.utime(data_dir / "fred.parquet", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert (pull_public_repo_data.load_all(data_dir)["SOFR_less_IORB"] == 5.0 - fred["Gen_IORB"]).all()
+    assert len(builds) == 2
+
+
+def test_only_the_selected_columns_are_returned(data_dir, builds):
+    full = pull_public_repo_data.load_all(data_dir)
+    df = pull_public_repo_data.load_all(data_dir, columns=["SOFR", "net_fed_repo"])
+    assert list(df.columns) == ["SOFR", "net_fed_repo"]
+    pd.testing.assert_frame_equal(df, full[["SOFR", "net_fed_repo"]])
+    assert len(builds) == 1
+
+
+def test_stored_panel_is_rebuilt_when_the_derived_columns_change(data_dir, builds, monkeypatch):
+    pull_public_repo_data.load_all(data_dir)
+    pull_public_repo_data._panels.clear()
+
+    monkeypatch.setitem(pull_public_repo_data.DERIVED_COLUMNS, "SOFR_x2", lambda df: df["SOFR"] * 2)
+    df = pull_public_repo_data.load_all(data_dir)
+    assert len(builds) == 2
+    np.testing.assert_allclose(df["SOFR_x2"], df["SOFR"] * 2)
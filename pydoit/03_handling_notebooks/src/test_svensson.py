@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import svensson
+
+
+@pytest.fixture
+def params():
+    """Parameters for three days: a flat curve at 5%, a Svensson curve,
+    and a Nelson-Siegel curve (BETA3 and TAU2 missing, as before 1980)."""
+    return pd.DataFrame(
+        {
+            "BETA0": [5.0, 4.5, 6.0],
+            "BETA1": [0.0, -2.0, -1.0],
+            "BETA2": [0.0, 3.0, 2.0],
+            "BETA3": [0.0, -4.0, np.nan],
+            "TAU1": [1.0, 1.5, 2.0],
+            "TAU2": [1.0, 9.0, np.nan],
+        },
+        index=pd.to_datetime(["1975-01-02", "2024-01-02", "2024-01-03"]),
+    )
+
+
+def test_a_flat_curve(params):
+    maturities = np.array([0.0, 0.25, 1.0, 7.5, 30.0])
+    flat = params.iloc[[0]]
+
+    np.testing.assert_allclose(svensson.zero_yields(flat, maturities), 5.0)
+    np.testing.assert_allclose(svensson.forward_rates(flat, maturities), 5.0)
+    np.testing.assert_allclose(svensson.discount_factors(flat, maturities), np.exp(-0.05 * maturities)[None])
+    # 5% continuously compounded, as a semiannual yield
+    np.testing.assert_allclose(svensson.par_yields(flat, [1.0, 10.0]), 200 * np.expm1(0.025))
+
+
+def test_yields_forwards_and_discount_factors_agree(params):
+    maturities = np.arange(1, 361) / 12
+    zeros = svensson.zero_yields(params, maturities)
+    assert zeros.shape == (3, 360) and not np.isnan(zeros).any()
+
+    # The forward rate is the derivative of m * y(m)
+    h = 1e-6
+    slope = (
+        svensson.zero_yields(params, maturities + h) * (maturities + h)
+        - svensson.zero_yields(params, maturities - h) * (maturities - h)
+    ) / (2 * h)
+    np.testing.assert_allclose(svensson.forward_rates(params, maturities), slope, rtol=1e-6)
+    np.testing.assert_allclose(
+        svensson.discount_factors(params, maturities), np.exp(-zeros / 100 * maturities)
+    )
+
+    # The short end of the Nelson-Siegel day is BETA0 + BETA1
+    assert svensson.zero_yields(params.iloc[[2]], [0.0])[0, 0] == pytest.approx(5.0)
+
+
+def test_exact_maturities_for_each_date(params):
+    maturities = np.array([[0.3, 12.0], [2.5, 0.1], [7.0, 7.0]])
+    exact = svensson.discount_factors(params, maturities)
+    for i in range(3):
+        np.testing.assert_allclose(exact[i], svensson.discount_factors(params.iloc[[i]], maturities[i])[0])
+
+
+def test_par_yields_price_a_semiannual_bond_at_par(params):
+    maturities = np.array([0.25, 1.0, 2.75, 10.0, 30.0])
+    par = svensson.curve(params, maturities, kind="par")
+    assert list(par.columns) == list(maturities) and (par.index == params.index).all()
+
+    for i in range(len(params)):
+        for maturity in maturities:
+            coupons = np.arange(maturity, 0, -0.5)[::-1]
+            discount = svensson.discount_factors(params.iloc[[i]], coupons)[0]
+            accrued = 1 - 2 * coupons[0]
+            coupon = par.iloc[i][maturity] / 200
+            assert coupon * discount.sum() + discount[-1] - coupon * accrued == pytest.approx(1.0)
+
+    with pytest.raises(ValueError):
+        svensson.par_yields(params, np.ones((3, 2)))
+
+
+def test_par_yields_at_a_maturity_of_0_are_the_limit(params):
+    short = svensson.zero_yields(params, [0.0])[:, 0]
+    np.testing.assert_allclose(svensson.par_yields(params, [0.0])[:, 0], 200 * short / (200 - short))
+
+    grid = svensson.par_yields(params, [0.0, 1e-6, 1.0])
+    np.testing.assert_allclose(grid[:, 1], grid[:, 0], rtol=1e-5)
+    np.testing.assert_allclose(grid[:, 2], svensson.par_yields(params, [1.0])[:, 0])
+
+    with pytest.raises(ValueError):
+        svensson.par_yields(params, [-0.5, 1.0])
@@ -12,10 +12,11 @@ import sys
 sys.path.insert(1, "./src/")
 
 import shutil
-from os import environ, getcwd, path
+from os import cpu_count, environ, getcwd, path
 from pathlib import Path
 
 from colorama import Fore, Style, init
+from plotly.offline import get_plotlyjs_version
 
 ## Custom reporter: Print PyDoit Text in Green
 # This is helpful because some tasks write to sterr and pollute the output in
@@ -24,8 +25,11 @@ from colorama import Fore, Style, init
 # presses on the keyboard before continuing. However, I want to be able
 # to easily see the task lines printed by PyDoit. I want them to stand out
 # from among all the other lines printed to the console.
-from doit.reporter import ConsoleReporter
+from build_cache import cached
+from parquet_checker import ParquetChecker
 from settings import config
+from task_actions import ResourceActions
+from task_telemetry import TelemetryReporter
 
 try:
     in_slurm = environ["SLURM_JOB_ID"] is not None
@@ -33,7 +37,9 @@ except:
     in_slurm = False
 
 
-class GreenReporter(ConsoleReporter):
+# The telemetry reporter also records the wall time, CPU time and memory of
+# every task (see ./src/task_telemetry.py)
+class GreenReporter(TelemetryReporter):
     def write(self, stuff, **kwargs):
         doit_mark = stuff.split(" ")[0].ljust(2)
         task = " ".join(stuff.split(" ")[1:]).strip() + "\n"
@@ -47,6 +53,9 @@ class GreenReporter(ConsoleReporter):
         self.outstream.write(output)
 
 
+## Run independent tasks in parallel (see RESOURCE_LIMITS below)
+DOIT_NUM_PROCESS = config("DOIT_NUM_PROCESS", default=4, cast=int)
+
 if not in_slurm:
     DOIT_CONFIG = {
         "reporter": GreenReporter,
@@ -54,9 +63,21 @@ if not in_slurm:
         # "cleanforget": True, # Doit will forget about tasks that have been cleaned.
         "backend": "sqlite3",
         "dep_file": "./.doit-db.sqlite",
+        "num_process": DOIT_NUM_PROCESS,
+        "par_type": "process",
+        # Check parquet file_deps by their footer instead of hashing them
+        "check_file_uptodate": ParquetChecker,
     }
 else:
-    DOIT_CONFIG = {"backend": "sqlite3", "dep_file": "./.doit-db.sqlite"}
+    DOIT_CONFIG = {
+        "reporter": TelemetryReporter,
+        "backend": "sqlite3",
+        "dep_file": "./.doit-db.sqlite",
+        "num_process": DOIT_NUM_PROCESS,
+        "par_type": "process",
+        # Check parquet file_deps by their footer instead of hashing them
+        "check_file_uptodate": ParquetChecker,
+    }
 init(autoreset=True)
 
 
@@ -64,6 +85,9 @@ BASE_DIR = config("BASE_DIR")
 DATA_DIR = config("DATA_DIR")
 MANUAL_DATA_DIR = config("MANUAL_DATA_DIR")
 OUTPUT_DIR = config("OUTPUT_DIR")
+## The plotly.js that ./src/chart_export.py writes once for all charts in
+## OUTPUT_DIR. Tasks that write charts cache it as one of their outputs.
+PLOTLYJS = Path(OUTPUT_DIR) / f"plotly-{get_plotlyjs_version()}.min.js"
 OS_TYPE = config("OS_TYPE")
 USER = config("USER")
 
@@ -71,44 +95,56 @@ USER = config("USER")
 environ["PYDEVD_DISABLE_FILE_VALIDATION"] = "1"
 
 
-# fmt: off
-## Helper functions for automatic execution of Jupyter notebooks
-def jupyter_execute_notebook(notebook_path):
-    return f"jupyter nbconvert --execute --to notebook --ClearMetadataPreprocessor.enabled=True --inplace {notebook_path}"
-def jupyter_to_html(notebook_path, output_dir=OUTPUT_DIR):
-    return f"jupyter nbconvert --to html --output-dir={output_dir} {notebook_path}"
-def jupyter_to_md(notebook_path, output_dir=OUTPUT_DIR):
-    """Requires jupytext"""
-    return f"jupytext --to markdown --output-dir={output_dir} {notebook_path}"
-def jupyter_clear_output(notebook_path):
-    """Clear the output of a notebook"""
-    return f"jupyter nbconvert --ClearOutputPreprocessor.enabled=True --ClearMetadataPreprocessor.enabled=True --inplace {notebook_path}"
-# fmt: on
-
-
-def mv(from_path, to_path):
-    """Move a file to a folder"""
-    from_path = Path(from_path)
-    to_path = Path(to_path)
-    to_path.mkdir(parents=True, exist_ok=True)
-    if OS_TYPE == "nix":
-        command = f"mv {from_path} {to_path}"
-    else:
-        command = f"move {from_path} {to_path}"
-    return command
-
-
 def copy_file(origin_path, destination_path, mkdir=True):
-    """Create a Python action for copying a file."""
+    """Copy a file. Use it as the action ``(copy_file, [origin, destination])``."""
+    origin = Path(origin_path)
+    dest = Path(destination_path)
+    if mkdir:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(origin, dest)
+
+
+def run_notebook(notebook_path, output_dir=OUTPUT_DIR, cell_cache_inputs=None, outputs=()):
+    """Execute a notebook in a warm kernel and export it to HTML, all
+    in-process (see ./src/notebook_runner.py). Use it as the action
+    ``(run_notebook, [notebook_path], {...})``.
+
+    With `cell_cache_inputs` (the files the notebook reads), cells above the
+    first changed cell are restored from the cell cache instead of run again.
+    Restored cells don't write their files again, so the cell cache is only
+    used if all `outputs` still exist.
+    """
+    import notebook_runner
+
+    if cell_cache_inputs is not None and not all(Path(output).exists() for output in outputs):
+        cell_cache_inputs = None
+    notebook_runner.run_notebook(notebook_path, output_dir, cell_cache_inputs=cell_cache_inputs)
+
+
+## Resource classes for parallel runs
+# `doit -n 4` runs up to 4 tasks at once (DOIT_CONFIG sets the default, and
+# `doit -n 1` runs serially). Tasks are tagged with the resources they use
+# through `with_resources`; at most RESOURCE_LIMITS[tag] tasks holding a tag
+# run at the same time, across all worker processes. Slots are lock files in
+# OUTPUT_DIR/.locks, so a slot is released even if its worker dies.
+#
+# Worker processes get the tasks pickled, so actions are command strings or
+# module-level functions (pass arguments as `(func, args, kwargs)`), never
+# closures: those can't be pickled under the "spawn" start method that macOS
+# and Windows use.
+RESOURCE_LIMITS = {
+    "network": 4,  # Data pulls mostly wait on the server
+    "cpu-heavy": max(1, (cpu_count() or 2) // 2),  # Notebook kernels
+    "wrds-connection": 1,  # WRDS limits concurrent connections per user
+}
+LOCK_DIR = Path(OUTPUT_DIR) / ".locks"
 
-    def _copy_file():
-        origin = Path(origin_path)
-        dest = Path(destination_path)
-        if mkdir:
-            dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(origin, dest)
 
-    return _copy_file
+def with_resources(task, *tags):
+    """Run the actions of `task` while holding a slot of each of `tags`
+    (see ./src/task_actions.py)."""
+    limits = {tag: RESOURCE_LIMITS[tag] for tag in tags}
+    return {**task, "actions": [ResourceActions(task["actions"], limits, LOCK_DIR)]}
 
 
 ##################################
@@ -128,7 +164,7 @@ def task_config():
 
 def task_pull():
     """Pull data from external sources"""
-    yield {
+    yield with_resources({
         "name": "fred",
         "doc": "Pull data from FRED",
         "actions": [
@@ -138,34 +174,35 @@ def task_pull():
         "targets": [DATA_DIR / "fred.parquet"],
         "file_dep": ["./src/settings.py", "./src/pull_fred.py"],
         "clean": [],
-    }
+    }, "network")
 
 
 def task_example_plot():
     """Example plots"""
     file_dep = [Path("./src") / file for file in ["example_plot.py", "pull_fred.py"]]
+    file_dep.append(DATA_DIR / "fred.parquet")
     file_output = ["example_plot.png"]
     targets = [OUTPUT_DIR / file for file in file_output]
 
-    return {
+    return cached({
         "actions": [
             "ipython ./src/example_plot.py",
         ],
         "targets": targets,
         "file_dep": file_dep,
         "clean": True,
-    }
+    })
 
 
 notebook_tasks = {
     "01_example_notebook_interactive_ipynb": {
         "path": "./src/01_example_notebook_interactive_ipynb.py",
-        "file_dep": ["./src/pull_fred.py"],
+        "file_dep": ["./src/pull_fred.py", "./src/chart_export.py", DATA_DIR / "fred.parquet"],
         "targets": [OUTPUT_DIR / "01_gdp_chart.html"],
     },
     "02_example_with_dependencies_ipynb": {
         "path": "./src/02_example_with_dependencies_ipynb.py",
-        "file_dep": ["./src/pull_fred.py"],
+        "file_dep": ["./src/pull_fred.py", "./src/chart_export.py", DATA_DIR / "fred.parquet"],
         "targets": [OUTPUT_DIR / "02_unemployment_chart.html"],
     },
 }
@@ -178,27 +215,27 @@ def task_run_notebooks():
     """
     for notebook in notebook_tasks.keys():
         pyfile_path = Path(notebook_tasks[notebook]["path"])
-        notebook_path = pyfile_path.with_suffix(".ipynb")
-        yield {
+        yield cached(with_resources({
             "name": notebook,
             "actions": [
-                """python -c "import sys; from datetime import datetime; print(f'Start """ + notebook + """: {datetime.now()}', file=sys.stderr)" """,
-                f"jupytext --to notebook --output {notebook_path} {pyfile_path}",
-                jupyter_execute_notebook(notebook_path),
-                jupyter_to_html(notebook_path),
-                mv(notebook_path, OUTPUT_DIR),
-                """python -c "import sys; from datetime import datetime; print(f'End """ + notebook + """: {datetime.now()}', file=sys.stderr)" """,
+                # Execute the jupytext script, write OUTPUT_DIR/<name>.ipynb and .html,
+                # reusing the cells above the first one that changed
+                (run_notebook, [pyfile_path], {
+                    "cell_cache_inputs": notebook_tasks[notebook]["file_dep"],
+                    "outputs": [*notebook_tasks[notebook]["targets"], PLOTLYJS],
+                }),
             ],
             "file_dep": [
                 pyfile_path,
                 *notebook_tasks[notebook]["file_dep"],
             ],
             "targets": [
+                OUTPUT_DIR / f"{notebook}.ipynb",
                 OUTPUT_DIR / f"{notebook}.html",
                 *notebook_tasks[notebook]["targets"],
             ],
             "clean": True,
-        }
+        }, "cpu-heavy"), outputs=[PLOTLYJS])
 # fmt: on
 
 sphinx_targets = [
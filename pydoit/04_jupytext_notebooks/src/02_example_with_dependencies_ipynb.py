@@ -28,6 +28,7 @@ from pathlib import Path
 
 import plotly.express as px
 import pull_fred
+from chart_export import write_chart
 from settings import config
 
 OUTPUT_DIR = Path(config("OUTPUT_DIR"))
@@ -61,7 +62,7 @@ fig
 # %%
 # Save the chart as HTML
 chart_path = OUTPUT_DIR / "02_unemployment_chart.html"
-fig.write_html(chart_path)
+write_chart(fig, chart_path)
 print(f"Chart saved to: {chart_path}")
 
 # %%
@@ -0,0 +1,197 @@
+"""A local, content-addressed cache for the targets of doit tasks.
+
+doit only knows whether a task is up to date in this checkout. A fresh clone,
+a CI run or a second checkout recomputes every chart, table and notebook,
+even when the inputs are identical. `cached(task)` wraps a task so that,
+before its actions run, a key is computed from
+
+- its actions (command strings; for Python actions, the function's code and
+  the values it closes over or is called with),
+- the contents of its `file_dep`, and
+- the settings in SETTINGS_IN_KEY,
+
+and if BUILD_CACHE_DIR holds targets stored under that key, they are copied
+into place instead of running the actions. Otherwise the actions run and the
+targets are stored. Files the actions write that cannot be targets, such as
+the plotly.js that every chart in OUTPUT_DIR shares (doit does not allow two
+tasks to have a target in common), are passed as `cached(task, outputs)` and
+stored and restored with the targets. Paths under BASE_DIR enter the key relative to it, so
+checkouts in different directories share entries.
+
+BUILD_CACHE_DIR holds one JSON entry per key, mapping each target (relative
+to BASE_DIR) to a blob named by the sha256 of its contents, so identical
+outputs of different keys are stored once. Delete the directory to clear the
+cache; set BUILD_CACHE=false to turn it off.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from types import CodeType
+
+from decouple import UndefinedValueError
+
+from parquet_checker import ParquetChecker
+from settings import config
+from task_actions import ActionGroup
+
+BASE_DIR = Path(config("BASE_DIR")).resolve()
+BUILD_CACHE = config("BUILD_CACHE", default="true", cast=str).lower() in {"1", "true", "yes", "on"}
+BUILD_CACHE_DIR = Path(
+    config("BUILD_CACHE_DIR", default=Path.home() / ".cache" / "pydoit-build-cache", cast=Path)
+)
+
+## Settings that change what the tasks produce (paths are left out, so that
+## checkouts in different places share the cache). Those a project doesn't
+## define enter the key as None.
+SETTINGS_IN_KEY = ["START_DATE", "END_DATE", "PIPELINE_DEV_MODE", "PIPELINE_THEME"]
+
+
+def _relative(path):
+    """`path` relative to BASE_DIR if it is under it, else absolute."""
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(BASE_DIR).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def _code_digest(code, h):
+    # Not marshal: that includes the file name and line numbers
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            _code_digest(const, h)
+        else:
+            h.update(_describe(const).encode())
+
+
+def _describe(value):
+    """A description of `value` that is the same in every checkout."""
+    if isinstance(value, Path):
+        return _relative(value)
+    if isinstance(value, str):
+        return value.replace(str(BASE_DIR), "<BASE_DIR>")
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_describe(item) for item in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{key!r}: {_describe(value[key])}" for key in sorted(value)) + "}"
+    if isinstance(value, ActionGroup):
+        return _describe(value.specs)
+    if callable(value) and hasattr(value, "__code__"):
+        h = hashlib.sha256()
+        _code_digest(value.__code__, h)
+        closure = [cell.cell_contents for cell in value.__closure__ or []]
+        return f"{value.__module__}.{value.__qualname__}:{h.hexdigest()}:{_describe(closure)}"
+    return repr(value)
+
+
+def _setting(name):
+    try:
+        return str(config(name))
+    except (UndefinedValueError, ValueError):
+        return None
+
+
+def task_key(task, outputs=()):
+    """The cache key of `task` (a doit task dict) and its other `outputs`,
+    from its actions, the contents of its file_dep and SETTINGS_IN_KEY."""
+    checker = ParquetChecker()
+    file_dep = {
+        _relative(dep): checker.file_md5(dep, os.stat(dep)) for dep in task.get("file_dep", [])
+    }
+    payload = {
+        "actions": [_describe(action) for action in task["actions"]],
+        "file_dep": file_dep,
+        "settings": {key: _setting(key) for key in SETTINGS_IN_KEY},
+        "targets": sorted(_relative(target) for target in [*task["targets"], *outputs]),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _entry_path(key):
+    return BUILD_CACHE_DIR / "entries" / key[:2] / f"{key}.json"
+
+
+def _blob_path(digest):
+    return BUILD_CACHE_DIR / "blobs" / digest[:2] / digest
+
+
+def _copy_atomic(source, destination):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def restore(key):
+    """Copy the targets stored under `key` into place. Returns False if
+    there is no (complete) entry for `key`."""
+    try:
+        entry = json.loads(_entry_path(key).read_text())
+    except (FileNotFoundError, ValueError):
+        return False
+    blobs = {target: _blob_path(digest) for target, digest in entry["targets"].items()}
+    if not all(blob.exists() for blob in blobs.values()):
+        return False
+    for target, blob in blobs.items():
+        _copy_atomic(blob, BASE_DIR / target)
+    return True
+
+
+def store(key, targets):
+    """Store `targets` under `key`."""
+    stored = {}
+    for target in targets:
+        h = hashlib.sha256()
+        with open(target, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        if not _blob_path(digest).exists():
+            _copy_atomic(target, _blob_path(digest))
+        stored[_relative(target)] = digest
+    entry_path = _entry_path(key)
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = entry_path.with_name(f".{entry_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps({"created": time.time(), "targets": stored}, indent=1))
+    os.replace(tmp_path, entry_path)
+
+
+class CachedActions(ActionGroup):
+    """The action that `cached` replaces the actions of `task` with."""
+
+    def __init__(self, task, outputs=()):
+        super().__init__(task["actions"])
+        self.file_dep = list(task.get("file_dep", []))
+        self.targets = list(task["targets"])
+        self.outputs = list(outputs)
+        # Described now, so that wrapping the actions later (as the telemetry
+        # reporter does) doesn't change the key
+        self.described = [_describe(action) for action in self.specs]
+
+    def execute(self, out=None, err=None):
+        task = {"actions": self.described, "file_dep": self.file_dep, "targets": self.targets}
+        key = task_key(task, self.outputs)
+        if restore(key):
+            targets = ", ".join(_relative(target) for target in [*self.targets, *self.outputs])
+            print(f"Restored {targets} from the build cache ({key[:12]})", file=sys.stderr)
+            return None
+        failure = self.run_actions(out, err)
+        if failure is not None:
+            return failure
+        store(key, [*self.targets, *self.outputs])
+        return None
+
+
+def cached(task, outputs=()):
+    """Restore the targets of `task` and its other `outputs` from the build
+    cache if its key is there, otherwise run its actions and store them."""
+    if not BUILD_CACHE:
+        return task
+    return {**task, "actions": [CachedActions(task, outputs)]}
@@ -0,0 +1,177 @@
+"""Write Plotly figures to HTML without repeating plotly.js or every point.
+
+`fig.write_html(path)` embeds the whole plotly.js bundle (~3.5MB) in every
+file, and every point of every trace, which for daily series over 10+ years
+is tens of thousands of points per chart. `write_chart(fig, path)` instead
+
+- writes plotly.js once per output directory, as `plotly-<version>.min.js`,
+  and loads it from there (falling back to the Plotly CDN, so a chart
+  copied somewhere else without the file still works),
+- draws long line traces with WebGL (`Scattergl` instead of `Scatter`),
+  which stays responsive with many points, and
+- optionally keeps only `max_points` points per trace, chosen with the
+  Largest-Triangle-Three-Buckets (LTTB) algorithm, which keeps the peaks and
+  troughs that make the shape of the line. Set CHART_MAX_POINTS to apply a
+  budget to every chart; 0 (the default) keeps all points.
+
+Example
+-------
+```
+>>> from chart_export import write_chart
+>>> fig = px.line(df, x="date", y="SOFR")
+>>> write_chart(fig, OUTPUT_DIR / "sofr.html")
+```
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+from settings import config
+
+CHART_MAX_POINTS = config("CHART_MAX_POINTS", default=0, cast=int)
+## Traces with more points than this are drawn with WebGL (plotly.express
+## switches to WebGL at the same size)
+WEBGL_MIN_POINTS = 1000
+
+## Per-point attributes that are sliced along with x and y when downsampling
+_POINT_ATTRIBUTES = ["x", "y", "text", "hovertext", "customdata"]
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the `n_out` points of (x, y) that LTTB keeps.
+
+    `x` must be increasing and `x` and `y` must be finite. The first and last
+    points are always kept; each of the `n_out - 2` buckets in between
+    contributes the point that forms the largest triangle with the point kept
+    in the previous bucket and the average of the next bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket i (of n_out - 2) is [edges[i], edges[i + 1]); the last point is
+    # its own bucket
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    bounds = np.append(edges, n)
+    counts = np.diff(bounds)
+    avg_x = np.add.reduceat(x, bounds[:-1]) / counts
+    avg_y = np.add.reduceat(y, bounds[:-1]) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        xs, ys = x[start:end], y[start:end]
+        area = np.abs((x[a] - avg_x[i + 1]) * (ys - y[a]) - (x[a] - xs) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").astype(np.int64).astype(float)
+    if values.dtype.kind == "O":
+        try:
+            return pd.to_datetime(values).asi8.astype(float)
+        except (TypeError, ValueError):
+            pass
+    return values.astype(float)
+
+
+def downsample_indices(x, y, max_points):
+    """Indices of at most about `max_points` points of a line trace.
+
+    Missing values (NaN) are left out of the LTTB selection, but the first
+    NaN after a stretch of data is kept, so gaps in the line stay gaps.
+    """
+    x, y = _as_float(x), _as_float(y)
+    finite = np.isfinite(x) & np.isfinite(y)
+    finite_idx = np.flatnonzero(finite)
+    kept = finite_idx[lttb_indices(x[finite_idx], y[finite_idx], max_points)]
+    gaps = np.flatnonzero(~finite[1:] & finite[:-1]) + 1
+    return np.union1d(kept, gaps)
+
+
+def _line_trace_length(trace):
+    if trace.type not in ("scatter", "scattergl") or trace.x is None or trace.y is None:
+        return 0
+    return len(trace.y)
+
+
+def prepare_figure(fig, max_points=None, webgl_min_points=WEBGL_MIN_POINTS):
+    """Return a copy of `fig` with long line traces downsampled to
+    `max_points` points (if given) and drawn with WebGL."""
+    traces = []
+    for trace in fig.data:
+        n = _line_trace_length(trace)
+        if not n:
+            traces.append(trace)
+            continue
+        props = trace.to_plotly_json()
+        if max_points and n > max_points:
+            index = downsample_indices(trace.x, trace.y, max_points)
+            for name in _POINT_ATTRIBUTES:
+                values = props.get(name)
+                if values is not None and not isinstance(values, str) and len(values) == n:
+                    props[name] = np.asarray(values)[index]
+            n = len(index)
+        props.pop("type")
+        if n > webgl_min_points:
+            traces.append(go.Scattergl(props, skip_invalid=True))
+        else:
+            traces.append(go.Scatter(props))
+    return go.Figure(data=traces, layout=fig.layout)
+
+
+def plotlyjs_file(output_dir):
+    """Write plotly.js to `output_dir` unless it is already there, and
+    return its file name."""
+    name = f"plotly-{get_plotlyjs_version()}.min.js"
+    path = Path(output_dir) / name
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Charts written in parallel may all find it missing: each writes its
+        # own temporary file, and losing the race to rename it is fine
+        tmp_path = path.with_name(f".{name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp_path.write_text(get_plotlyjs(), encoding="utf-8")
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            if not path.exists():
+                raise
+    return name
+
+
+def write_chart(fig, path, max_points=None, webgl_min_points=WEBGL_MIN_POINTS, **kwargs):
+    """Write `fig` to `path` like `fig.write_html`, but with a shared
+    plotly.js file, WebGL for long traces and optional downsampling.
+
+    `max_points` defaults to CHART_MAX_POINTS; other keyword arguments are
+    passed on to `fig.to_html`.
+    """
+    path = Path(path)
+    if max_points is None:
+        max_points = CHART_MAX_POINTS
+    fig = prepare_figure(fig, max_points, webgl_min_points)
+
+    script = plotlyjs_file(path.parent)
+    cdn = f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+    head = (
+        f'<script src="{script}"></script>\n'
+        f'<script>window.Plotly || document.write(\'<script src="{cdn}"><\\/script>\')</script>\n'
+    )
+    html = fig.to_html(include_plotlyjs=False, full_html=True, **kwargs)
+    path.write_text(html.replace("<head>", "<head>\n" + head, 1), encoding="utf-8")
@@ -0,0 +1,135 @@
+"""Memory-mapped Arrow IPC "hot tier" for parquet files that are read often.
+
+Parquet is compact on disk, but every read pays for decompression and
+decoding. For data that is loaded many times per session (FRED panel, CRSP
+monthly, the public repo panel), this module keeps an uncompressed Arrow IPC
+(Feather v2) sidecar next to the parquet file, e.g. ``fred.parquet`` ->
+``fred.arrow``. The sidecar is memory mapped on load, so reading it neither
+decompresses nor decodes anything, and `read_table` returns a Table backed by
+the mapped file. polars (``polars.from_arrow``) uses those buffers as they
+are. `read_parquet` converts the table to pandas, which copies most columns
+(numeric columns without missing values may stay backed by the file), so
+the hot tier saves the parquet decoding, not the conversion to pandas.
+
+The sidecar records the size and modification time of the parquet file it
+was built from. Whenever the parquet file changes (e.g. after a new pull),
+the sidecar is stale and is rebuilt on the next load.
+
+Run this module on its own to compare cold (parquet) and warm (memory
+mapped) load times for every parquet file in ``DATA_DIR``.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+## Set HOT_TIER=false (in .env or the environment) to read parquet directly
+HOT_TIER = config("HOT_TIER", default="true", cast=str).lower() in {"1", "true", "yes", "on"}
+
+_SIZE_KEY = b"hot_tier_source_size"
+_MTIME_KEY = b"hot_tier_source_mtime_ns"
+
+
+def sidecar_path(parquet_path):
+    """Path of the Arrow IPC sidecar that belongs to `parquet_path`."""
+    return Path(parquet_path).with_suffix(".arrow")
+
+
+def _source_stamp(parquet_path):
+    stat = Path(parquet_path).stat()
+    return {_SIZE_KEY: str(stat.st_size).encode(), _MTIME_KEY: str(stat.st_mtime_ns).encode()}
+
+
+def _is_fresh(table, stamp):
+    metadata = table.schema.metadata or {}
+    return all(metadata.get(key) == value for key, value in stamp.items())
+
+
+def write_sidecar(parquet_path):
+    """(Re)build the sidecar for `parquet_path` and return the table read.
+
+    The sidecar is written uncompressed (so it can be memory mapped) to a
+    temporary file first and then moved into place, so a concurrent reader
+    never sees a half-written file (and parallel doit workers never write
+    to the same temporary file).
+    """
+    parquet_path = Path(parquet_path)
+    stamp = _source_stamp(parquet_path)
+    table = pq.read_table(parquet_path)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **stamp})
+
+    path = sidecar_path(parquet_path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    try:
+        os.replace(tmp_path, path)
+    except PermissionError:
+        # Windows doesn't replace a file that is memory mapped, here by a
+        # table of the old sidecar that is still in use. The next load
+        # rebuilds the sidecar.
+        os.remove(tmp_path)
+    return table
+
+
+def read_table(parquet_path, hot_tier=HOT_TIER):
+    """Read `parquet_path` as a pyarrow Table, through the hot tier if enabled.
+
+    A fresh sidecar is memory mapped, without copying it. A missing or stale
+    sidecar is rebuilt from the parquet file. With ``hot_tier=False`` this is a plain
+    parquet read.
+
+    Use ``polars.from_arrow(read_table(path))`` to get a polars DataFrame.
+    """
+    parquet_path = Path(parquet_path)
+    if not hot_tier:
+        return pq.read_table(parquet_path)
+
+    stamp = _source_stamp(parquet_path)
+    path = sidecar_path(parquet_path)
+    if path.exists():
+        table = feather.read_table(path, memory_map=True)
+        if _is_fresh(table, stamp):
+            return table
+        # Unmap the stale sidecar before it is replaced
+        del table
+    return write_sidecar(parquet_path)
+
+
+def read_parquet(parquet_path, hot_tier=HOT_TIER):
+    """Drop-in replacement for ``pd.read_parquet`` that uses the hot tier.
+
+    The pandas metadata stored by ``DataFrame.to_parquet`` (index, dtypes) is
+    carried over to the sidecar, so the result matches ``pd.read_parquet``.
+    Converting to pandas copies most columns (see the module docstring).
+    """
+    return read_table(parquet_path, hot_tier=hot_tier).to_pandas()
+
+
+def _time(func, n_runs=5):
+    times = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def benchmark(data_dir=DATA_DIR):
+    """Print cold (parquet) vs warm (memory-mapped sidecar) load times."""
+    print(f"{'file':<45} {'parquet (s)':>12} {'hot tier (s)':>13} {'speedup':>9}")
+    for parquet_path in sorted(Path(data_dir).glob("*.parquet")):
+        read_parquet(parquet_path)  # Make sure the sidecar exists
+        cold = _time(lambda: read_parquet(parquet_path, hot_tier=False))
+        warm = _time(lambda: read_parquet(parquet_path, hot_tier=True))
+        print(f"{parquet_path.name:<45} {cold:>12.4f} {warm:>13.4f} {cold / warm:>8.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark()
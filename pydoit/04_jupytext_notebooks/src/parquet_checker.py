@@ -0,0 +1,129 @@
+"""A doit file checker that avoids hashing large parquet files.
+
+doit's default checker stores (mtime, size, md5) for every `file_dep`. The
+md5 is computed whenever a file's mtime changed, which for the parquet files
+in `DATA_DIR` means reading the whole file, once for every task that depends
+on it, after every pull.
+
+`ParquetChecker` stores (mtime, size, footer digest, md5) for parquet files.
+The footer holds the schema plus the offsets, sizes, row counts and min/max
+statistics of every column chunk, so it changes whenever the data does, and
+it is only a few KB at the end of the file. A file is unchanged if its mtime
+is the same, and changed if its size or footer digest differ. Only when those
+disagree (new mtime, but same size and footer, e.g. after `touch` or a pull
+that wrote identical data) is the full md5 computed and compared. Those md5s
+are kept in MD5_CACHE_PATH, keyed by (mtime, size), so that a file whose
+mtime changed but whose content did not is hashed once, not on every `doit`
+run. Other files are checked like doit's default.
+
+Use it with ``DOIT_CONFIG = {"check_file_uptodate": ParquetChecker}``, and run
+this module on its own to compare the two checkers on the files in `DATA_DIR`.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from doit.dependency import MD5Checker, get_file_md5
+
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+MD5_CACHE_PATH = Path(".doit-md5-cache.json")
+
+_MAGIC = b"PAR1"
+
+
+def parquet_footer_digest(path):
+    """md5 of the parquet footer (file metadata) of `path`, or None if `path`
+    is not a parquet file."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < 12:
+            return None
+        f.seek(-8, os.SEEK_END)
+        tail = f.read(8)
+        footer_length = int.from_bytes(tail[:4], "little")
+        if tail[4:] != _MAGIC or footer_length > size - 12:
+            return None
+        f.seek(-8 - footer_length, os.SEEK_END)
+        return hashlib.md5(f.read(footer_length)).hexdigest()
+
+
+class ParquetChecker(MD5Checker):
+    """Check parquet files by (mtime, size, footer digest), other files by md5."""
+
+    def __init__(self, cache_path=MD5_CACHE_PATH):
+        self.cache_path = Path(cache_path)
+        self._md5s = None  # {path: [mtime, size, md5]}, loaded on first use
+
+    def _cached_md5(self, path, file_stat):
+        if self._md5s is None:
+            try:
+                self._md5s = json.loads(self.cache_path.read_text())
+            except (FileNotFoundError, ValueError):
+                self._md5s = {}
+        mtime, size, md5 = self._md5s.get(str(path), (None, None, None))
+        if (mtime, size) == (file_stat.st_mtime, file_stat.st_size):
+            return md5
+        return None
+
+    def file_md5(self, path, file_stat):
+        """md5 of `path`, computed once per (mtime, size) of the file."""
+        md5 = self._cached_md5(path, file_stat)
+        if md5 is None:
+            md5 = get_file_md5(path)
+            self._md5s[str(path)] = [file_stat.st_mtime, file_stat.st_size, md5]
+            tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(self._md5s, indent=1))
+            os.replace(tmp_path, self.cache_path)
+        return md5
+
+    def check_modified(self, file_path, file_stat, state):
+        if len(state) != 4:
+            # Not a parquet state (e.g. saved by doit's default checker)
+            return super().check_modified(file_path, file_stat, state)
+        timestamp, size, footer, md5 = state
+
+        if file_stat.st_mtime == timestamp:
+            return False
+        if file_stat.st_size != size or parquet_footer_digest(file_path) != footer:
+            return True
+        # Same size and footer, new mtime: only the content can tell. Without
+        # a stored md5 to compare to, assume it changed (the md5 computed here
+        # is cached, so get_state stores it for the next time).
+        current_md5 = self.file_md5(file_path, file_stat)
+        return md5 is None or current_md5 != md5
+
+    def get_state(self, dep, current_state):
+        if not str(dep).endswith(".parquet"):
+            return super().get_state(dep, current_state)
+        file_stat = os.stat(dep)
+        if current_state and current_state[0] == file_stat.st_mtime:
+            return None
+        footer = parquet_footer_digest(dep)
+        if footer is None:
+            return super().get_state(dep, current_state)
+        md5 = self._cached_md5(dep, file_stat)
+        return file_stat.st_mtime, file_stat.st_size, footer, md5
+
+
+def benchmark(data_dir=DATA_DIR):
+    """Print the time to record the state of each parquet file in `data_dir`
+    with doit's default checker vs ParquetChecker."""
+    print(f"{'file':<45} {'size (MB)':>10} {'md5 (s)':>9} {'footer (s)':>11}")
+    for path in sorted(Path(data_dir).glob("*.parquet")):
+        timings = []
+        for checker in [MD5Checker(), ParquetChecker()]:
+            start = time.perf_counter()
+            checker.get_state(str(path), None)
+            timings.append(time.perf_counter() - start)
+        size_mb = path.stat().st_size / 1e6
+        print(f"{path.name:<45} {size_mb:>10.1f} {timings[0]:>9.4f} {timings[1]:>11.4f}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -2,17 +2,33 @@
 
 This module fetches a few key economic indicators from FRED and saves them
 to a parquet file for use in analysis notebooks.
+
+`update_fred` pulls incrementally: each series is fetched only from
+FRED_REVISION_DAYS before its last observation in `fred.parquet`, since
+recent observations are often revised, and the fetched rows replace the
+stored ones on the dates they cover. Files are written to a temporary file
+first and then moved into place, so an interrupted pull never leaves a
+partial file.
 """
 
+import os
+from datetime import timedelta
+from io import StringIO
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-import pandas_datareader.data as web
+import requests
 from settings import config
 
+import hot_tier
+
 DATA_DIR = Path(config("DATA_DIR"))
 START_DATE = config("START_DATE")
 END_DATE = config("END_DATE")
+# Days before the last observation of each series that are fetched again
+FRED_REVISION_DAYS = config("FRED_REVISION_DAYS", default=120, cast=int)
+FRED_CSV_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv"
 
 
 # Define the series to pull from FRED
@@ -45,7 +61,133 @@ def pull_fred(start_date=START_DATE, end_date=END_DATE):
     pd.DataFrame
         DataFrame with FRED time series data indexed by date
     """
-    df = web.DataReader(list(series_to_pull.keys()), "fred", start_date, end_date)
+    df = fetch_fred({series_id: start_date for series_id in series_to_pull}, end_date)
+    return df
+
+
+def fetch_series(series_id, start_date, end_date, session):
+    """Fetch one FRED series from the CSV the FRED website serves.
+
+    Parameters
+    ----------
+    series_id : str
+        FRED series code, e.g. "GDP"
+    start_date, end_date : str or datetime
+        First and last date to fetch
+    session : requests.Session
+        Session to fetch with
+
+    Returns
+    -------
+    pd.Series
+        The observations, indexed by date
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    response = session.get(
+        FRED_CSV_URL,
+        params={"id": series_id, "cosd": f"{start_date:%Y-%m-%d}", "coed": f"{end_date:%Y-%m-%d}"},
+        timeout=60,
+    )
+    response.raise_for_status()
+    series = pd.read_csv(
+        StringIO(response.text), index_col=0, parse_dates=True, na_values="."
+    ).iloc[:, 0].astype(float)
+    series.index.name = "DATE"
+    series.name = series_id
+    return series.loc[start_date:end_date]
+
+
+def fetch_fred(start_dates, end_date):
+    """Fetch several FRED series into one DataFrame.
+
+    Parameters
+    ----------
+    start_dates : dict
+        Series code to the first date to fetch it from
+    end_date : str or datetime
+        Last date to fetch
+
+    Returns
+    -------
+    pd.DataFrame
+        One column per series, in the order of `start_dates`
+    """
+    with requests.Session() as session:
+        series = [
+            fetch_series(series_id, start_date, end_date, session)
+            for series_id, start_date in start_dates.items()
+        ]
+    df = pd.concat(series, axis=1, join="outer").sort_index()
+    return df.reindex(columns=list(start_dates))
+
+
+def merge_revisions(stored, fetched, start_dates):
+    """Replace the stored rows of each series from its start date on.
+
+    Last write wins: from its date in `start_dates` on, each series takes the
+    values in `fetched`, including observations that `fetched` no longer
+    has. Series not in `start_dates` are kept as stored.
+    """
+    columns = list(dict.fromkeys([*stored.columns, *fetched.columns]))
+    stored = stored.reindex(columns=columns)
+    index = stored.index.values[:, None]
+    starts = np.array(
+        [np.datetime64(pd.Timestamp(start_dates.get(c, pd.Timestamp.max))) for c in columns]
+    )
+    kept = stored.mask(index >= starts[None, :])
+    merged = fetched.reindex(columns=columns).combine_first(kept)
+    return merged.reindex(columns=columns).dropna(how="all")
+
+
+def _write_atomic(df, path, writer):
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    writer(df, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def update_fred(data_dir=DATA_DIR, end_date=None, revision_days=FRED_REVISION_DAYS):
+    """Update fred.parquet and fred.csv with the observations up to `end_date`.
+
+    Each series is fetched from `revision_days` before its last stored
+    observation, or from START_DATE if it has none (e.g. on the first run).
+
+    Parameters
+    ----------
+    data_dir : Path
+        Directory containing fred.parquet
+    end_date : str or datetime, optional
+        Last date to fetch (default: today)
+    revision_days : int
+        Days before the last observation of each series to fetch again
+
+    Returns
+    -------
+    pd.DataFrame
+        The updated FRED data
+    """
+    data_dir = Path(data_dir)
+    end_date = pd.Timestamp(end_date or pd.Timestamp.today().normalize())
+    path = data_dir / "fred.parquet"
+    if path.exists():
+        stored = pd.read_parquet(path)
+    else:
+        stored = pd.DataFrame(index=pd.DatetimeIndex([], name="DATE"), dtype=float)
+
+    start_dates = {}
+    for series_id in series_to_pull:
+        last = stored[series_id].last_valid_index() if series_id in stored else None
+        if last is None:
+            start_dates[series_id] = pd.Timestamp(START_DATE)
+        else:
+            start_dates[series_id] = max(last - timedelta(days=revision_days), pd.Timestamp(START_DATE))
+
+    fetched = fetch_fred(start_dates, end_date)
+    df = merge_revisions(stored, fetched, start_dates).reindex(columns=list(series_to_pull))
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(df, path, pd.DataFrame.to_parquet)
+    _write_atomic(df, data_dir / "fred.csv", pd.DataFrame.to_csv)
     return df
 
 
@@ -53,7 +195,8 @@ def load_fred(data_dir=DATA_DIR):
     """
     Load previously saved FRED data from parquet file.
 
-    Must first run this module as main to pull and save data.
+    Must first run this module as main to pull and save data. Reads through
+    the memory-mapped Arrow hot tier (see hot_tier.py).
 
     Parameters
     ----------
@@ -66,7 +209,7 @@ def load_fred(data_dir=DATA_DIR):
         DataFrame with FRED time series data
     """
     file_path = Path(data_dir) / "fred.parquet"
-    df = pd.read_parquet(file_path)
+    df = hot_tier.read_parquet(file_path)
     return df
 
 
@@ -79,13 +222,7 @@ def demo():
 
 
 if __name__ == "__main__":
-    today = pd.Timestamp.today().strftime("%Y-%m-%d")
-    end_date = today
-    df = pull_fred(START_DATE, end_date)
-    filedir = Path(DATA_DIR)
-    filedir.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(filedir / "fred.parquet")
-    df.to_csv(filedir / "fred.csv")
-    print(f"Saved FRED data to {filedir}")
+    df = update_fred(DATA_DIR)
+    print(f"Saved FRED data to {DATA_DIR}")
     print(f"Series: {list(series_to_pull.keys())}")
     print(f"Date range: {df.index.min()} to {df.index.max()}")
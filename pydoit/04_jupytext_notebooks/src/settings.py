@@ -42,10 +42,10 @@ and compare to
 """
 
 import sys
+from datetime import date, datetime
 from pathlib import Path
 from platform import system
 
-import pandas as pd
 from decouple import config as _config
 
 
@@ -148,8 +148,23 @@ else:
     defaults["STATA_EXE"] = get_stata_exe()
 
 ## Dates
-defaults["START_DATE"] = pd.to_datetime("1913-01-01")
-defaults["END_DATE"] = pd.to_datetime("2024-12-31")
+def to_datetime(value):
+    """Parse a date such as "2024-01-01" into a `datetime`.
+
+    The standard library is enough for ISO dates, and unlike
+    `pandas.to_datetime` it does not make every `import settings` pay for
+    importing pandas. `pd.Timestamp` subclasses `datetime`, so the result can
+    be used anywhere a timestamp is expected.
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value).strip())
+
+
+defaults["START_DATE"] = to_datetime("1913-01-01")
+defaults["END_DATE"] = to_datetime("2024-12-31")
 
 
 ## File paths
@@ -183,6 +198,12 @@ defaults = {
 }
 
 
+## Values resolved by `config` from the command line, the environment and
+## `defaults`, so that each is only looked up and cast once
+_resolved = {}
+_default_sources = (defaults, cli_vars)
+
+
 def config(
     var_name,
     default=None,
@@ -199,7 +220,24 @@ def config(
     4. Defaults defined in-line in the local file
     5. Error
     """
+    args = (var_name, default, cast, settings_py_defaults, cli_vars, convert_dir_vars_to_abs_path)
+    sources = (settings_py_defaults, cli_vars)
+    if any(given is not used for given, used in zip(sources, _default_sources)):
+        return _resolve(*args)
+    try:
+        cache_key = (var_name, default, cast, convert_dir_vars_to_abs_path)
+        return _resolved[cache_key]
+    except TypeError:
+        # An unhashable default or cast
+        return _resolve(*args)
+    except KeyError:
+        value = _resolved[cache_key] = _resolve(*args)
+        return value
 
+
+def _resolve(
+    var_name, default, cast, settings_py_defaults, cli_vars, convert_dir_vars_to_abs_path
+):
     # 1. Command line arguments (highest priority)
     if var_name in cli_vars and cli_vars[var_name] is not None:
         value = cli_vars[var_name]
@@ -0,0 +1,172 @@
+import importlib
+import re
+import shutil
+import sys
+import tomllib
+from pathlib import Path
+
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+import build_cache
+import chart_export
+import notebook_runner
+import settings
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def checkout(tmp_path, monkeypatch):
+    """An empty project directory with its own build cache directory."""
+    base_dir = tmp_path / "checkout"
+    base_dir.mkdir()
+    monkeypatch.chdir(base_dir)
+    monkeypatch.setattr(build_cache, "BASE_DIR", base_dir)
+    monkeypatch.setattr(build_cache, "BUILD_CACHE", True)
+    monkeypatch.setattr(build_cache, "BUILD_CACHE_DIR", tmp_path / "cache")
+    return base_dir
+
+
+def _chart_task(base_dir):
+    def make_chart():
+        with open(base_dir / "runs.txt", "a") as f:
+            f.write("run\n")
+        data = (base_dir / "data.csv").read_text()
+        (base_dir / "_output").mkdir(exist_ok=True)
+        (base_dir / "_output" / "chart.html").write_text(f"<p>{data}</p>")
+
+    return build_cache.cached({
+        "actions": [make_chart],
+        "file_dep": [base_dir / "data.csv"],
+        "targets": [base_dir / "_output" / "chart.html"],
+    })
+
+
+def test_targets_are_restored_when_inputs_are_unchanged(checkout):
+    (checkout / "data.csv").write_text("1,2,3")
+    task = _chart_task(checkout)
+    chart = checkout / "_output" / "chart.html"
+
+    task["actions"][0].execute()
+    chart.unlink()
+    task["actions"][0].execute()
+
+    assert (checkout / "runs.txt").read_text().count("run") == 1
+    assert chart.read_text() == "<p>1,2,3</p>"
+
+    (checkout / "data.csv").write_text("1,2,4")
+    task["actions"][0].execute()
+    assert (checkout / "runs.txt").read_text().count("run") == 2
+    assert chart.read_text() == "<p>1,2,4</p>"
+
+
+def test_key_is_the_same_in_another_checkout(checkout, tmp_path, monkeypatch):
+    (checkout / "data.csv").write_text("1,2,3")
+    key = build_cache.task_key(_chart_task(checkout))
+
+    other = tmp_path / "other_checkout"
+    other.mkdir()
+    (other / "data.csv").write_text("1,2,3")
+    monkeypatch.chdir(other)
+    monkeypatch.setattr(build_cache, "BASE_DIR", other)
+
+    assert build_cache.task_key(_chart_task(other)) == key
+
+
+def test_key_changes_with_actions_and_settings(checkout, monkeypatch):
+    (checkout / "data.csv").write_text("1,2,3")
+    task = {"actions": ["ipython ./src/example_plot.py"], "file_dep": [], "targets": ["plot.png"]}
+    key = build_cache.task_key(task)
+
+    assert build_cache.task_key({**task, "actions": ["ipython ./src/example_table.py"]}) != key
+
+    settings = {name: build_cache._setting(name) for name in build_cache.SETTINGS_IN_KEY}
+    settings["END_DATE"] = "2025-01-01"
+    monkeypatch.setattr(build_cache, "config", settings.get)
+    assert build_cache.task_key(task) != key
+
+
+def test_failed_task_is_not_stored(checkout):
+    task = build_cache.cached({"actions": ["exit 1"], "targets": [checkout / "out.txt"]})
+
+    assert task["actions"][0].execute() is not None
+    assert not (build_cache.BUILD_CACHE_DIR / "entries").exists()
+
+
+def test_outputs_are_restored_with_the_targets(checkout):
+    plotlyjs = checkout / "_output" / "plotly.min.js"
+
+    def make_chart():
+        with open(checkout / "runs.txt", "a") as f:
+            f.write("run\n")
+        plotlyjs.parent.mkdir(exist_ok=True)
+        plotlyjs.write_text("plotly")
+        (checkout / "_output" / "chart.html").write_text('<script src="plotly.min.js"></script>')
+
+    task = build_cache.cached(
+        {"actions": [make_chart], "targets": [checkout / "_output" / "chart.html"]}, outputs=[plotlyjs]
+    )
+    task["actions"][0].execute()
+    shutil.rmtree(checkout / "_output")
+    task["actions"][0].execute()
+
+    assert (checkout / "runs.txt").read_text().count("run") == 1
+    assert plotlyjs.read_text() == "plotly"
+
+
+@pytest.fixture
+def dodo(tmp_path, monkeypatch):
+    """dodo.py with DATA_DIR, OUTPUT_DIR and the build cache in `tmp_path`."""
+    monkeypatch.setenv("DATA_DIR", str(tmp_path / "_data"))
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "_output"))
+    monkeypatch.setenv("USER", "test")
+    monkeypatch.setattr(settings, "_resolved", {})
+    monkeypatch.setattr(build_cache, "BUILD_CACHE", True)
+    monkeypatch.setattr(build_cache, "BUILD_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.chdir(PROJECT_DIR)
+    monkeypatch.syspath_prepend(str(PROJECT_DIR))
+
+    (tmp_path / "_data").mkdir()
+    pd.DataFrame({"GDP": [1.0, 2.0]}).to_parquet(tmp_path / "_data" / "fred.parquet")
+    sys.modules.pop("dodo", None)
+    yield importlib.import_module("dodo")
+    sys.modules.pop("dodo", None)
+
+
+def test_notebooks_restored_from_the_cache_have_every_file_downstream_tasks_read(dodo, monkeypatch):
+    runs = []
+
+    def run_notebook(notebook_path, output_dir, cell_cache_inputs=None):
+        """Write what running the notebook writes: the runner's `.ipynb` and
+        `.html`, and the notebook's charts."""
+        name = Path(notebook_path).stem
+        runs.append(name)
+        (Path(output_dir) / f"{name}.ipynb").write_text("{}")
+        (Path(output_dir) / f"{name}.html").write_text("<html></html>")
+        for chart in dodo.notebook_tasks[name]["targets"]:
+            chart_export.write_chart(go.Figure(go.Scatter(x=[1, 2], y=[3, 4])), chart)
+
+    monkeypatch.setattr(notebook_runner, "run_notebook", run_notebook)
+    tasks = list(dodo.task_run_notebooks())
+    output_dir = Path(dodo.OUTPUT_DIR)
+    output_dir.mkdir(parents=True)
+
+    for task in tasks:
+        assert task["actions"][0].execute() is None
+    shutil.rmtree(output_dir)
+    for task in tasks:
+        assert task["actions"][0].execute() is None
+    assert sorted(runs) == sorted(dodo.notebook_tasks)
+
+    # The executed notebooks the chartbook docs are built from
+    chartbook = tomllib.loads((PROJECT_DIR / "chartbook.toml").read_text())
+    for notebook in chartbook["notebooks"].values():
+        assert (output_dir / Path(notebook["notebook_path"]).relative_to("_output")).exists()
+
+    # The charts, and the plotly.js they load
+    for name in dodo.notebook_tasks:
+        for chart in dodo.notebook_tasks[name]["targets"]:
+            script = re.search(r'<script src="([^"]+)"', Path(chart).read_text()).group(1)
+            assert (Path(chart).parent / script).exists()
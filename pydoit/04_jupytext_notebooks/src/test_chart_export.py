@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+import chart_export
+
+
+def test_lttb_keeps_the_endpoints_and_extremes():
+    x = np.arange(10)
+    y = np.array([0, 1, 0, 5, 0, 1, 0, -4, 0, 1.0])
+
+    assert chart_export.lttb_indices(x, y, 5).tolist() == [0, 2, 3, 7, 9]
+    assert chart_export.lttb_indices(x, y, 20).tolist() == list(range(10))
+
+
+def test_downsampling_keeps_gaps():
+    y = np.sin(np.linspace(0, 20, 1000))
+    y[400:500] = np.nan
+    dates = pd.date_range("2010-01-01", periods=1000, freq="D").values
+
+    index = chart_export.downsample_indices(dates, y, 100)
+
+    assert len(index) <= 101
+    assert 400 in index  # The line is broken where the data is missing
+    assert not np.isnan(y[np.setdiff1d(index, [400])]).any()
+
+
+def test_write_chart_shares_plotlyjs_and_uses_webgl_for_long_series(tmp_path):
+    df = pd.DataFrame({
+        "date": pd.date_range("2012-01-01", periods=5000, freq="D"),
+        "rate": np.random.default_rng(0).normal(size=5000).cumsum(),
+    })
+    fig = px.line(df, x="date", y="rate", render_mode="svg")
+
+    chart_export.write_chart(fig, tmp_path / "full.html", max_points=0)
+    chart_export.write_chart(fig, tmp_path / "small.html", max_points=500)
+
+    assert len(list(tmp_path.glob("plotly-*.min.js"))) == 1
+    full = (tmp_path / "full.html").read_text()
+    assert '"type":"scattergl"' in full
+    assert len(full) < 1_000_000  # plotly.js is not embedded
+    assert (tmp_path / "small.html").stat().st_size < (tmp_path / "full.html").stat().st_size / 5
+
+
+def test_charts_written_in_parallel_share_one_plotlyjs(tmp_path):
+    with ThreadPoolExecutor(8) as pool:
+        names = list(pool.map(lambda _: chart_export.plotlyjs_file(tmp_path), range(8)))
+
+    assert len(set(names)) == 1
+    assert [path.name for path in tmp_path.iterdir()] == names[:1]
+    assert (tmp_path / names[0]).read_text(encoding="utf-8") == chart_export.get_plotlyjs()
+
+
+def test_losing_the_race_for_plotlyjs_is_not_an_error(tmp_path, monkeypatch):
+    def replace_after_another_writer(source, destination):
+        # As on Windows, where the rename fails if the other writer got there first
+        Path(destination).write_text("plotly")
+        raise PermissionError(destination)
+
+    monkeypatch.setattr(chart_export.os, "replace", replace_after_another_writer)
+    name = chart_export.plotlyjs_file(tmp_path)
+
+    assert [path.name for path in tmp_path.iterdir()] == [name]
@@ -0,0 +1,69 @@
+import os
+
+import pandas as pd
+
+import hot_tier
+
+
+def _write_parquet(path, values):
+    df = pd.DataFrame(
+        {"rate": values},
+        index=pd.date_range("2024-01-01", periods=len(values), name="DATE"),
+    )
+    df.to_parquet(path)
+    return pd.read_parquet(path)
+
+
+def test_read_parquet_matches_pandas(tmp_path):
+    path = tmp_path / "fred.parquet"
+    expected = _write_parquet(path, [1.0, 2.0, 3.0])
+
+    result = hot_tier.read_parquet(path, hot_tier=True)
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert hot_tier.sidecar_path(path).exists()
+
+
+def test_sidecar_is_rebuilt_when_parquet_changes(tmp_path):
+    path = tmp_path / "fred.parquet"
+    _write_parquet(path, [1.0, 2.0, 3.0])
+    hot_tier.read_parquet(path, hot_tier=True)
+
+    expected = _write_parquet(path, [4.0, 5.0, 6.0, 7.0])
+    # Make sure the new file does not share the old mtime on coarse clocks
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    result = hot_tier.read_parquet(path, hot_tier=True)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_hot_tier_disabled_does_not_write_sidecar(tmp_path):
+    path = tmp_path / "fred.parquet"
+    expected = _write_parquet(path, [1.0, 2.0])
+
+    result = hot_tier.read_parquet(path, hot_tier=False)
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert not hot_tier.sidecar_path(path).exists()
+
+
+def test_sidecar_that_cannot_be_replaced_is_rebuilt_later(tmp_path, monkeypatch):
+    path = tmp_path / "fred.parquet"
+    _write_parquet(path, [1.0, 2.0, 3.0])
+    hot_tier.read_parquet(path, hot_tier=True)
+    expected = _write_parquet(path, [4.0, 5.0])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def replace_mapped_file(source, destination):
+        raise PermissionError("The process cannot access the file")
+
+    with monkeypatch.context() as m:
+        # As on Windows, while the old sidecar is still mapped
+        m.setattr(hot_tier.os, "replace", replace_mapped_file)
+        pd.testing.assert_frame_equal(hot_tier.read_parquet(path, hot_tier=True), expected)
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == ".tmp"] == []
+
+    pd.testing.assert_frame_equal(hot_tier.read_parquet(path, hot_tier=True), expected)
+    assert hot_tier._is_fresh(hot_tier.feather.read_table(hot_tier.sidecar_path(path)), hot_tier._source_stamp(path))
@@ -0,0 +1,107 @@
+import os
+
+import pandas as pd
+import pytest
+
+import parquet_checker
+from parquet_checker import ParquetChecker
+
+
+def _write_parquet(path, values):
+    pd.DataFrame({"rate": values}).to_parquet(path)
+
+
+def _bump_mtime(path):
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def checker(tmp_path):
+    return ParquetChecker(cache_path=tmp_path / "md5_cache.json")
+
+
+@pytest.fixture
+def no_full_hash(monkeypatch):
+    def fail(path):
+        raise AssertionError(f"full hash of {path}")
+
+    monkeypatch.setattr(parquet_checker, "get_file_md5", fail)
+
+
+def test_state_of_parquet_file_does_not_hash_the_file(tmp_path, checker, no_full_hash):
+    path = tmp_path / "fred.parquet"
+    _write_parquet(path, [1.0, 2.0, 3.0])
+
+    state = checker.get_state(str(path), None)
+
+    assert state[1] == path.stat().st_size
+    assert state[2] == parquet_checker.parquet_footer_digest(path)
+
+
+def test_changed_data_is_detected_from_the_footer(tmp_path, checker, no_full_hash):
+    path = tmp_path / "fred.parquet"
+    _write_parquet(path, [1.0, 2.0, 3.0])
+    state = checker.get_state(str(path), None)
+
+    _write_parquet(path, [1.0, 2.0, 4.0])
+    _bump_mtime(path)
+
+    assert checker.check_modified(str(path), os.stat(path), state)
+
+
+def test_unchanged_file_is_not_modified(tmp_path, checker, no_full_hash):
+    path = tmp_path / "fred.parquet"
+    _write_parquet(path, [1.0, 2.0, 3.0])
+    state = checker.get_state(str(path), None)
+
+    assert not checker.check_modified(str(path), os.stat(path), state)
+
+
+def test_touched_file_falls_back_to_full_hash(tmp_path, checker):
+    path = tmp_path / "fred.parquet"
+    _write_parquet(path, [1.0, 2.0, 3.0])
+    state = checker.get_state(str(path), None)
+
+    # No md5 stored yet, so a new mtime with the same footer counts as modified
+    _bump_mtime(path)
+    assert checker.check_modified(str(path), os.stat(path), state)
+
+    # The md5 computed by that check is kept in the new state ...
+    state = checker.get_state(str(path), state)
+    assert state[3] is not None
+
+    # ... so the next touch is recognized as the same content
+    _bump_mtime(path)
+    assert not checker.check_modified(str(path), os.stat(path), state)
+
+
+def test_md5_of_touched_file_is_computed_once_across_runs(tmp_path, monkeypatch):
+    path = tmp_path / "fred.parquet"
+    _write_parquet(path, [1.0, 2.0, 3.0])
+    cache_path = tmp_path / "md5_cache.json"
+    checker = ParquetChecker(cache_path=cache_path)
+    state = checker.get_state(str(path), None)
+    _bump_mtime(path)
+    checker.check_modified(str(path), os.stat(path), state)
+    state = checker.get_state(str(path), state)
+    _bump_mtime(path)
+
+    calls = []
+    monkeypatch.setattr(parquet_checker, "get_file_md5", lambda p: calls.append(p) or state[3])
+    # The task stays up to date, so doit never saves a new state; each run
+    # (a new checker) checks against the same old state
+    for _ in range(3):
+        assert not ParquetChecker(cache_path=cache_path).check_modified(str(path), os.stat(path), state)
+    assert len(calls) == 1
+
+
+def test_other_files_are_checked_by_md5(tmp_path, checker):
+    path = tmp_path / "pull_fred.py"
+    path.write_text("print('hello')\n")
+    state = checker.get_state(str(path), None)
+    assert len(state) == 3
+
+    path.write_text("print('world')\n")
+    _bump_mtime(path)
+    assert checker.check_modified(str(path), os.stat(path), state)
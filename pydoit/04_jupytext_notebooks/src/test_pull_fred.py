@@ -34,3 +34,35 @@ def test_pull_fred_data_validity():
         * df.loc["1913-01-01":"2023-09-01", "GDPC1"].dropna().pct_change().mean()
     )
     assert abs(ave_annualized_growth - 3.08) < 0.1
+
+
+def test_update_fred_merges_the_revision_window(tmp_path, monkeypatch):
+    dates = pd.date_range("2000-01-01", "2024-06-01", freq="MS", name="DATE")
+    upstream = pd.DataFrame(
+        {series_id: range(i, i + len(dates)) for i, series_id in enumerate(pull_fred.series_to_pull)},
+        index=dates,
+        dtype=float,
+    )
+    upstream.loc[~upstream.index.is_quarter_start, "GDP"] = float("nan")
+    fetched = {}
+
+    def fetch_series(series_id, start_date, end_date, session):
+        fetched[series_id] = pd.Timestamp(start_date)
+        return upstream.loc[start_date:end_date, series_id]
+
+    monkeypatch.setattr(pull_fred, "fetch_series", fetch_series)
+    pull_fred.update_fred(tmp_path, end_date="2024-03-01")
+
+    # A revision inside the window, one before it, and three new months
+    upstream.loc["2024-01-01", "UNRATE"] = -1.0
+    upstream.loc["2020-01-01", "UNRATE"] = -2.0
+    df = pull_fred.update_fred(tmp_path, end_date="2024-06-01", revision_days=90)
+
+    assert fetched["UNRATE"] == pd.Timestamp("2024-03-01") - pd.Timedelta(days=90)
+    assert fetched["GDP"] == pd.Timestamp("2024-01-01") - pd.Timedelta(days=90)
+    assert df.loc["2024-01-01", "UNRATE"] == -1.0
+    assert df.loc["2020-01-01", "UNRATE"] != -2.0
+    expected = upstream.copy()
+    expected.loc["2020-01-01", "UNRATE"] = df.loc["2020-01-01", "UNRATE"]
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "fred.parquet"), df, check_freq=False)
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+from doit.exceptions import TaskError, TaskFailed
+
+from task_actions import ActionGroup, ResourceActions
+
+SRC_DIR = Path(__file__).resolve().parent
+
+
+def _append(path, line):
+    with open(path, "a") as f:
+        f.write(f"{line}\n")
+
+
+def _fail():
+    return TaskFailed("no data")
+
+
+def _raise():
+    raise ValueError("bad data")
+
+
+def test_group_stops_at_the_first_failure_like_a_task(tmp_path):
+    log = tmp_path / "log.txt"
+    for failing, failure in [(_fail, TaskFailed), (lambda: False, TaskFailed), (_raise, TaskError),
+                             ("exit 3", TaskFailed)]:
+        log.unlink(missing_ok=True)
+        group = ResourceActions(
+            [(_append, [log, "first"]), failing, (_append, [log, "after"])],
+            {"network": 1},
+            tmp_path / "locks",
+        )
+        assert isinstance(group.execute(), failure)
+        assert log.read_text() == "first\n"
+
+
+def test_group_keeps_output_and_values_of_its_actions(tmp_path):
+    group = ActionGroup([f"{sys.executable} -c \"print('pulled')\"", lambda: {"rows": 3}])
+    assert group.execute() is None
+    assert group.out == "pulled\n"
+    assert group.values == {"rows": 3}
+
+
+def test_tasks_run_in_spawned_worker_processes(tmp_path):
+    """`doit -P process` pickles the tasks when workers are spawned rather
+    than forked (macOS and Windows)."""
+    (tmp_path / "dodo.py").write_text(textwrap.dedent(f"""
+        import sys
+        from pathlib import Path
+
+        sys.path.insert(1, {str(SRC_DIR)!r})
+
+        from build_cache import cached
+        from task_actions import ResourceActions
+        from task_telemetry import TelemetryReporter
+
+        DOIT_CONFIG = {{"reporter": TelemetryReporter, "num_process": 2, "par_type": "process"}}
+
+
+        def write(path, text):
+            Path(path).write_text(text)
+
+
+        def task_write():
+            for name in ["a", "b"]:
+                yield cached({{
+                    "name": name,
+                    "actions": [ResourceActions(
+                        [(write, [f"{{name}}.txt", name]), f"echo {{name}} > {{name}}.log"],
+                        {{"cpu-heavy": 1}},
+                        "locks",
+                    )],
+                    "targets": [Path(f"{{name}}.txt").resolve(), Path(f"{{name}}.log").resolve()],
+                }})
+    """))
+    run = textwrap.dedent("""
+        import multiprocessing, sys
+        from doit.cmd_base import DodoTaskLoader
+        from doit.doit_cmd import DoitMain
+
+        if __name__ == "__main__":
+            multiprocessing.set_start_method("spawn")
+            sys.exit(DoitMain(DodoTaskLoader()).run([]))
+    """)
+    (tmp_path / "run.py").write_text(run)
+    env = {**os.environ, "BUILD_CACHE": "true", "BUILD_CACHE_DIR": str(tmp_path / "cache")}
+    completed = subprocess.run(
+        [sys.executable, "run.py"], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=300
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert (tmp_path / "a.txt").read_text() == "a"
+    assert (tmp_path / "b.log").read_text() == "b\n"
+    con = sqlite3.connect(tmp_path / ".doit-telemetry.sqlite")
+    assert con.execute("SELECT task, position, exit_status FROM actions ORDER BY task, position").fetchall() == [
+        ("write:a", 0, 0),
+        ("write:a", 1, 0),
+        ("write:b", 0, 0),
+        ("write:b", 1, 0),
+    ]
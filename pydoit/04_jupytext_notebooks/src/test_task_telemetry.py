@@ -0,0 +1,122 @@
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from doit.cmd_base import ModuleTaskLoader
+from doit.doit_cmd import DoitMain
+
+import task_telemetry
+from task_actions import ResourceActions
+
+
+def _run_measured(command):
+    records = []
+    action = task_telemetry.MeasuredAction(command, lambda *row: records.append(row))
+    action.execute()
+    return records[0]
+
+
+def test_measured_action_records_child_memory_and_exit_status():
+    allocate = f"{sys.executable} -c \"x = bytearray(100_000_000); import time; time.sleep(0.5)\""
+    started, wall, cpu, child_cpu, peak_child_rss, result = _run_measured(allocate)
+    assert wall >= 0.5
+    assert peak_child_rss >= 100_000_000
+    assert task_telemetry.exit_status(result) == 0
+
+    *_, result = _run_measured("exit 3")
+    assert task_telemetry.exit_status(result) == 3
+
+
+@pytest.mark.skipif(not task_telemetry._HAS_PROC, reason="needs /proc")
+def test_shared_child_is_charged_only_for_what_it_adds(monkeypatch):
+    idle_kernel = subprocess.Popen(
+        [sys.executable, "-c", "x = bytearray(100_000_000); import time; time.sleep(30)"]
+    )
+    try:
+        time.sleep(1)
+        *_, peak_child_rss, _ = _run_measured("exit 0")
+        assert peak_child_rss >= 100_000_000
+
+        monkeypatch.setattr(task_telemetry, "_SHARED_PIDS", set())
+        task_telemetry.share_process(idle_kernel.pid)
+        *_, peak_child_rss, _ = _run_measured("exit 0")
+        assert peak_child_rss < 50_000_000
+    finally:
+        idle_kernel.kill()
+        idle_kernel.wait()
+
+
+def test_critical_path_follows_the_longest_chain():
+    walls = {"pull": 5.0, "small": 1.0, "notebook": 3.0, "docs": 0.0, "other": 7.0}
+    deps = {"notebook": ["pull", "small"], "docs": ["notebook"], "other": []}
+
+    total, path = task_telemetry.critical_path(walls, deps)
+
+    assert total == 8.0
+    assert path == ["pull", "notebook"]
+
+
+def test_reporter_records_every_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = tmp_path / "telemetry.sqlite"
+
+    class Reporter(task_telemetry.TelemetryReporter):
+        pass
+
+    Reporter.db_path = db_path
+
+    def task_pull():
+        return {"actions": ["echo data > data.txt"], "targets": ["data.txt"], "uptodate": [True]}
+
+    def task_chart():
+        return {"actions": ["exit 2"], "file_dep": ["data.txt"]}
+
+    def task_notebook():
+        return {
+            "actions": [ResourceActions(["echo run", "exit 4", "echo unreachable"], {"cpu-heavy": 1}, "locks")],
+            "file_dep": ["data.txt"],
+        }
+
+    tasks = {
+        "task_pull": task_pull,
+        "task_chart": task_chart,
+        "task_notebook": task_notebook,
+        "DOIT_CONFIG": {"reporter": Reporter, "dep_file": str(tmp_path / ".doit.db"), "continue": True},
+    }
+    for _ in range(2):
+        DoitMain(ModuleTaskLoader(tasks)).run([])
+
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT COUNT(*) FROM runs WHERE finished IS NOT NULL").fetchone() == (2,)
+    statuses = con.execute("SELECT run_id, task, status, deps FROM tasks ORDER BY run_id, task").fetchall()
+    assert statuses == [
+        (1, "chart", "failed", '["pull"]'),
+        (1, "notebook", "failed", '["pull"]'),
+        (1, "pull", "run", "[]"),
+        (2, "chart", "failed", '["pull"]'),
+        (2, "notebook", "failed", '["pull"]'),
+        (2, "pull", "up-to-date", "[]"),
+    ]
+    exit_statuses = con.execute(
+        "SELECT run_id, task, position, action, exit_status FROM actions ORDER BY run_id, task, position"
+    ).fetchall()
+    assert exit_statuses == [
+        (1, "chart", 0, "Cmd: exit 2", 2),
+        (1, "notebook", 0, "Cmd: echo run", 0),
+        (1, "notebook", 1, "Cmd: exit 4", 4),
+        (1, "pull", 0, "Cmd: echo data > data.txt", 0),
+        (2, "chart", 0, "Cmd: exit 2", 2),
+        (2, "notebook", 0, "Cmd: echo run", 0),
+        (2, "notebook", 1, "Cmd: exit 4", 4),
+    ]
+
+
+def test_peak_rss_is_not_recorded_without_proc_or_getrusage(monkeypatch):
+    monkeypatch.setattr(task_telemetry, "_HAS_PROC", False)
+    monkeypatch.setattr(task_telemetry, "resource", None)
+    *_, peak_child_rss, result = _run_measured("exit 0")
+    assert peak_child_rss is None
+    assert task_telemetry.exit_status(result) == 0
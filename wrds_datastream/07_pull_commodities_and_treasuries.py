@@ -160,6 +160,8 @@ for name, code in COMMODITY_CODES.items():
 
 if commodity_frames:
     commodities_df = pd.concat(commodity_frames, ignore_index=True)
+    # Low-cardinality label: store as a category with a fixed dictionary
+    commodities_df["product"] = commodities_df["product"].astype(pd.CategoricalDtype(list(COMMODITY_CODES)))
     print(f"\n  Total commodity records: {len(commodities_df):,}")
     print(f"  Unique products with data: {commodities_df['product'].nunique()}")
 else:
@@ -187,6 +189,8 @@ for name, code in TREASURY_CODES.items():
 
 if treasury_frames:
     treasuries_df = pd.concat(treasury_frames, ignore_index=True)
+    # Low-cardinality label: store as a category with a fixed dictionary
+    treasuries_df["product"] = treasuries_df["product"].astype(pd.CategoricalDtype(list(TREASURY_CODES)))
     print(f"\n  Total treasury records: {len(treasuries_df):,}")
     print(f"  Unique products with data: {treasuries_df['product'].nunique()}")
 else: